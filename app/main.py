@@ -1,8 +1,23 @@
+import time
+importStarted = time.time()
+
+import asyncio
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from app.routers.crnnRouter import crnnRouter
 from app.routers.tesseractRouter import tesseractRouter
+from app.routers.jobsRouter import jobsRouter, job_manager
+from app.services import engines
+from app.services.inferenceExecutor import run_blocking
+from app.services.replicaPool import apply_thread_budget
+from app.services.resultCache import result_cache
+from app.utils.processMemory import memory_usage
+from starlette.responses import JSONResponse
+from config import config
+
+engines.timings['import'] = time.time() - importStarted
 
 # Initialize FastAPI application
 app = FastAPI()
@@ -16,6 +31,38 @@ app.add_middleware(
     allow_headers=["*"],  # Allow specific headers if needed
 )
 
+# Compress large responses (chunk lists) for clients sending Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=config.RESPONSE_COMPRESSION_MIN_SIZE)
+
+@app.on_event("startup")
+async def configure_threads():
+    """
+    Apply the OpenCV thread budget of this worker and warn about oversubscribed cores.
+    """
+    apply_thread_budget()
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    """
+    Start the bulk OCR job workers; pending jobs from a previous run are resumed.
+    """
+    job_manager.start()
+
+
+@app.on_event("startup")
+async def preload_engines():
+    """
+    Load and warm up the configured engines in the background, /readyz reports when they are done.
+    """
+    asyncio.ensure_future(run_blocking(engines.preload))
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    job_manager.stop()
+
+
 @app.get("/")
 async def root():
     """
@@ -24,6 +71,28 @@ async def root():
     return {"message": "CRNN API is running"}
 
 
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness probe: the API process is up and its event loop responsive.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness probe: every preloaded engine is loaded and warmed up.
+    Also reports the startup time of every phase (import, graph build, restore, warm-up)
+    and the memory (RSS and PSS) of the worker answering the probe.
+    """
+    ready, engine_states = engines.readiness()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "engines": engine_states, "timings": engines.timings, "memory": memory_usage()},
+    )
+
+
 @app.get("/hello/{name}")
 async def say_hello(name: str):
     """
@@ -32,9 +101,18 @@ async def say_hello(name: str):
     return {"message": f"Hello {name}"}
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit, miss and eviction counters of the result cache.
+    """
+    return result_cache.stats()
+
+
 # Include the router in the main application
 app.include_router(crnnRouter, prefix="/api/v1/crnn")
 app.include_router(tesseractRouter, prefix="/api/v1/tesseract")
+app.include_router(jobsRouter, prefix="/api/v1/jobs")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,62 @@
+from __future__ import division
+from __future__ import print_function
+
+import mmap
+import os
+import re
+from config import config
+
+# model files mapped by this process (usually the pre-fork master before forking the workers), by path;
+# TF copies the weights it reads from them into private memory, so the mappings save reads, not memory
+mappedArtifacts = {}
+
+
+def latestCheckpointPaths(paraModelDir=config.MODEL_PATH):
+    "data and index files of the latest checkpoint, read from the checkpoint state file without importing TF"
+    fnState = os.path.join(paraModelDir, 'checkpoint')
+    if not os.path.isfile(fnState):
+        return []
+    match = re.search(r'^model_checkpoint_path:\s*"(.*)"', open(fnState).read(), re.MULTILINE)
+    if match is None:
+        return []
+    prefix = os.path.join(paraModelDir, match.group(1))
+    directory = os.path.dirname(prefix)
+    return sorted(os.path.join(directory, fn) for fn in os.listdir(directory)
+                  if fn.startswith(os.path.basename(prefix) + '.') and not fn.endswith('.meta'))
+
+
+def artifactPaths(paraBackend=config.INFERENCE_BACKEND):
+    "files the inference model of a backend is loaded from"
+    if paraBackend == 'tflite':
+        return [config.fnTFLiteModel.format(width) for width in config.TFLITE_WIDTHS]
+    if paraBackend == 'frozen':
+        return [config.fnFrozenGraph]
+    if paraBackend == 'remote':
+        # the inference servers load the model
+        return []
+    return latestCheckpointPaths()
+
+
+def mapArtifacts(paraPaths):
+    "map the files read-only and fault their pages in, this warms the page cache (the loaded weights are not shared)"
+    mappedBytes = 0
+    for path in paraPaths:
+        if path in mappedArtifacts or not os.path.isfile(path) or os.path.getsize(path) == 0:
+            continue
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for offset in range(0, len(mapping), mmap.PAGESIZE):
+            mapping[offset]
+        mappedArtifacts[path] = mapping
+        mappedBytes += len(mapping)
+    return mappedBytes
+
+
+def readArtifact(paraPath):
+    "contents of a model file, a view of the pages mapped by the master (no copy) if there are any"
+    mapping = mappedArtifacts.get(paraPath)
+    if mapping is None:
+        with open(paraPath, 'rb') as f:
+            return f.read()
+    # bytes-like: ParseFromString reads the mapping directly, the parsed message still owns its own copy
+    return memoryview(mapping)
@@ -0,0 +1,191 @@
+from __future__ import division
+from __future__ import print_function
+
+import re
+import time
+import numpy as np
+from config import config
+
+
+def charCodeTable(paraCharList):
+    "lookup table from label id to unicode code point, the blank label (last id) maps to 0"
+    return np.array([ord(c) for c in paraCharList] + [0], dtype='<u4')
+
+
+def labelsToText(paraLabels, paraCharCodes):
+    "map a sequence of label ids to its string through the code point table"
+    return paraCharCodes[paraLabels].tobytes().decode('utf-32-le')
+
+
+def reverseWordOrder(paraText, paraCharProbs=None):
+    "reverse the order of the words of a text (and of their character probabilities), keeping every word as it is"
+    # spans of the words, the separators between two words move along with them
+    spans = [match.span() for match in re.finditer(r'\S+', paraText)]
+    indices = []
+    for k in reversed(range(len(spans))):
+        indices += list(range(*spans[k]))
+        if k > 0:
+            indices += list(range(spans[k - 1][1], spans[k][0]))
+
+    text = str().join(paraText[i] for i in indices)
+    charProbs = paraCharProbs[np.array(indices, dtype=np.int64)] if paraCharProbs is not None else None
+    return (text, charProbs)
+
+
+def bestPathDecode(paraLogits, paraCharCodes):
+    "vectorized best path decoding of a (T, B, C) batch of logits: argmax, collapse repeats, remove blanks"
+    blank = len(paraCharCodes) - 1
+    labels = np.argmax(paraLogits, axis=2).T  # BxT
+
+    # a frame emits its label if it is not blank and differs from the previous frame
+    emit = labels != blank
+    emit[:, 1:] &= labels[:, 1:] != labels[:, :-1]
+
+    # decode the emitted labels of the whole batch at once (row major, i.e. element by element),
+    # every code point becomes exactly one character so the texts are slices of the result
+    allText = labelsToText(labels[emit], paraCharCodes)
+    counts = np.count_nonzero(emit, axis=1)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    return [allText[start:end] for (start, end) in zip(starts, ends)]
+
+
+def logSoftmax(paraLogits):
+    "numerically stable log softmax over the last (character) axis"
+    maxLogits = np.max(paraLogits, axis=-1, keepdims=True)
+    logSumExp = maxLogits + \
+        np.log(np.sum(np.exp(paraLogits - maxLogits), axis=-1, keepdims=True))
+    return paraLogits - logSumExp
+
+
+def bestPathConfidence(paraLogits, paraBlank):
+    "best path labels, best path probability and per character probabilities of a (T, B, C) batch of logits"
+    logProbs = logSoftmax(paraLogits)
+    labels = np.argmax(logProbs, axis=2)  # TxB
+    labelLogProbs = np.max(logProbs, axis=2)  # TxB
+
+    # probability of the best path: product of the per frame maxima, summed as logs to avoid underflow
+    pathProbs = np.exp(np.sum(labelLogProbs, axis=0))
+
+    # runs of equal labels, batch major so that a run never spans two batch elements
+    (maxT, maxB) = labels.shape
+    labels = labels.T.ravel()
+    labelProbs = np.exp(labelLogProbs.T.ravel())
+    runStarts = np.ones(len(labels), dtype=bool)
+    runStarts[1:] = labels[1:] != labels[:-1]
+    runStarts[::maxT] = True
+    starts = np.flatnonzero(runStarts)
+
+    # a run emits one character (unless it is blank), its probability is the best frame of the run
+    runLabels = labels[starts]
+    runProbs = np.maximum.reduceat(labelProbs, starts)
+    keep = runLabels != paraBlank
+    counts = np.bincount(starts[keep] // maxT, minlength=maxB)
+    splits = np.cumsum(counts)[:-1]
+
+    return (pathProbs, np.split(runLabels[keep], splits), np.split(runProbs[keep], splits))
+
+
+def prefixBeamSearchSingle(paraProbs, paraBeamWidth, paraPruneProbability):
+    "CTC prefix beam search over the (T, C) probabilities of a single batch element, returns the best labeling"
+    blank = paraProbs.shape[1] - 1
+
+    # beams: prefixes with the probabilities of ending in blank / non-blank, and their last label (-1 if empty)
+    prefixes = [()]
+    prBlank = np.ones(1)
+    prNonBlank = np.zeros(1)
+    last = np.full(1, -1)
+    for frame in paraProbs:
+        prTotal = prBlank + prNonBlank
+
+        # same prefix: a blank follows or the last label is repeated
+        stayBlank = prTotal * frame[blank]
+        stayNonBlank = np.where(last >= 0, prNonBlank * frame[last], 0.0)
+
+        # extensions of every beam by every likely character (BxM), a repeated character needs a blank in between
+        chars = np.flatnonzero(frame[:blank] >= paraPruneProbability)
+        extend = np.where(chars[None, :] == last[:, None], prBlank[:, None], prTotal[:, None]) * frame[chars][None, :]
+
+        # only the best extensions can make it into the next beams
+        extend = extend.ravel()
+        top = np.argpartition(extend, -paraBeamWidth)[-paraBeamWidth:] if len(extend) > paraBeamWidth \
+            else np.arange(len(extend))
+
+        beams = {prefix: [b, nb] for (prefix, b, nb) in zip(prefixes, stayBlank.tolist(), stayNonBlank.tolist())}
+        for k in top.tolist():
+            (i, j) = divmod(k, len(chars))
+            beam = beams.setdefault(prefixes[i] + (int(chars[j]),), [0.0, 0.0])
+            beam[1] += float(extend[k])
+
+        ranked = sorted(beams.items(), key=lambda beam: beam[1][0] + beam[1][1], reverse=True)[:paraBeamWidth]
+        prefixes = [prefix for (prefix, _) in ranked]
+        prBlank = np.array([b for (_, (b, _)) in ranked])
+        prNonBlank = np.array([nb for (_, (_, nb)) in ranked])
+        last = np.array([prefix[-1] if prefix else -1 for prefix in prefixes])
+
+    return prefixes[0]
+
+
+def prefixBeamSearch(paraLogits, paraCharCodes, paraBeamWidth=config.BEAM_WIDTH,
+                     paraPruneProbability=config.BEAM_PRUNE_PROBABILITY):
+    "CTC prefix beam search over a (T, B, C) batch of logits, characters below paraPruneProbability are never tried"
+    probs = np.exp(logSoftmax(paraLogits.astype(np.float64)))
+    texts = []
+    for b in range(probs.shape[1]):
+        labels = prefixBeamSearchSingle(probs[:, b, :], paraBeamWidth, paraPruneProbability)
+        texts.append(labelsToText(np.array(labels, dtype=np.int64), paraCharCodes))
+    return texts
+
+
+def randomLogits(paraBatchSize, paraNumChars, paraSeed=0):
+    "peaked random (T, B, C) logits, roughly shaped like the output of a trained NN"
+    randomState = np.random.RandomState(paraSeed)
+    return (randomState.randn(config.MAX_TEXT_LENGTH, paraBatchSize, paraNumChars) * 5).astype(np.float32)
+
+
+def tfGreedyDecoder(paraCharList):
+    "build tf.nn.ctc_greedy_decoder once, returns a function decoding logits like Model.decoderOutputToText"
+    import tensorflow as tf
+    from types import SimpleNamespace
+    from app.models.crnn_ctc_model.Model import Model
+
+    graph = tf.Graph()
+    with graph.as_default():
+        logits = tf.placeholder(tf.float32, [None, None, len(paraCharList) + 1])
+        seqLen = tf.placeholder(tf.int32, [None])
+        decoder = tf.nn.ctc_greedy_decoder(inputs=logits, sequence_length=seqLen)
+    sess = tf.Session(graph=graph)
+    model = SimpleNamespace(decoderType=config.DecoderType.BestPath, charList=paraCharList)
+
+    def decode(paraLogits):
+        (maxT, batchSize) = paraLogits.shape[:2]
+        decoded = sess.run(decoder, {logits: paraLogits, seqLen: [maxT] * batchSize})
+        return Model.decoderOutputToText(model, decoded, batchSize)
+
+    return decode
+
+
+def benchmarkDecoders(paraCharList, paraBatchSizes=(1, 32, 256), paraRepeats=20):
+    "words/sec of the TF greedy decoder (including the sparse tensor walk) and of the NumPy best path decoder"
+    charCodes = charCodeTable(paraCharList)
+    tfDecode = tfGreedyDecoder(paraCharList)
+    for batchSize in paraBatchSizes:
+        logits = randomLogits(batchSize, len(paraCharList) + 1)
+
+        timeSnapshot = time.time()
+        for _ in range(paraRepeats):
+            bestPathDecode(logits, charCodes)
+        numpyTime = (time.time() - timeSnapshot) / paraRepeats
+
+        timeSnapshot = time.time()
+        for _ in range(paraRepeats):
+            tfDecode(logits)
+        tfTime = (time.time() - timeSnapshot) / paraRepeats
+
+        print('Batch size', batchSize, '- TF greedy:', batchSize / tfTime,
+              'words/sec, NumPy best path:', batchSize / numpyTime, 'words/sec')
+
+
+if __name__ == '__main__':
+    # parity with tf.nn.ctc_greedy_decoder is checked in tests/test_ctc_decoder.py
+    benchmarkDecoders(open(config.fnCharList, encoding="utf-8").read())
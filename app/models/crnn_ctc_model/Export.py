@@ -0,0 +1,176 @@
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+from types import SimpleNamespace
+import cv2
+import numpy as np
+import tensorflow as tf
+from app.utils.data_generator_binary import Batch
+from app.models.crnn_ctc_model.FoldedCNN import PROJECTION_KERNEL, foldedCNNLayers
+from app.models.crnn_ctc_model.FrozenModel import FrozenModel
+from app.models.crnn_ctc_model.Model import Model
+from app.utils.sample_preprocessing import preprocess
+from config import config
+
+
+def readWeights(paraModel):
+    "read the values of all variables of a restored model"
+    variables = tf.global_variables()
+    values = paraModel.sess.run(variables)
+    return {variable.name: value for (variable, value) in zip(variables, values)}
+
+
+def buildInferenceSession(paraWeights, paraCharList, paraUnrolledWidth=None):
+    "build the inference graph (folded CNN + RNN) in a new session holding the given weights"
+    graph = tf.Graph()
+    with graph.as_default():
+        inputImgs = tf.placeholder(tf.float32, shape=(
+            None, paraUnrolledWidth, config.IMAGE_HEIGHT), name='inputImgs')
+
+        # conv + bias + relu + pool, no batch normalization left
+        pool = tf.expand_dims(input=inputImgs, axis=3)
+        for (kernel, bias, poolSize) in foldedCNNLayers(paraWeights):
+            conv = tf.nn.conv2d(
+                pool, tf.constant(kernel), padding='SAME', strides=(1, 1, 1, 1))
+            relu = tf.nn.relu(tf.nn.bias_add(conv, tf.constant(bias)))
+            pool = tf.nn.max_pool(relu, (1, poolSize[0], poolSize[1], 1),
+                                  (1, poolSize[0], poolSize[1], 1), 'VALID')
+
+        # the RNN is built by the model code itself so that the LSTM variables get the checkpoint names,
+        # a fixed input width allows unrolling it
+        layers = SimpleNamespace(cnnOut4d=pool, charList=paraCharList,
+                                 unrolledRNN=paraUnrolledWidth is not None)
+        Model.setupRNN(layers)
+        rnnOut3d = tf.identity(layers.rnnOut3d, name='rnnOut3d')
+
+        # the folded CNN creates no variables, so the projection kernel is the first tf.Variable here
+        renamed = {'Variable:0': PROJECTION_KERNEL}
+
+        sess = tf.Session(graph=graph)
+        for variable in tf.global_variables():
+            variable.load(paraWeights[renamed.get(variable.name, variable.name)], sess)
+    return (sess, inputImgs, rnnOut3d)
+
+
+def buildFrozenGraph(paraWeights, paraCharList):
+    "build the inference graph with the given weights and return it as a constant GraphDef"
+    (sess, _, _) = buildInferenceSession(paraWeights, paraCharList)
+    with sess:
+        # only the nodes needed to compute rnnOut3d are kept
+        return tf.graph_util.convert_variables_to_constants(
+            sess, sess.graph.as_graph_def(), ['rnnOut3d'])
+
+
+def buildTFLiteModel(paraWeights, paraCharList, paraWidth):
+    "convert the inference graph, unrolled for input images of the given width, to a TFLite flatbuffer"
+    (sess, inputImgs, rnnOut3d) = buildInferenceSession(paraWeights, paraCharList, paraWidth)
+    with sess:
+        # the batch dimension stays open, the interpreter resizes the input for every batch
+        converter = tf.lite.TFLiteConverter.from_session(sess, [inputImgs], [rnnOut3d])
+        return converter.convert()
+
+
+def exportFrozenModel(paraFnGraph=config.fnFrozenGraph):
+    "restore the checkpoint as an inference only model and write the frozen graph"
+    graph = tf.Graph()
+    with graph.as_default():
+        model = Model(config.DECODER_TYPE, mustRestore=True, dump=False, inferenceOnly=True)
+        weights = readWeights(model)
+
+    graphDef = buildFrozenGraph(weights, model.charList)
+    with open(paraFnGraph, 'wb') as f:
+        f.write(graphDef.SerializeToString())
+
+    auditString = "Frozen Model Export" + "\n"
+    auditString = auditString + "Graph: " + paraFnGraph + "\n"
+    auditString = auditString + "Nodes: " + str(len(graphDef.node)) + "\n"
+    auditString = auditString + "Size: " + \
+        str(graphDef.ByteSize() / (1024 * 1024)) + " MB\n\n"
+    print(auditString)
+    config.audit_log(auditString)
+
+    return model
+
+
+def exportTFLiteModels(paraModel, paraWidths=config.TFLITE_WIDTHS, paraFnModel=config.fnTFLiteModel):
+    "write one TFLite model per input width from the weights of a restored model"
+    with paraModel.sess.graph.as_default():
+        weights = readWeights(paraModel)
+
+    auditString = "TFLite Model Export" + "\n"
+    for width in paraWidths:
+        flatbuffer = buildTFLiteModel(weights, paraModel.charList, width)
+        with open(paraFnModel.format(width), 'wb') as f:
+            f.write(flatbuffer)
+        auditString = auditString + "Model: " + paraFnModel.format(width) + ", " + \
+            str(len(flatbuffer) / (1024 * 1024)) + " MB\n"
+    auditString = auditString + "\n"
+    print(auditString)
+    config.audit_log(auditString)
+
+
+def checkParity(paraModel, paraFnGraph=config.fnFrozenGraph, paraNumWords=config.BENCHMARK_WORDS_PER_PAGE):
+    "compare the frozen graph against the checkpoint model on the sample words and on noise"
+    timeSnapshot = time.time()
+    frozenModel = FrozenModel(paraModel.decoderType, paraFnGraph)
+    loadTime = time.time() - timeSnapshot
+
+    sampleImgs = [cv2.imread(fn, cv2.IMREAD_GRAYSCALE)
+                  for fn in (config.fnInfer_1, config.fnInfer_2)]
+    imgs = [preprocess(img) for img in sampleImgs if img is not None]
+    randomState = np.random.RandomState(0)
+    while len(imgs) < paraNumWords:
+        imgs.append(randomState.uniform(-1, 1, (config.IMAGE_WIDTH, config.IMAGE_HEIGHT)).astype(np.float32))
+
+    def run(model):
+        timeSnapshot = time.time()
+        (texts, _) = model.inferBatch(Batch(None, imgs))
+        elapsed = time.time() - timeSnapshot
+        logits = model.sess.run(model.ctcIn3dTBC, {model.inputImgs: imgs, model.is_train: False})
+        return (texts, logits, elapsed)
+
+    # first runs only warm up both sessions
+    run(paraModel)
+    run(frozenModel)
+    (texts, logits, checkpointTime) = run(paraModel)
+    (frozenTexts, frozenLogits, frozenTime) = run(frozenModel)
+
+    mismatches = sum(1 for (a, b) in zip(texts, frozenTexts) if a != b)
+    auditString = "Frozen Model Parity" + "\n"
+    auditString = auditString + "Words: " + str(len(imgs)) + "\n"
+    auditString = auditString + "Max logit difference: " + \
+        str(float(np.max(np.abs(logits - frozenLogits)))) + "\n"
+    auditString = auditString + "Text mismatches: " + str(mismatches) + "\n"
+    auditString = auditString + "Frozen load time: " + str(loadTime) + " sec\n"
+    auditString = auditString + "Checkpoint: " + \
+        str(len(imgs) / checkpointTime) + " words/sec\n"
+    auditString = auditString + "Frozen: " + \
+        str(len(imgs) / frozenTime) + " words/sec\n\n"
+    print(auditString)
+    config.audit_log(auditString)
+
+    return mismatches == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export the CRNN checkpoint as a frozen, batch-norm folded inference graph (and as TFLite models)')
+    parser.add_argument('--output', default=config.fnFrozenGraph,
+                        help='path of the frozen graph (default: %(default)s)')
+    parser.add_argument('--check', action='store_true',
+                        help='compare the frozen graph against the checkpoint model after exporting')
+    parser.add_argument('--tflite', action='store_true',
+                        help='also convert TFLite models for the widths in config.TFLITE_WIDTHS')
+    args = parser.parse_args()
+
+    model = exportFrozenModel(args.output)
+    if args.tflite:
+        exportTFLiteModels(model)
+    if args.check and not checkParity(model, args.output):
+        raise SystemExit('Frozen graph does not match the checkpoint model')
+
+
+if __name__ == '__main__':
+    main()
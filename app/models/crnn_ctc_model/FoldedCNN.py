@@ -0,0 +1,35 @@
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+# names TF gives to the variables of Model.setup5LayersCNN / setupRNN, in the order they are created
+CNN_KERNELS = ['Variable:0', 'Variable_1:0', 'Variable_2:0', 'Variable_3:0', 'Variable_4:0']
+CNN_NORMS = ['batch_normalization', 'batch_normalization_1', 'batch_normalization_2',
+             'batch_normalization_3', 'batch_normalization_4']
+CNN_POOLS = [(2, 2), (2, 2), (1, 2), (1, 2), (1, 2)]
+PROJECTION_KERNEL = 'Variable_5:0'
+
+# default epsilon of tf.layers.batch_normalization
+BATCH_NORM_EPSILON = 1e-3
+
+
+def foldBatchNorm(paraKernel, paraGamma, paraBeta, paraMean, paraVariance, paraEpsilon=BATCH_NORM_EPSILON):
+    "fold an inference batch normalization into the convolution in front of it"
+    scale = paraGamma / np.sqrt(paraVariance + paraEpsilon)
+    kernel = paraKernel * scale  # scales the output channels (last axis)
+    bias = paraBeta - paraMean * scale
+    return (kernel.astype(np.float32), bias.astype(np.float32))
+
+
+def foldedCNNLayers(paraWeights):
+    "(kernel, bias, pool) of each CNN layer with its batch normalization folded in"
+    layers = []
+    for (kernelName, normName, pool) in zip(CNN_KERNELS, CNN_NORMS, CNN_POOLS):
+        (kernel, bias) = foldBatchNorm(paraWeights[kernelName],
+                                       paraWeights[normName + '/gamma:0'],
+                                       paraWeights[normName + '/beta:0'],
+                                       paraWeights[normName + '/moving_mean:0'],
+                                       paraWeights[normName + '/moving_variance:0'])
+        layers.append((kernel, bias, pool))
+    return layers
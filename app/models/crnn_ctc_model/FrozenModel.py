@@ -0,0 +1,52 @@
+from __future__ import division
+from __future__ import print_function
+
+import time
+import tensorflow as tf
+from app.models.crnn_ctc_model.Artifacts import readArtifact
+from app.models.crnn_ctc_model.CTCDecoder import charCodeTable
+from app.models.crnn_ctc_model.Model import Model
+from config import config
+
+
+class FrozenModel(Model):
+    "inference only model loaded from the frozen graph written by Export.py"
+
+    def __init__(self, decoderType=config.DecoderType.BestPath, fnGraph=config.fnFrozenGraph, sessionConfig=None):
+        "import the frozen CNN/RNN graph and add the CTC decoder on top of it"
+        self.dump = False
+        self.inferenceOnly = True
+        self.charList = open(config.fnCharList, encoding="utf-8").read()
+        self.charCodes = charCodeTable(self.charList)
+        self.decoderType = decoderType
+        self.mustRestore = True
+        self.snapID = 0
+        self.batchesTrained = 0
+        self.sessionConfig = sessionConfig
+        self.timings = {}
+
+        # the frozen graph lives in its own TF graph, next to a checkpoint model if there is one
+        self.graph = tf.Graph()
+
+        timeSnapshot = time.time()
+        with self.graph.as_default():
+            graphDef = tf.GraphDef()
+            graphDef.ParseFromString(readArtifact(fnGraph))
+            (self.inputImgs, self.rnnOut3d) = tf.import_graph_def(
+                graphDef, return_elements=['inputImgs:0', 'rnnOut3d:0'], name='')
+
+            # kept so that the feed dicts of Model.inferBatch work unchanged
+            self.is_train = tf.placeholder_with_default(False, shape=[], name='is_train')
+            self.setupCTC()
+        self.timings['graph_build'] = time.time() - timeSnapshot
+
+        # there is nothing to restore, the weights are constants of the graph
+        timeSnapshot = time.time()
+        print('Init with frozen graph from ' + fnGraph)
+        self.sess = tf.Session(graph=self.graph, config=self.sessionConfig)
+        self.saver = None
+        self.timings['restore'] = time.time() - timeSnapshot
+
+    def save(self):
+        "a frozen graph can not be trained, re-export it from a checkpoint instead"
+        raise Exception('A frozen model can not be saved, run Export.py on a checkpoint instead')
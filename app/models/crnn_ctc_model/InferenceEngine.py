@@ -0,0 +1,233 @@
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import threading
+import time
+import numpy as np
+from app.models.crnn_ctc_model.CTCDecoder import bestPathDecode, charCodeTable
+from app.models.crnn_ctc_model.Model import Model
+from config import config
+
+
+class SessionEngine:
+    "computes the NN output in the TF session of a checkpoint or frozen model"
+
+    def __init__(self, model):
+        self.model = model
+        self.timings = dict(model.timings)
+
+    def computeLogits(self, imgs):
+        "feed a float batch of shape (B, W, IMAGE_HEIGHT) into the NN and return its TxBxC output"
+        feedDict = {self.model.inputImgs: imgs, self.model.is_train: False}
+        return self.model.sess.run(self.model.ctcIn3dTBC, feedDict)
+
+    def replicate(self):
+        "an engine on a replica of the model, with its own session"
+        return SessionEngine(self.model.replicate())
+
+
+def createInterpreter(tf, fnModel, numThreads):
+    "TFLite interpreter with multithreaded CPU kernels (the kernels are single threaded if not set)"
+    try:
+        return tf.lite.Interpreter(model_path=fnModel, num_threads=numThreads)
+    except TypeError:
+        # TF 1.x sets the number of threads after creating the interpreter
+        interpreter = tf.lite.Interpreter(model_path=fnModel)
+        interpreter.set_num_threads(numThreads)
+        return interpreter
+
+
+class TFLiteEngine:
+    "computes the NN output with the TFLite models written by Export.py, one interpreter per input width"
+
+    def __init__(self, widths=config.TFLITE_WIDTHS, fnModel=config.fnTFLiteModel, numThreads=config.TFLITE_THREADS):
+        import tensorflow as tf
+
+        (self.widths, self.fnModel, self.numThreads) = (widths, fnModel, numThreads)
+        self.timings = {}
+        timeSnapshot = time.time()
+        self.interpreters = {}
+        for width in widths:
+            print('Init with TFLite model from ' + fnModel.format(width))
+            interpreter = createInterpreter(tf, fnModel.format(width), numThreads)
+            interpreter.allocate_tensors()
+            self.interpreters[width] = interpreter
+        self.timings['restore'] = time.time() - timeSnapshot
+
+        # an interpreter holds the tensors of the last batch, so every width runs one batch at a time
+        self.locks = {width: threading.Lock() for width in widths}
+
+    def computeLogits(self, imgs):
+        "feed a float batch of shape (B, W, IMAGE_HEIGHT) into the NN and return its TxBxC output"
+        imgs = np.asarray(imgs, dtype=np.float32)
+        width = imgs.shape[1]
+        if width not in self.interpreters:
+            raise Exception('No TFLite model for input width ' + str(width) + ', add it to config.TFLITE_WIDTHS')
+
+        interpreter = self.interpreters[width]
+        with self.locks[width]:
+            inputDetails = interpreter.get_input_details()[0]
+            outputDetails = interpreter.get_output_details()[0]
+
+            # the models are converted for a batch of one, the input is resized when the batch size changes
+            if inputDetails['shape'][0] != len(imgs):
+                interpreter.resize_tensor_input(inputDetails['index'], imgs.shape)
+                interpreter.allocate_tensors()
+
+            interpreter.set_tensor(inputDetails['index'], imgs)
+            interpreter.invoke()
+            rnnOutput = interpreter.get_tensor(outputDetails['index'])  # BxTxC
+
+        return np.transpose(rnnOutput, (1, 0, 2))
+
+    def replicate(self):
+        "an engine with its own interpreters (and threads), the model files are memory-mapped by all of them"
+        return TFLiteEngine(self.widths, self.fnModel, self.numThreads)
+
+
+class EngineModel(Model):
+    "inference only model computing the NN output with an engine, all decoders run in NumPy"
+
+    def __init__(self, engine, decoderType=config.DecoderType.BestPath):
+        self.engine = engine
+        self.dump = False
+        self.inferenceOnly = True
+        self.charList = open(config.fnCharList, encoding="utf-8").read()
+        self.charCodes = charCodeTable(self.charList)
+        self.decoderType = decoderType
+        self.timings = engine.timings
+
+        # there is no TF graph: no graph decoder, nothing to train or save
+        self.graphDecoderType = None
+        self.decoder = None
+
+    def inferBatchWithConfidence(self, batch, calcProbability=True, probabilityOfGT=False):
+        "feed a batch into the engine to recognize the texts, their probabilities and per character probabilities"
+        if probabilityOfGT:
+            raise Exception('The probability of the ground truth needs the CTC loss of a TF model')
+
+        rnnOutput = self.computeRnnOutput(batch)
+        texts = self.decodeRnnOutput(rnnOutput, self.decoderType)
+        (probs, charProbs) = self.textConfidences(rnnOutput, texts) if calcProbability else (None, None)
+        return (texts, probs, charProbs)
+
+    def computeRnnOutput(self, batch):
+        "feed a batch into the engine and return its TxBxC output"
+        return self.engine.computeLogits(batch.imgs)
+
+    def replicate(self):
+        "a copy of the model computing the NN output with a replica of its engine"
+        replica = copy.copy(self)
+        replica.engine = self.engine.replicate()
+        replica.timings = replica.engine.timings
+        return replica
+
+    def save(self):
+        "an engine model can not be trained, re-export it from a checkpoint instead"
+        raise Exception('An engine model can not be saved, run Export.py on a checkpoint instead')
+
+
+def createSessionConfig(intraOpThreads=config.TF_INTRA_OP_THREADS, interOpThreads=config.TF_INTER_OP_THREADS):
+    "session config with thread pools of its own (TF shares the pools of the first session otherwise)"
+    import tensorflow as tf
+
+    return tf.ConfigProto(intra_op_parallelism_threads=intraOpThreads,
+                          inter_op_parallelism_threads=interOpThreads,
+                          use_per_session_threads=True)
+
+
+def createInferenceEngine(backend):
+    "the engine of a backend: 'session' (checkpoint), 'frozen' (frozen graph), 'tflite' or 'remote' (inference server)"
+    if backend == 'tflite':
+        return TFLiteEngine()
+    if backend == 'remote':
+        from app.models.crnn_ctc_model.InferenceServer import RingBufferEngine
+        return RingBufferEngine()
+    return SessionEngine(createInferenceModel(backend))
+
+
+def createInferenceModel(backend=config.INFERENCE_BACKEND, decoderType=config.DECODER_TYPE):
+    "the inference only model of a backend: 'session' (checkpoint), 'frozen' (frozen graph), 'tflite' or 'remote'"
+    if backend == 'session':
+        return Model(decoderType, mustRestore=True, dump=False, inferenceOnly=True,
+                     sessionConfig=createSessionConfig())
+    if backend == 'frozen':
+        from app.models.crnn_ctc_model.FrozenModel import FrozenModel
+        return FrozenModel(decoderType, sessionConfig=createSessionConfig())
+    if backend in ('tflite', 'remote'):
+        return EngineModel(createInferenceEngine(backend), decoderType)
+    raise Exception('Unknown inference backend ' + str(backend))
+
+
+def residentMemory():
+    "resident set size of this process in MB"
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def randomBatch(paraBatchSize, paraWidth=config.IMAGE_WIDTH, paraSeed=0):
+    "float batch of shape (B, W, IMAGE_HEIGHT) with the value range of preprocessed images"
+    randomState = np.random.RandomState(paraSeed)
+    return randomState.uniform(-1, 1, (paraBatchSize, paraWidth, config.IMAGE_HEIGHT)).astype(np.float32)
+
+
+def checkParity(paraReference, paraEngine, paraCharList, paraBatchSize=64, paraWidths=config.TFLITE_WIDTHS):
+    "compare the NN output and the best path texts of an engine against a reference engine"
+    charCodes = charCodeTable(paraCharList)
+    auditString = "Inference Engine Parity" + "\n"
+    mismatches = 0
+    for width in paraWidths:
+        imgs = randomBatch(paraBatchSize, width)
+        logits = paraReference.computeLogits(imgs)
+        engineLogits = paraEngine.computeLogits(imgs)
+        widthMismatches = sum(1 for (a, b) in zip(bestPathDecode(logits, charCodes),
+                                                  bestPathDecode(engineLogits, charCodes)) if a != b)
+        mismatches += widthMismatches
+        auditString = auditString + "Width " + str(width) + " - max logit difference: " + \
+            str(float(np.max(np.abs(logits - engineLogits)))) + ", text mismatches: " + \
+            str(widthMismatches) + "\n"
+    auditString = auditString + "\n"
+    print(auditString)
+    config.audit_log(auditString)
+    return mismatches == 0
+
+
+def benchmarkEngines(paraEngines, paraBatchSizes=(1, 32, 128), paraRepeats=10):
+    "latency of every engine (name -> (engine, MB of memory added when loading it)) for word batches"
+    auditString = "Inference Engine Benchmark" + "\n"
+    for (name, (engine, memory)) in paraEngines.items():
+        auditString = auditString + name + " - load memory: " + str(memory) + " MB\n"
+        for batchSize in paraBatchSizes:
+            imgs = randomBatch(batchSize)
+            engine.computeLogits(imgs)  # warm up, includes the resize of the TFLite input
+
+            timeSnapshot = time.time()
+            for _ in range(paraRepeats):
+                engine.computeLogits(imgs)
+            latency = (time.time() - timeSnapshot) / paraRepeats
+            auditString = auditString + name + " - batch size " + str(batchSize) + ": " + \
+                str(latency * 1000) + " ms/batch, " + str(batchSize / latency) + " words/sec\n"
+    auditString = auditString + "\n"
+    print(auditString)
+    config.audit_log(auditString)
+
+
+if __name__ == '__main__':
+    # the TFLite engine is loaded first, so its memory is not hidden by pages TF already touched
+    memorySnapshot = residentMemory()
+    tfliteEngine = TFLiteEngine()
+    tfliteMemory = residentMemory() - memorySnapshot
+
+    memorySnapshot = residentMemory()
+    sessionEngine = SessionEngine(createInferenceModel('session'))
+    sessionMemory = residentMemory() - memorySnapshot
+
+    charList = open(config.fnCharList, encoding="utf-8").read()
+    parity = checkParity(sessionEngine, tfliteEngine, charList)
+    benchmarkEngines({'session': (sessionEngine, sessionMemory), 'tflite': (tfliteEngine, tfliteMemory)})
+    if not parity:
+        raise SystemExit('TFLite models do not match the checkpoint model')
@@ -0,0 +1,315 @@
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import itertools
+import mmap
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from config import config
+
+# messages over the unix socket, the images and NN outputs themselves stay in the ring
+SLOT_MESSAGE = struct.Struct('<i')  # server -> client on connect: slot of the connection, -1 if none is free
+REQUEST_MESSAGE = struct.Struct('<ii')  # client -> server: batch size, input width
+RESPONSE_MESSAGE = struct.Struct('<ii')  # server -> client: status (0 = ok), time steps
+
+
+def serverPaths(paraServer, paraPath=config.INFERENCE_SERVER_PATH):
+    "ring file and socket of an inference server"
+    prefix = paraPath + '-' + str(paraServer)
+    return (prefix + '.ring', prefix + '.sock')
+
+
+def ringBytes(numChars, numSlots=config.INFERENCE_RING_SLOTS, slotWords=config.INFERENCE_SLOT_WORDS):
+    "size of the ring file of a server"
+    return numSlots * 4 * slotWords * (config.IMAGE_WIDTH * config.IMAGE_HEIGHT + config.MAX_TEXT_LENGTH * numChars)
+
+
+def checkSharedMemory(numChars, numServers, paraPath=config.INFERENCE_SERVER_PATH):
+    "fail before starting the servers if their rings do not fit into the file system of paraPath (usually /dev/shm)"
+    needed = numServers * ringBytes(numChars)
+    # rings left behind by earlier servers are replaced, their space counts as free
+    stale = sum(os.path.getsize(serverPaths(server, paraPath)[0]) for server in range(numServers)
+                if os.path.exists(serverPaths(server, paraPath)[0]))
+    stats = os.statvfs(os.path.dirname(paraPath))
+    available = stats.f_bavail * stats.f_frsize + stale
+    if needed > available:
+        raise Exception('The rings of {} inference server(s) need {:.1f} MB but only {:.1f} MB are free in {}, '
+                        'start the container with a larger --shm-size or lower INFERENCE_RING_SLOTS / '
+                        'INFERENCE_SLOT_WORDS'.format(numServers, needed / 1e6, available / 1e6,
+                                                      os.path.dirname(paraPath)))
+
+
+def receiveExactly(paraSock, paraSize):
+    "read exactly paraSize bytes from a stream socket, None if the peer closed the connection"
+    data = b''
+    while len(data) < paraSize:
+        chunk = paraSock.recv(paraSize - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class RingBuffer:
+    "slots of input images and NN outputs (float32) in a shared memory file, mapped by the server and its clients"
+
+    def __init__(self, fnRing, numChars, numSlots=config.INFERENCE_RING_SLOTS,
+                 slotWords=config.INFERENCE_SLOT_WORDS, create=False):
+        self.numChars = numChars
+        self.numSlots = numSlots
+        self.slotWords = slotWords
+
+        # a slot holds slotWords word images, or fewer wider images (text lines) of the same size in total
+        self.inputFloats = slotWords * config.IMAGE_WIDTH * config.IMAGE_HEIGHT
+        self.outputFloats = slotWords * config.MAX_TEXT_LENGTH * numChars
+        self.slotBytes = 4 * (self.inputFloats + self.outputFloats)
+
+        flags = os.O_RDWR | os.O_CREAT | os.O_TRUNC if create else os.O_RDWR
+        fd = os.open(fnRing, flags, 0o600)
+        try:
+            if create:
+                # allocate the pages now: a sparse file on a full tmpfs only fails (SIGBUS) once a slot is written
+                os.posix_fallocate(fd, 0, numSlots * self.slotBytes)
+            self.buffer = mmap.mmap(fd, numSlots * self.slotBytes)
+        finally:
+            os.close(fd)
+
+    def maxBatchSize(self, width):
+        "number of images of the given width fitting into one slot"
+        return self.slotWords * config.IMAGE_WIDTH // width
+
+    def inputs(self, slot, batchSize, width):
+        "(B, W, IMAGE_HEIGHT) view of the input images of a slot"
+        return np.frombuffer(self.buffer, np.float32, batchSize * width * config.IMAGE_HEIGHT,
+                             slot * self.slotBytes).reshape((batchSize, width, config.IMAGE_HEIGHT))
+
+    def outputs(self, slot, timeSteps, batchSize):
+        "TxBxC view of the NN output of a slot"
+        return np.frombuffer(self.buffer, np.float32, timeSteps * batchSize * self.numChars,
+                             slot * self.slotBytes + 4 * self.inputFloats).reshape((timeSteps, batchSize, self.numChars))
+
+
+class InferenceServer:
+    "runs the NN for the clients of one ring, requests of all clients waiting at the same time share one batch"
+
+    def __init__(self, engine, numChars, server=0, maxWaitMs=config.INFERENCE_SERVER_MAX_WAIT_MS):
+        (fnRing, self.fnSocket) = serverPaths(server)
+        self.engine = engine
+        self.ring = RingBuffer(fnRing, numChars, create=True)
+        self.freeSlots = list(range(self.ring.numSlots))
+        self.slotOf = {}
+        self.maxWait = maxWaitMs / 1000
+
+        if os.path.exists(self.fnSocket):
+            os.unlink(self.fnSocket)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.fnSocket)
+        self.listener.listen(self.ring.numSlots)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+
+        # statistics
+        self.batchesRun = 0
+        self.imagesProcessed = 0
+
+    def accept(self):
+        "give a new client a slot of its own for as long as it stays connected"
+        (conn, _) = self.listener.accept()
+        if not self.freeSlots:
+            conn.sendall(SLOT_MESSAGE.pack(-1))
+            conn.close()
+            return
+        slot = self.freeSlots.pop(0)
+        self.slotOf[conn] = slot
+        self.selector.register(conn, selectors.EVENT_READ)
+        conn.sendall(SLOT_MESSAGE.pack(slot))
+
+    def close(self, conn):
+        "free the slot of a client that disconnected"
+        self.selector.unregister(conn)
+        self.freeSlots.append(self.slotOf.pop(conn))
+        conn.close()
+
+    def collect(self, timeout, requests):
+        "add the requests arriving within timeout seconds to requests: (connection, batch size, width)"
+        for (key, _) in self.selector.select(timeout):
+            if key.fileobj is self.listener:
+                self.accept()
+                continue
+            try:
+                message = receiveExactly(key.fileobj, REQUEST_MESSAGE.size)
+            except OSError:
+                message = None
+            if message is None:
+                self.close(key.fileobj)
+                continue
+            (batchSize, width) = REQUEST_MESSAGE.unpack(message)
+            if batchSize <= 0 or width <= 0 or batchSize > self.ring.maxBatchSize(width):
+                self.respond(key.fileobj, 1, 0)
+                continue
+            requests.append((key.fileobj, batchSize, width))
+
+    def run(self):
+        "serve requests until the process is stopped"
+        print('Inference server listening on ' + self.fnSocket)
+        while True:
+            requests = []
+            self.collect(None, requests)
+
+            # a client has at most one request in flight, wait a little for the other clients
+            if requests and self.maxWait > 0:
+                deadline = time.time() + self.maxWait
+                while time.time() < deadline:
+                    self.collect(max(deadline - time.time(), 0), requests)
+
+            for width in set(width for (_, _, width) in requests):
+                self.runBatch([request for request in requests if request[2] == width], width)
+
+    def runBatch(self, requests, width):
+        "one forward pass over the images of all requests of the same width"
+        # clients that disconnected while waiting have lost their slot
+        requests = [request for request in requests if request[0] in self.slotOf]
+        if not requests:
+            return
+
+        try:
+            imgs = np.concatenate([self.ring.inputs(self.slotOf[conn], batchSize, width)
+                                   for (conn, batchSize, _) in requests])
+            rnnOutput = self.engine.computeLogits(imgs)
+        except Exception as e:
+            print('Inference server batch failed:', e)
+            for (conn, _, _) in requests:
+                self.respond(conn, 1, 0)
+            return
+
+        timeSteps = rnnOutput.shape[0]
+        start = 0
+        for (conn, batchSize, _) in requests:
+            self.ring.outputs(self.slotOf[conn], timeSteps, batchSize)[...] = rnnOutput[:, start:start + batchSize, :]
+            start += batchSize
+            self.respond(conn, 0, timeSteps)
+
+        self.batchesRun += 1
+        self.imagesProcessed += len(imgs)
+
+    def respond(self, conn, status, timeSteps):
+        try:
+            conn.sendall(RESPONSE_MESSAGE.pack(status, timeSteps))
+        except OSError:
+            # the client is gone, its slot is freed once the selector reports the closed connection
+            pass
+
+
+class RingBufferEngine:
+    "computes the NN output in the inference server processes, every calling thread owns a slot of a ring"
+
+    def __init__(self, numServers=config.INFERENCE_SERVERS):
+        self.numServers = numServers
+        self.numChars = len(open(config.fnCharList, encoding="utf-8").read()) + 1
+        self.timings = {}
+        self.rings = {}
+        self.local = threading.local()
+        self.nextServer = itertools.count()
+        self.lock = threading.Lock()
+
+    def connection(self):
+        "(socket, ring, slot) of the calling thread, connecting to the next server on first use"
+        if getattr(self.local, 'conn', None) is None:
+            with self.lock:
+                server = next(self.nextServer) % self.numServers
+            (fnRing, fnSocket) = serverPaths(server)
+
+            # a hung server fails the request like a lost connection instead of blocking the thread forever
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(config.REQUEST_TIMEOUT_SECONDS)
+            try:
+                conn.connect(fnSocket)
+                message = receiveExactly(conn, SLOT_MESSAGE.size)
+            except OSError:
+                conn.close()
+                raise
+            slot = SLOT_MESSAGE.unpack(message)[0] if message is not None else -1
+            if slot < 0:
+                conn.close()
+                raise Exception('No free slot on inference server ' + fnSocket + ', raise INFERENCE_RING_SLOTS')
+
+            with self.lock:
+                if server not in self.rings:
+                    self.rings[server] = RingBuffer(fnRing, self.numChars)
+            (self.local.conn, self.local.ring, self.local.slot) = (conn, self.rings[server], slot)
+        return (self.local.conn, self.local.ring, self.local.slot)
+
+    def computeLogits(self, imgs):
+        "feed a float batch of shape (B, W, IMAGE_HEIGHT) into the NN of a server and return its TxBxC output"
+        imgs = np.asarray(imgs, dtype=np.float32)
+        (conn, ring, slot) = self.connection()
+
+        # batches larger than a slot are sent in chunks
+        chunkSize = ring.maxBatchSize(imgs.shape[1])
+        outputs = []
+        try:
+            for start in range(0, len(imgs), chunkSize):
+                chunk = imgs[start:start + chunkSize]
+                ring.inputs(slot, len(chunk), chunk.shape[1])[...] = chunk
+                conn.sendall(REQUEST_MESSAGE.pack(len(chunk), chunk.shape[1]))
+                message = receiveExactly(conn, RESPONSE_MESSAGE.size)
+                if message is None:
+                    raise ConnectionError('inference server closed the connection')
+                (status, timeSteps) = RESPONSE_MESSAGE.unpack(message)
+                if status != 0:
+                    raise Exception('Inference server failed to run the batch')
+                outputs.append(ring.outputs(slot, timeSteps, len(chunk)).copy())
+        except (socket.timeout, OSError):
+            # reconnect (e.g. to a restarted server) on the next call, the server frees the slot of this connection
+            conn.close()
+            self.local.conn = None
+            raise
+
+        return np.concatenate(outputs, axis=1)
+
+    def replicate(self):
+        "every thread has its own connection and slot already, so replicas can share the engine"
+        return self
+
+
+def runServer(paraServer=0, paraBackend=config.INFERENCE_SERVER_BACKEND):
+    "load the NN of a backend and serve the ring of one server"
+    from app.models.crnn_ctc_model.InferenceEngine import createInferenceEngine
+
+    engine = createInferenceEngine(paraBackend)
+    numChars = len(open(config.fnCharList, encoding="utf-8").read()) + 1
+    InferenceServer(engine, numChars, paraServer).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the CRNN in dedicated processes fed by the API workers over shared memory rings')
+    parser.add_argument('--servers', type=int, default=config.INFERENCE_SERVERS,
+                        help='number of server processes, each with its own ring (default: %(default)s)')
+    parser.add_argument('--backend', default=config.INFERENCE_SERVER_BACKEND,
+                        help="backend running the NN: 'session', 'frozen' or 'tflite' (default: %(default)s)")
+    args = parser.parse_args()
+
+    checkSharedMemory(len(open(config.fnCharList, encoding="utf-8").read()) + 1, args.servers)
+    if args.servers == 1:
+        runServer(0, args.backend)
+        return
+
+    # every server is a fresh process, TF must not be initialized before forking
+    import multiprocessing
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=runServer, args=(server, args.backend)) for server in range(args.servers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,15 +6,20 @@ from datetime import datetime
 import time
 import cv2
 import editdistance
+import numpy as np
 from app.utils.data_generator_binary import DataGenerator, Batch
+from app.models.crnn_ctc_model.CTCDecoder import reverseWordOrder
 from app.models.crnn_ctc_model.Model import Model
-from app.utils.sample_preprocessing import preprocess
+from app.utils.sample_preprocessing import preprocess, preprocess_line
+from app.utils.wordCache import WordCache
 from config import config
 
 startTime = datetime.now()
 
-# we only need DataGenerator in training, validation, testing inorder to access the related datasets
-if config.OPERATION_TYPE != config.OperationType.Infer:
+# we only need DataGenerator in training, validation, testing inorder to access the related datasets,
+# inference and the inference benchmark only read the sample images
+usesDatasets = config.OPERATION_TYPE not in (config.OperationType.Infer, config.OperationType.Benchmark)
+if usesDatasets:
     dataGenerator = DataGenerator()
 
 def train(paraModel):
@@ -136,7 +141,12 @@ def validate(paraModel, paraOperationType):
 def inferSingleImage(paraModel, paraFnImg):
     "recognize text in image provided by file path"
     img = cv2.imread(paraFnImg, cv2.IMREAD_GRAYSCALE)
-    img = preprocess(img)
+    return inferImage(paraModel, img)
+
+
+def inferImage(paraModel, paraImg):
+    "recognize text in a grayscale word image provided as a NumPy array"
+    img = preprocess(paraImg)
     batch = Batch(None, [img])
     #(recognized, probability) = model.inferBatch(batch)
     (recognized, probability) = paraModel.inferBatch(batch, True)
@@ -145,6 +155,244 @@ def inferSingleImage(paraModel, paraFnImg):
     return recognized[0]
 
 
+def inferImages(paraModel, paraImgs, paraBatchSize=config.INFER_BATCH_SIZE, paraWordCache=None, paraWithConfidence=False,
+                paraDecodings=None, paraLines=False):
+    "recognize text in a list of word images, feeding them to the NN in chunks of paraBatchSize"
+    # with paraWithConfidence every entry is (text, probability, character probabilities) instead of the text
+    # paraDecodings optionally holds a (decoderType, beamWidth) per image, None decodes with the model decoder
+    # with paraLines the images are text lines, padded to width buckets instead of squeezed into a word;
+    # the NN reads a line left to right, i.e. the last word of a right to left line first, so the words of
+    # a line are put back into reading order, the order word mode joins the words of a row in
+    imgs = [preprocess_line(img) if paraLines else preprocess(img) for img in paraImgs]
+    decodings = paraDecodings if paraDecodings is not None else [None] * len(imgs)
+    recognized = [None] * len(imgs)
+
+    # words already seen (with the same decoder) skip the NN, only the remaining ones are batched
+    keys = [None] * len(imgs)
+    pending = list(range(len(imgs)))
+    if paraWordCache is not None:
+        pending = []
+        for i, img in enumerate(imgs):
+            keys[i] = (paraWordCache.fingerprint(img), decodings[i])
+            recognized[i] = paraWordCache.get(keys[i])
+            if recognized[i] is None:
+                pending.append(i)
+
+    # only images of the same width can share a batch (words all have the same width, lines one per bucket)
+    chunks = []
+    for width in sorted(set(imgs[i].shape[0] for i in pending)):
+        sameWidth = [i for i in pending if imgs[i].shape[0] == width]
+        chunks += [sameWidth[start:start + paraBatchSize] for start in range(0, len(sameWidth), paraBatchSize)]
+
+    for chunk in chunks:
+        batch = Batch(None, [imgs[i] for i in chunk])
+        (texts, probs, charProbs) = paraModel.inferBatchWithDecoders(batch, [decodings[i] for i in chunk])
+        for i, text, prob, charProb in zip(chunk, texts, probs, charProbs):
+            if paraLines:
+                (text, charProb) = reverseWordOrder(text, charProb)
+            recognized[i] = (text, prob, charProb)
+            if paraWordCache is not None:
+                paraWordCache.put(keys[i], recognized[i])
+
+    # results are returned in the same (reading) order as the input images
+    if paraWithConfidence:
+        return recognized
+    return [text for (text, _, _) in recognized]
+
+
+def benchmarkInference(paraModel, paraImgs, paraBatchSize=config.INFER_BATCH_SIZE):
+    "compare words/sec of word-by-word inference against batched inference"
+    imgs = [preprocess(img) for img in paraImgs]
+
+    timeSnapshot = time.time()
+    for img in imgs:
+        paraModel.inferBatch(Batch(None, [img]))
+    singleTime = time.time() - timeSnapshot
+
+    timeSnapshot = time.time()
+    inferImages(paraModel, paraImgs, paraBatchSize)
+    batchedTime = time.time() - timeSnapshot
+
+    auditString = "Inference Benchmark" + "\n"
+    auditString = auditString + "Words: " + str(len(imgs)) + "\n"
+    auditString = auditString + "Batch size: " + str(paraBatchSize) + "\n"
+    auditString = auditString + "Word by word: " + \
+        str(len(imgs) / singleTime) + " words/sec\n"
+    auditString = auditString + "Batched: " + \
+        str(len(imgs) / batchedTime) + " words/sec\n\n"
+
+    return auditString
+
+
+def evaluateWordCache(paraModel, paraOperationType, paraWordCache):
+    "measure the hit rate of the word cache and its impact on the character error rate"
+    if paraOperationType == config.OperationType.Validation:
+        dataGenerator.selectValidationSet()
+    else:
+        dataGenerator.selectTestSet()
+
+    numCharTotal = 0
+    numCharErrModel = 0
+    numCharErrCached = 0
+    numHits = 0
+    numWordTotal = 0
+
+    while dataGenerator.hasNext():
+        batch = dataGenerator.getNext()
+        (recognized, _) = paraModel.inferBatch(batch)
+
+        for i in range(len(recognized)):
+            numWordTotal += 1
+            numCharTotal += len(batch.gtTexts[i])
+            numCharErrModel += editdistance.eval(recognized[i], batch.gtTexts[i])
+
+            # what the API would have returned: the cached text on a hit, the NN text otherwise
+            key = paraWordCache.fingerprint(batch.imgs[i])
+            cached = paraWordCache.get(key)
+            if cached is None:
+                paraWordCache.put(key, recognized[i])
+                cached = recognized[i]
+            else:
+                numHits += 1
+            numCharErrCached += editdistance.eval(cached, batch.gtTexts[i])
+
+    auditString = "Word Cache Evaluation" + "\n"
+    auditString = auditString + "Mode: " + paraWordCache.mode + "\n"
+    auditString = auditString + "Words: " + str(numWordTotal) + "\n"
+    auditString = auditString + "Hit rate: " + \
+        str(numHits / numWordTotal * 100.0) + "%\n"
+    auditString = auditString + "Character error rate without cache: " + \
+        str(numCharErrModel / numCharTotal * 100.0) + "%\n"
+    auditString = auditString + "Character error rate with cache: " + \
+        str(numCharErrCached / numCharTotal * 100.0) + "%\n\n"
+
+    return auditString
+
+
+def evaluateDecoders(paraModel, paraOperationType, paraDecoderTypes):
+    "compare the character error rate and decoding latency of decoders on the same RNN output"
+    if paraOperationType == config.OperationType.Validation:
+        dataGenerator.selectValidationSet()
+    else:
+        dataGenerator.selectTestSet()
+
+    numCharTotal = 0
+    numWordTotal = 0
+    numCharErr = {decoderType: 0 for decoderType in paraDecoderTypes}
+    numWordOK = {decoderType: 0 for decoderType in paraDecoderTypes}
+    decodingTime = {decoderType: 0.0 for decoderType in paraDecoderTypes}
+
+    while dataGenerator.hasNext():
+        batch = dataGenerator.getNext()
+
+        # the NN runs once per batch, only the decoding differs
+        rnnOutput = paraModel.computeRnnOutput(batch)
+        numWordTotal += len(batch.gtTexts)
+        numCharTotal += sum(len(gtText) for gtText in batch.gtTexts)
+
+        for decoderType in paraDecoderTypes:
+            timeSnapshot = time.time()
+            recognized = paraModel.decodeRnnOutput(rnnOutput, decoderType)
+            decodingTime[decoderType] += time.time() - timeSnapshot
+
+            for i in range(len(recognized)):
+                numWordOK[decoderType] += 1 if batch.gtTexts[i] == recognized[i] else 0
+                numCharErr[decoderType] += editdistance.eval(recognized[i], batch.gtTexts[i])
+
+    auditString = "Decoder Evaluation" + "\n"
+    auditString = auditString + "Words: " + str(numWordTotal) + "\n"
+    for decoderType in paraDecoderTypes:
+        auditString = auditString + "Decoder: " + str(decoderType) + "\n"
+        auditString = auditString + "  Character error rate: " + \
+            str(numCharErr[decoderType] / numCharTotal * 100.0) + "%\n"
+        auditString = auditString + "  Word accuracy: " + \
+            str(numWordOK[decoderType] / numWordTotal * 100.0) + "%\n"
+        auditString = auditString + "  Decoding latency: " + \
+            str(decodingTime[decoderType] / numWordTotal * 1000.0) + " ms/word\n"
+    auditString = auditString + "\n"
+
+    return auditString
+
+
+def concatenateWords(paraImgs, paraGap=16):
+    "place word images on a white line image right to left, as on an Arabic page: the first word on the right"
+    height = max(img.shape[0] for img in paraImgs)
+    width = sum(img.shape[1] for img in paraImgs) + paraGap * (len(paraImgs) - 1)
+    line = np.full((height, width), 255, np.uint8)
+    x = width
+    for img in paraImgs:
+        x -= img.shape[1]
+        line[0:img.shape[0], x:x + img.shape[1]] = img
+        x -= paraGap
+    return line
+
+
+def evaluateLineMode(paraModel, paraOperationType, paraWordsPerLine=config.LINE_EVALUATION_WORDS_PER_LINE):
+    "compare word mode and line mode on synthetic text lines built from the word images of a dataset"
+    if paraOperationType == config.OperationType.Validation:
+        dataGenerator.selectValidationSet()
+    else:
+        dataGenerator.selectTestSet()
+
+    # words are placed right to left, as on a page; inferImages returns the line texts in reading order,
+    # so both modes are compared against the words joined first to last
+    lines = []
+    samples = dataGenerator.samples
+    for start in range(0, len(samples) - paraWordsPerLine + 1, paraWordsPerLine):
+        lineSamples = samples[start:start + paraWordsPerLine]
+        wordImgs = [dataGenerator.getRawImage(sample) for sample in lineSamples]
+        gtText = ' '.join([sample.gtText.strip() for sample in lineSamples])
+        lines.append((wordImgs, gtText))
+
+    def normalized(text, withSpaces=True):
+        words = text.split()
+        return ' '.join(words) if withSpaces else str().join(words)
+
+    numCharErr = {'words': [0, 0], 'lines': [0, 0]}  # with spaces, without spaces
+    elapsed = {'words': 0.0, 'lines': 0.0}
+    numCharTotal = [0, 0]
+    numInferences = {'words': 0, 'lines': len(lines)}
+
+    for start in range(0, len(lines), config.INFER_BATCH_SIZE):
+        chunk = lines[start:start + config.INFER_BATCH_SIZE]
+        wordImgs = [img for (imgs, _) in chunk for img in imgs]
+        numInferences['words'] += len(wordImgs)
+
+        timeSnapshot = time.time()
+        wordTexts = inferImages(paraModel, wordImgs)
+        elapsed['words'] += time.time() - timeSnapshot
+
+        timeSnapshot = time.time()
+        lineTexts = inferImages(paraModel, [concatenateWords(imgs) for (imgs, _) in chunk], paraLines=True)
+        elapsed['lines'] += time.time() - timeSnapshot
+
+        for (i, (imgs, gtText)) in enumerate(chunk):
+            wordModeText = ' '.join(wordTexts[i * paraWordsPerLine:(i + 1) * paraWordsPerLine])
+            for (k, withSpaces) in enumerate((True, False)):
+                gt = normalized(gtText, withSpaces)
+                numCharTotal[k] += len(gt)
+                numCharErr['words'][k] += editdistance.eval(normalized(wordModeText, withSpaces), gt)
+                numCharErr['lines'][k] += editdistance.eval(normalized(lineTexts[i], withSpaces), gt)
+
+    # a page of BENCHMARK_WORDS_PER_PAGE words
+    numPages = len(lines) * paraWordsPerLine / config.BENCHMARK_WORDS_PER_PAGE
+    auditString = "Line Mode Evaluation" + "\n"
+    auditString = auditString + "Lines: " + str(len(lines)) + " of " + str(paraWordsPerLine) + " words\n"
+    for mode in ('words', 'lines'):
+        auditString = auditString + "Mode: " + mode + "\n"
+        auditString = auditString + "  Inferences per page: " + \
+            str(numInferences[mode] / numPages) + "\n"
+        auditString = auditString + "  Pages/sec: " + \
+            str(numPages / elapsed[mode]) + "\n"
+        auditString = auditString + "  Character error rate: " + \
+            str(numCharErr[mode][0] / numCharTotal[0] * 100.0) + "%\n"
+        auditString = auditString + "  Character error rate ignoring spaces: " + \
+            str(numCharErr[mode][1] / numCharTotal[1] * 100.0) + "%\n"
+    auditString = auditString + "\n"
+
+    return auditString
+
+
 def get_initial_status_log():
     auditString = "____________________________________________________________" + "\n"
     auditString = auditString + "Experiment Name: " + config.EXPERIMENT_NAME + "\n"
@@ -209,7 +457,10 @@ def accumulateProcessingTime(paraTimeSnapshot):
 
 def main():
 
-    if config.OPERATION_TYPE != config.OperationType.Infer:
+    if config.OPERATION_TYPE in (config.OperationType.WordCacheEvaluation, config.OperationType.DecoderEvaluation,
+                                 config.OperationType.LineEvaluation):
+        dataGenerator.LoadData(config.OperationType.Testing)
+    elif usesDatasets:
         dataGenerator.LoadData(config.OPERATION_TYPE)
 
     if config.OPERATION_TYPE == config.OperationType.Training:
@@ -240,12 +491,47 @@ def main():
     elif config.OPERATION_TYPE == config.OperationType.Infer:  # infer text on test image
         print(open(config.fnResult).read())
         #model = Model(open(config.fnCharList, encoding="utf-8").read(), decoderType, mustRestore=True, dump=args.dump)
-        model = Model(config.DECODER_TYPE, mustRestore=True, dump=False)
+        model = Model(config.DECODER_TYPE, mustRestore=True, dump=False, inferenceOnly=True)
         rec = inferSingleImage(model, config.fnInfer_1)
         rec += inferSingleImage(model, config.fnInfer_2)
         rec = rec.replace("\n", " ")
         print("Recognized Text: ", rec)
 
+    elif config.OPERATION_TYPE == config.OperationType.WordCacheEvaluation:
+        model = Model(config.DECODER_TYPE, mustRestore=True, dump=False)
+        auditString = evaluateWordCache(
+            model, config.OperationType.Testing, WordCache())
+        print(auditString)
+        config.audit_log(auditString)
+
+    elif config.OPERATION_TYPE == config.OperationType.DecoderEvaluation:
+        model = Model(config.DECODER_TYPE, mustRestore=True, dump=False, inferenceOnly=True)
+        auditString = evaluateDecoders(
+            model, config.OperationType.Testing,
+            [config.DecoderType.BestPath, config.DecoderType.BeamSearch, config.DecoderType.WordBeamSearch])
+        print(auditString)
+        config.audit_log(auditString)
+
+    elif config.OPERATION_TYPE == config.OperationType.LineEvaluation:
+        model = Model(config.DECODER_TYPE, mustRestore=True, dump=False, inferenceOnly=True)
+        auditString = evaluateLineMode(model, config.OperationType.Testing)
+        print(auditString)
+        config.audit_log(auditString)
+
+    elif config.OPERATION_TYPE == config.OperationType.Benchmark:
+        model = Model(config.DECODER_TYPE, mustRestore=True, dump=False, inferenceOnly=True)
+
+        # repeat the sample word images to get a page sized workload
+        sampleImgs = [cv2.imread(fn, cv2.IMREAD_GRAYSCALE)
+                      for fn in (config.fnInfer_1, config.fnInfer_2)]
+        sampleImgs = [img for img in sampleImgs if img is not None]
+        pageImgs = [sampleImgs[i % len(sampleImgs)]
+                    for i in range(config.BENCHMARK_WORDS_PER_PAGE)]
+
+        auditString = benchmarkInference(model, pageImgs)
+        print(auditString)
+        config.audit_log(auditString)
+
 
 if __name__ == '__main__':
     main()
@@ -1,47 +1,72 @@
 from __future__ import division
 from __future__ import print_function
 
+import copy
 import sys
 import os
+import time
 import numpy as np
 import tensorflow as tf
+from app.models.crnn_ctc_model.CTCDecoder import bestPathConfidence, bestPathDecode, charCodeTable, labelsToText, \
+    prefixBeamSearch
+from app.models.crnn_ctc_model.WordBeamSearch import wordBeamSearch
 from config import config
 
 
 class Model:
     "minimalistic TF model for HTR"
 
-    def __init__(self, decoderType = config.DecoderType.BestPath, mustRestore=False, dump=False):
+    def __init__(self, decoderType = config.DecoderType.BestPath, mustRestore=False, dump=False, inferenceOnly=False,
+                 sessionConfig=None):
         "init model: add CNN, RNN and CTC and initialize TF"
         self.dump = dump
+        self.inferenceOnly = inferenceOnly
         self.charList = open(config.fnCharList, encoding="utf-8").read()
+        self.charCodes = charCodeTable(self.charList)
         self.decoderType = decoderType
         self.mustRestore = mustRestore
         self.snapID = 0
+        self.unrolledRNN = False
+        self.sessionConfig = sessionConfig  # tf.ConfigProto of the session, e.g. its thread pools
+
+        # startup time of each phase (graph build, restore) in seconds
+        self.timings = {}
+        timeSnapshot = time.time()
 
         # Whether to use normalization over a batch or a population
-        self.is_train = tf.placeholder(tf.bool, name='is_train')
+        # (an inference only model always uses the population statistics, without a tf.cond)
+        if self.inferenceOnly:
+            self.is_train = tf.placeholder_with_default(False, shape=[], name='is_train')
+            self.bnTraining = False
+        else:
+            self.is_train = tf.placeholder(tf.bool, name='is_train')
+            self.bnTraining = self.is_train
 
-        # input image batch
+        # input image batch (words are IMAGE_WIDTH wide, text lines use wider width buckets)
         self.inputImgs = tf.placeholder(tf.float32, shape=(
-            None, config.IMAGE_WIDTH, config.IMAGE_HEIGHT))
+            None, None, config.IMAGE_HEIGHT))
 
         # setup CNN, RNN and CTC
         self.setup5LayersCNN()
         self.setupRNN()
         self.setupCTC()
 
-        # setup optimizer to train NN
+        # setup optimizer to train NN (not needed for inference, this also skips restoring the optimizer slots)
         self.batchesTrained = 0
-        self.learningRate = tf.placeholder(tf.float32, shape=[])
-        self.update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
-        with tf.control_dependencies(self.update_ops):
-            self.optimizer = tf.train.RMSPropOptimizer(
-                self.learningRate).minimize(self.loss)
+        if not self.inferenceOnly:
+            self.learningRate = tf.placeholder(tf.float32, shape=[])
+            self.update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
+            with tf.control_dependencies(self.update_ops):
+                self.optimizer = tf.train.RMSPropOptimizer(
+                    self.learningRate).minimize(self.loss)
 
         self.auditModelDetails()
+        self.timings['graph_build'] = time.time() - timeSnapshot
+
         # initialize TF
+        timeSnapshot = time.time()
         (self.sess, self.saver) = self.setupTF()
+        self.timings['restore'] = time.time() - timeSnapshot
 
     def auditModelDetails(self):
         total_parameters = 0
@@ -90,7 +115,7 @@ class Model:
         self.conv1 = tf.nn.conv2d(
             pool, self.kernel1, padding='SAME', strides=(1, 1, 1, 1))
         conv_norm = tf.layers.batch_normalization(
-            self.conv1, training=self.is_train)
+            self.conv1, training=self.bnTraining)
         self.relu1 = tf.nn.relu(conv_norm)
         self.pool1 = tf.nn.max_pool(
             self.relu1, (1, 2, 2, 1), (1, 2, 2, 1), 'VALID')
@@ -99,7 +124,7 @@ class Model:
         self.conv2 = tf.nn.conv2d(
             self.pool1, kernel, padding='SAME', strides=(1, 1, 1, 1))
         conv_norm = tf.layers.batch_normalization(
-            self.conv2, training=self.is_train)
+            self.conv2, training=self.bnTraining)
         relu = tf.nn.relu(conv_norm)
         pool = tf.nn.max_pool(relu, (1, 2, 2, 1), (1, 2, 2, 1), 'VALID')
 
@@ -107,7 +132,7 @@ class Model:
         self.conv3 = tf.nn.conv2d(
             pool, kernel, padding='SAME', strides=(1, 1, 1, 1))
         conv_norm = tf.layers.batch_normalization(
-            self.conv3, training=self.is_train)
+            self.conv3, training=self.bnTraining)
         relu = tf.nn.relu(conv_norm)
         pool = tf.nn.max_pool(relu, (1, 1, 2, 1), (1, 1, 2, 1), 'VALID')
 
@@ -115,7 +140,7 @@ class Model:
         self.conv4 = tf.nn.conv2d(
             pool, kernel, padding='SAME', strides=(1, 1, 1, 1))
         conv_norm = tf.layers.batch_normalization(
-            self.conv4, training=self.is_train)
+            self.conv4, training=self.bnTraining)
         relu = tf.nn.relu(conv_norm)
         pool = tf.nn.max_pool(relu, (1, 1, 2, 1), (1, 1, 2, 1), 'VALID')
 
@@ -123,7 +148,7 @@ class Model:
         self.conv5 = tf.nn.conv2d(
             pool, kernel, padding='SAME', strides=(1, 1, 1, 1))
         conv_norm = tf.layers.batch_normalization(
-            self.conv5, training=self.is_train)
+            self.conv5, training=self.bnTraining)
         relu = tf.nn.relu(conv_norm)
         pool = tf.nn.max_pool(relu, (1, 1, 2, 1), (1, 1, 2, 1), 'VALID')
 
@@ -191,11 +216,19 @@ class Model:
 
         # bidirectional RNN
         # BxTxF -> BxTx2H
-        ((fw, bw), _) = tf.nn.bidirectional_dynamic_rnn(cell_fw=stacked, cell_bw=stacked, inputs=rnnIn3d,
-                                                        dtype=rnnIn3d.dtype)
+        if self.unrolledRNN:
+            # fixed number of time steps, unrolled into plain ops without a while loop (as needed by TFLite)
+            # T x BxF -> T x Bx2H -> BxTx2H -> BxTx1X2H
+            (outputs, _, _) = tf.nn.static_bidirectional_rnn(cell_fw=stacked, cell_bw=stacked,
+                                                             inputs=tf.unstack(rnnIn3d, axis=1),
+                                                             dtype=rnnIn3d.dtype)
+            concat = tf.expand_dims(tf.stack(outputs, axis=1), 2)
+        else:
+            ((fw, bw), _) = tf.nn.bidirectional_dynamic_rnn(cell_fw=stacked, cell_bw=stacked, inputs=rnnIn3d,
+                                                            dtype=rnnIn3d.dtype)
 
-        # BxTxH + BxTxH -> BxTx2H -> BxTx1X2H
-        concat = tf.expand_dims(tf.concat([fw, bw], 2), 2)
+            # BxTxH + BxTxH -> BxTx2H -> BxTx1X2H
+            concat = tf.expand_dims(tf.concat([fw, bw], 2), 2)
 
         # project output to chars (including blank): BxTx1x2H -> BxTx1xC -> BxTxC
         kernel = tf.Variable(tf.truncated_normal(
@@ -220,38 +253,32 @@ class Model:
 
         # calc loss for each element to compute label probability
         self.savedCtcInput = tf.placeholder(
-            tf.float32, shape=[config.MAX_TEXT_LENGTH, None, len(self.charList) + 1])
+            tf.float32, shape=[None, None, len(self.charList) + 1])
         self.lossPerElement = tf.nn.ctc_loss(labels=self.gtTexts, inputs=self.savedCtcInput,
                                              sequence_length=self.seqLen, ctc_merge_repeated=True)
 
         # decoder: either best path decoding or beam search decoding
-        if self.decoderType == config.DecoderType.BestPath:
+        # (no TF decoder when decoding is done in NumPy on the RNN output, see decodeRnnOutput)
+        self.graphDecoderType = self.decoderType
+        if self.decoderType == config.DecoderType.BestPath and config.NUMPY_BEST_PATH_DECODER:
+            self.decoder = None
+        elif self.decoderType == config.DecoderType.BestPath:
             self.decoder = tf.nn.ctc_greedy_decoder(
                 inputs=self.ctcIn3dTBC, sequence_length=self.seqLen)
         elif self.decoderType == config.DecoderType.BeamSearch:
             self.decoder = tf.nn.ctc_beam_search_decoder(inputs=self.ctcIn3dTBC, sequence_length=self.seqLen,
                                                          beam_width=50, merge_repeated=False)
         elif self.decoderType == config.DecoderType.WordBeamSearch:
-            # import compiled word beam search operation (see https://github.com/githubharald/CTCWordBeamSearch)
-            word_beam_search_module = tf.load_op_library('TFWordBeamSearch.so')
-
-            # prepare information about language (dictionary, characters in dataset, characters forming words)
-            chars = str().join(self.charList)
-            wordChars = open(config.fnWordCharList).read().splitlines()[0]
-            corpus = open(config.fnCorpus).read()
-
-            # decode using the "Words" mode of word beam search
-            self.decoder = word_beam_search_module.word_beam_search(tf.nn.softmax(self.ctcIn3dTBC, dim=2), 50, 'Words',
-                                                                    0.0, corpus.encode(
-                                                                        'utf8'), chars.encode('utf8'),
-                                                                    wordChars.encode('utf8'))
+            # word beam search over the corpus runs in NumPy (see WordBeamSearch.py),
+            # the compiled TFWordBeamSearch.so operation is no longer needed
+            self.decoder = None
 
     def setupTF(self):
         "initialize TF"
         print('Python: ' + sys.version)
         print('Tensorflow: ' + tf.__version__)
 
-        sess = tf.Session()  # TF session
+        sess = tf.Session(config=self.sessionConfig)  # TF session
 
         # saver saves model to file
         saver = tf.train.Saver(max_to_keep=config.MAXIMUM_MODELS_TO_KEEP)
@@ -323,15 +350,19 @@ class Model:
         # map labels to chars for all batch elements
         return [str().join([self.charList[c] for c in labelStr]) for labelStr in encodedLabelStrs]
 
+    def sequenceLengths(self, batch):
+        "the NN emits MAX_TEXT_LENGTH time steps per IMAGE_WIDTH pixels of input width"
+        width = batch.imgs.shape[1]
+        return [width * config.MAX_TEXT_LENGTH // config.IMAGE_WIDTH] * len(batch.imgs)
+
     def trainBatch(self, batch):
         "feed a batch into the NN to train it"
-        numBatchElements = len(batch.imgs)
         sparse = self.toSparse(batch.gtTexts)
         rate = 0.01 if self.batchesTrained < 10 else (
             0.001 if self.batchesTrained < 10000 else 0.0001)  # decay learning rate
         evalList = [self.optimizer, self.loss]
         feedDict = {self.inputImgs: batch.imgs, self.gtTexts: sparse,
-                    self.seqLen: [config.MAX_TEXT_LENGTH] * numBatchElements, self.learningRate: rate,
+                    self.seqLen: self.sequenceLengths(batch), self.learningRate: rate,
                     self.is_train: True}
 
         (_, lossVal) = self.sess.run(evalList, feedDict)
@@ -360,13 +391,23 @@ class Model:
 
     def inferBatch(self, batch, calcProbability=False, probabilityOfGT=False):
         "feed a batch into the NN to recognize the texts"
+        (texts, probs, _) = self.inferBatchWithConfidence(
+            batch, calcProbability, probabilityOfGT)
+        return (texts, probs)
+
+    def inferBatchWithConfidence(self, batch, calcProbability=True, probabilityOfGT=False):
+        "feed a batch into the NN to recognize the texts, their probabilities and per character probabilities"
+
+        # TF decoders are fixed when the graph is built, the NumPy decoders run on the RNN output
+        # so decoderType can be switched at any time without rebuilding the graph
+        graphDecoder = self.decoder if self.decoderType == self.graphDecoderType else None
 
         # decode, optionally save RNN output
         numBatchElements = len(batch.imgs)
-        evalRnnOutput = self.dump or calcProbability
-        evalList = [self.decoder] + \
+        evalRnnOutput = self.dump or calcProbability or graphDecoder is None
+        evalList = ([graphDecoder] if graphDecoder is not None else []) + \
             ([self.ctcIn3dTBC] if evalRnnOutput else [])
-        feedDict = {self.inputImgs: batch.imgs, self.seqLen: [config.MAX_TEXT_LENGTH] * numBatchElements,
+        feedDict = {self.inputImgs: batch.imgs, self.seqLen: self.sequenceLengths(batch),
                     self.is_train: False}
 
         evalRes = self.sess.run(evalList, feedDict)
@@ -393,28 +434,91 @@ class Model:
 #         return
 #         ######################################################
 
-        decoded = evalRes[0]
-        texts = self.decoderOutputToText(decoded, numBatchElements)
+        rnnOutput = evalRes[-1] if evalRnnOutput else None
+        if graphDecoder is None:
+            texts = self.decodeRnnOutput(rnnOutput, self.decoderType)
+        else:
+            decoded = evalRes[0]
+            texts = self.decoderOutputToText(decoded, numBatchElements)
 
-        # feed RNN output and recognized text into CTC loss to compute labeling probability
         probs = None
-        if calcProbability:
-            sparse = self.toSparse(
-                batch.gtTexts) if probabilityOfGT else self.toSparse(texts)
-            ctcInput = evalRes[1]
+        charProbs = None
+        if calcProbability and probabilityOfGT:
+            # feed RNN output and ground truth text into CTC loss to compute labeling probability
+            sparse = self.toSparse(batch.gtTexts)
+            ctcInput = rnnOutput
             evalList = self.lossPerElement
             feedDict = {self.savedCtcInput: ctcInput, self.gtTexts: sparse,
-                        self.seqLen: [config.MAX_TEXT_LENGTH] * numBatchElements, self.is_train: False}
+                        self.seqLen: self.sequenceLengths(batch), self.is_train: False}
 
             lossVals = self.sess.run(evalList, feedDict)
 
             probs = np.exp(-lossVals)
+        elif calcProbability:
+            (probs, charProbs) = self.textConfidences(rnnOutput, texts)
 
         # dump the output of the NN to CSV file(s)
         if self.dump:
-            self.dumpNNOutput(evalRes[1])
-
-        return (texts, probs)
+            self.dumpNNOutput(rnnOutput)
+
+        return (texts, probs, charProbs)
+
+    def textConfidences(self, rnnOutput, texts):
+        "probability of the best path and of its characters, straight from the RNN output"
+        (probs, bestLabels, bestProbs) = bestPathConfidence(
+            rnnOutput, len(self.charList))
+
+        # the per character probabilities belong to the best path, other decoders may recognize another text
+        charProbs = [labelProbs if labelsToText(labels, self.charCodes) == text else None
+                     for (text, labels, labelProbs) in zip(texts, bestLabels, bestProbs)]
+        return (probs, charProbs)
+
+    def inferBatchWithDecoders(self, batch, decodings):
+        "feed a batch into the NN once and decode every element with its own (decoderType, beamWidth), None for the default"
+        if all(decoding is None for decoding in decodings):
+            return self.inferBatchWithConfidence(batch)
+
+        rnnOutput = self.computeRnnOutput(batch)
+        texts = [None] * len(decodings)
+        for decoding in set(decodings):
+            indices = [i for (i, other) in enumerate(decodings) if other == decoding]
+            (decoderType, beamWidth) = decoding if decoding is not None else (self.decoderType, None)
+            decoded = self.decodeRnnOutput(rnnOutput[:, indices, :], decoderType, beamWidth)
+            for (i, text) in zip(indices, decoded):
+                texts[i] = text
+
+        (probs, charProbs) = self.textConfidences(rnnOutput, texts)
+        return (texts, probs, charProbs)
+
+    def computeRnnOutput(self, batch):
+        "feed a batch into the NN and return its TxBxC output, to be decoded outside of the graph"
+        feedDict = {self.inputImgs: batch.imgs, self.is_train: False}
+        return self.sess.run(self.ctcIn3dTBC, feedDict)
+
+    def decodeRnnOutput(self, rnnOutput, decoderType, beamWidth=None):
+        "decode a TxBxC RNN output in NumPy with the given decoder type (and beam width for the beam searches)"
+        beamWidth = beamWidth or config.BEAM_WIDTH
+        if decoderType == config.DecoderType.BestPath:
+            return bestPathDecode(rnnOutput, self.charCodes)
+        if decoderType == config.DecoderType.BeamSearch:
+            return prefixBeamSearch(rnnOutput, self.charCodes, beamWidth)
+        if decoderType == config.DecoderType.WordBeamSearch:
+            return wordBeamSearch(rnnOutput, self.charList, self.charCodes, beamWidth)
+        raise Exception('No NumPy decoder for decoder type ' + str(decoderType))
+
+    def replicate(self):
+        "a copy of the model sharing its graph, with its own session (and thread pools) holding the same weights"
+        replica = copy.copy(self)
+        replica.timings = {}
+        timeSnapshot = time.time()
+        replica.sess = tf.Session(graph=self.sess.graph, config=self.sessionConfig)
+
+        # Variable.load feeds the value into the existing initializer, no op is added to the shared graph
+        variables = self.sess.graph.get_collection(tf.GraphKeys.GLOBAL_VARIABLES)
+        for (variable, value) in zip(variables, self.sess.run(variables)):
+            variable.load(value, replica.sess)
+        replica.timings['restore'] = time.time() - timeSnapshot
+        return replica
 
     def save(self):
         "save model to file"
@@ -0,0 +1,168 @@
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import os
+import re
+import shutil
+import threading
+import numpy as np
+from app.models.crnn_ctc_model.CTCDecoder import labelsToText, logSoftmax
+from config import config
+
+# tries already loaded by this process, by corpus file (and modification time) and character list
+loadedTries = {}
+loadedTriesLock = threading.Lock()
+
+
+class PrefixTrie:
+    "compact prefix trie over label ids: the children of node n are the edges edgeStart[n]:edgeStart[n + 1]"
+
+    FIELDS = ('edgeStart', 'edgeLabel', 'edgeChild', 'isWord')
+
+    def __init__(self, edgeStart, edgeLabel, edgeChild, isWord):
+        self.edgeStart = edgeStart
+        self.edgeLabel = edgeLabel
+        self.edgeChild = edgeChild
+        self.isWord = isWord
+
+    @staticmethod
+    def fromWords(paraWords, paraCharList):
+        "build the trie of a list of words, node 0 is the root (the empty prefix)"
+        labelOf = {c: i for (i, c) in enumerate(paraCharList)}
+        children = [{}]
+        isWord = [False]
+        for word in paraWords:
+            # words the NN can not spell are left out
+            if any(c not in labelOf for c in word):
+                continue
+
+            node = 0
+            for c in word:
+                label = labelOf[c]
+                if label not in children[node]:
+                    children[node][label] = len(children)
+                    children.append({})
+                    isWord.append(False)
+                node = children[node][label]
+            isWord[node] = True
+
+        # flatten the nested dicts into CSR style arrays, edges of a node sorted by label
+        edgeStart = np.zeros(len(children) + 1, dtype=np.int32)
+        edgeStart[1:] = np.cumsum([len(edges) for edges in children])
+        edgeLabel = np.array([label for edges in children for label in sorted(edges)], dtype=np.int32)
+        edgeChild = np.array([edges[label] for edges in children for label in sorted(edges)], dtype=np.int32)
+        return PrefixTrie(edgeStart, edgeLabel, edgeChild, np.array(isWord, dtype=bool))
+
+    def save(self, paraPath):
+        "save the arrays as .npy files, written to a temporary directory first so readers never see a partial trie"
+        tmpPath = paraPath + '.' + str(os.getpid()) + '.tmp'
+        os.makedirs(tmpPath, exist_ok=True)
+        for name in PrefixTrie.FIELDS:
+            np.save(os.path.join(tmpPath, name + '.npy'), getattr(self, name))
+        try:
+            os.rename(tmpPath, paraPath)
+        except OSError:
+            # another worker saved the same trie in the meantime
+            shutil.rmtree(tmpPath, ignore_errors=True)
+
+    @staticmethod
+    def load(paraPath):
+        "memory-map a saved trie, the pages are shared by all workers reading the same files"
+        return PrefixTrie(*[np.load(os.path.join(paraPath, name + '.npy'), mmap_mode='r')
+                            for name in PrefixTrie.FIELDS])
+
+    def children(self, paraNode):
+        "labels and child nodes of the edges leaving a node"
+        (start, end) = (self.edgeStart[paraNode], self.edgeStart[paraNode + 1])
+        return (self.edgeLabel[start:end], self.edgeChild[start:end])
+
+    def isComplete(self, paraNode):
+        "whether the prefix of a node is empty or a complete word"
+        return paraNode == 0 or bool(self.isWord[paraNode])
+
+
+def wordCharacters(paraCharList):
+    "the characters words are made of: wordCharList.txt if it exists, otherwise the letters and digits of the list"
+    if os.path.isfile(config.fnWordCharList):
+        return open(config.fnWordCharList, encoding="utf-8").read().splitlines()[0]
+    return str().join([c for c in paraCharList if c.isalnum()])
+
+
+def loadCorpusTrie(paraCharList, paraFnCorpus=config.fnCorpus, paraCachePath=config.fnCorpusTrie):
+    "trie of the corpus words, built once and cached on disk next to the corpus"
+    cacheKey = (paraFnCorpus, os.path.getmtime(paraFnCorpus), paraCharList)
+
+    with loadedTriesLock:
+        if cacheKey not in loadedTries:
+            # the saved trie is found by a digest of everything it is built from
+            corpus = open(paraFnCorpus, encoding="utf-8").read()
+            wordChars = wordCharacters(paraCharList)
+            digest = hashlib.blake2b((corpus + '\0' + paraCharList + '\0' + wordChars).encode('utf-8'),
+                                     digest_size=8).hexdigest()
+            path = os.path.join(paraCachePath, digest)
+
+            if not os.path.isdir(path):
+                words = set(re.findall('[' + re.escape(wordChars) + ']+', corpus))
+                os.makedirs(paraCachePath, exist_ok=True)
+                PrefixTrie.fromWords(sorted(words), paraCharList).save(path)
+                print('Saved corpus trie of', len(words), 'words to ' + path)
+            loadedTries[cacheKey] = (PrefixTrie.load(path), wordChars)
+        return loadedTries[cacheKey]
+
+
+def wordBeamSearchSingle(paraProbs, paraTrie, paraNonWordLabels, paraBeamWidth, paraPruneProbability):
+    "word beam search over the (T, C) probabilities of a single batch element, returns the best labeling"
+    blank = paraProbs.shape[1] - 1
+
+    # beams by labeling: [probability ending in blank, probability ending in non-blank, trie node of the current word]
+    beams = {(): [1.0, 0.0, 0]}
+    for frame in paraProbs:
+        # characters below the pruning probability are never used to extend a beam in this frame
+        likely = frame >= paraPruneProbability
+        likelyNonWordLabels = paraNonWordLabels[likely[paraNonWordLabels]].tolist()
+
+        bestBeams = sorted(beams.items(), key=lambda beam: beam[1][0] + beam[1][1], reverse=True)[:paraBeamWidth]
+        beams = {}
+        for (labels, (prBlank, prNonBlank, node)) in bestBeams:
+            prTotal = prBlank + prNonBlank
+
+            # same labeling: the last character is repeated or a blank follows
+            beam = beams.setdefault(labels, [0.0, 0.0, node])
+            if labels:
+                beam[1] += prNonBlank * frame[labels[-1]]
+            beam[0] += prTotal * frame[blank]
+
+            # extensions: word characters following the trie, non-word characters once the word is complete
+            (childLabels, childNodes) = paraTrie.children(node)
+            mask = likely[childLabels]
+            extensions = list(zip(childLabels[mask].tolist(), childNodes[mask].tolist()))
+            if paraTrie.isComplete(node):
+                extensions += [(c, 0) for c in likelyNonWordLabels]
+
+            for (c, child) in extensions:
+                # a repeated character must be separated by a blank
+                pr = prBlank if labels and labels[-1] == c else prTotal
+                beam = beams.setdefault(labels + (c,), [0.0, 0.0, child])
+                beam[1] += pr * frame[c]
+
+    # the best labeling whose last word is complete, otherwise the best one
+    ranked = sorted(beams.items(), key=lambda beam: beam[1][0] + beam[1][1], reverse=True)
+    for (labels, (_, _, node)) in ranked:
+        if paraTrie.isComplete(node):
+            return labels
+    return ranked[0][0]
+
+
+def wordBeamSearch(paraLogits, paraCharList, paraCharCodes, paraBeamWidth=config.BEAM_WIDTH,
+                   paraPruneProbability=config.BEAM_PRUNE_PROBABILITY):
+    "lexicon constrained beam search over a (T, B, C) batch of logits: every word of the texts is a corpus word"
+    (trie, wordChars) = loadCorpusTrie(paraCharList)
+    nonWordLabels = np.array([i for (i, c) in enumerate(paraCharList) if c not in wordChars], dtype=np.int32)
+
+    probs = np.exp(logSoftmax(paraLogits.astype(np.float64)))
+    texts = []
+    for b in range(probs.shape[1]):
+        labels = wordBeamSearchSingle(probs[:, b, :], trie, nonWordLabels, paraBeamWidth, paraPruneProbability)
+        texts.append(labelsToText(np.array(labels, dtype=np.int64), paraCharCodes))
+    return texts
@@ -0,0 +1,138 @@
+"""
+Pre-fork serving: `python -m app.prefork --workers N`.
+
+The master imports the application (TensorFlow is imported, but no graph, session or thread pool
+is created) and binds the socket once, then forks the workers. Only the imported code stays shared
+(copy-on-write) between all workers. The weights are not: every worker builds its own session, which
+restores (session backend) or parses (frozen backend) a private copy of them, and TFLite maps its model
+files itself, which the page cache shares without the master. Mapping the model files in the master
+only warms the page cache for the first worker.
+"""
+import argparse
+import os
+import signal
+import socket
+import time
+import uvicorn
+from config import config
+
+
+def bind_socket(host, port):
+    """
+    Listening socket inherited by every worker, the kernel spreads the connections over them.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload_shared():
+    """
+    Load everything that can be shared copy-on-write before forking: the application modules and the
+    corpus trie of the word beam search. The model files are read once into the page cache.
+    """
+    from app.models.crnn_ctc_model.Artifacts import artifactPaths, mapArtifacts
+
+    start = time.time()
+    import app.main  # noqa: F401
+
+    mapped_bytes = mapArtifacts(artifactPaths(config.INFERENCE_BACKEND))
+    if os.path.isfile(config.fnCorpus):
+        from app.models.crnn_ctc_model.WordBeamSearch import loadCorpusTrie
+
+        loadCorpusTrie(open(config.fnCharList, encoding="utf-8").read())
+
+    print(f"Master {os.getpid()}: imported the application and read {mapped_bytes / (1024 * 1024):.1f} MB "
+          f"of {config.INFERENCE_BACKEND} model files into the page cache in {time.time() - start:.2f} sec")
+
+
+def run_worker(sock, host, port):
+    """
+    Serve the application on the inherited socket, in a freshly forked worker.
+    """
+    from app.main import app
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port))
+    server.run(sockets=[sock])
+
+
+def spawn_worker(sock, host, port):
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            run_worker(sock, host, port)
+        except BaseException as e:
+            print(f"Worker {os.getpid()} failed: {e}")
+            status = 1
+        finally:
+            os._exit(status)
+    print(f"Master {os.getpid()}: started worker {pid}")
+    return pid
+
+
+def report_memory(workers):
+    """
+    Log the memory of the master and of every worker, the PSS of all of them adds up to the real footprint.
+    """
+    from app.utils.processMemory import report
+
+    report([os.getpid()] + sorted(workers))
+
+
+def serve(host, port, workers, memory_report_seconds=config.PREFORK_MEMORY_REPORT_SECONDS):
+    """
+    Fork the workers and keep them running (a worker that dies is replaced) until SIGTERM or SIGINT.
+    """
+    # the thread budget check of every worker counts the workers through the uvicorn variable
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    preload_shared()
+    sock = bind_socket(host, port)
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+
+    children = {spawn_worker(sock, host, port) for _ in range(workers)}
+    report_at = time.time() + memory_report_seconds if memory_report_seconds > 0 else None
+
+    while not stopping:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid in children:
+            children.remove(pid)
+            print(f"Master {os.getpid()}: worker {pid} exited with status {status}, starting a new one")
+            children.add(spawn_worker(sock, host, port))
+            continue
+
+        if report_at is not None and time.time() >= report_at:
+            report_memory(children)
+            report_at = None
+        time.sleep(0.5)
+
+    print(f"Master {os.getpid()}: stopping {len(children)} worker(s)")
+    for pid in children:
+        os.kill(pid, signal.SIGTERM)
+    for pid in children:
+        os.waitpid(pid, 0)
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve the API from workers forked after loading the application and the model files once')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=config.PREFORK_WORKERS)
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,186 @@
-from fastapi import APIRouter, UploadFile, File
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request
 from starlette.responses import JSONResponse
-from app.services.imageService import ImageService
-
-
-# Initialize the ImageService
-image_service = ImageService()
+from app.services.engines import load_service, loaded_service
+from app.services.inferenceExecutor import run_blocking, with_timeout
+from app.services.pagePipeline import collect_pages, pages_as_rows
+from app.services.resultCache import cached
+from app.utils.uploads import read_upload_contents
+from app.utils.responses import negotiated_response, requested_image_quality, streaming_response
+from config import config
 
 
 # Create a router with a prefix
 crnnRouter = APIRouter()
 
 
+def requested_decoding(decoder, beam_width):
+    """
+    The (decoderType, beamWidth) a request asked for with ?decoder=best|beam|word&beam_width=,
+    or None to decode with the configured decoder. A beam_width alone applies to the configured decoder;
+    asking for a beam width of the best path decoder is answered with 422.
+    """
+    decoder_type = config.DECODERS[decoder] if decoder is not None else config.DECODER_TYPE
+    if beam_width is not None and decoder_type == config.DecoderType.BestPath:
+        raise HTTPException(status_code=422, detail="beam_width only applies to the beam search decoders")
+    if decoder is None and beam_width is None:
+        return None
+    return (decoder_type, beam_width)
+
+
+async def recognize(contents, endpoint, image_format=None, image_quality=None, decoding=None, mode="words"):
+    """
+    Run the OCR pipeline for an uploaded image off the event loop, bounded by the request timeout.
+    Identical uploads with identical settings are answered from the result cache.
+    Text lines (mode="lines") are batched per width bucket and bypass the word batch scheduler.
+    """
+    async def compute():
+        image_service = await load_service('crnn')
+        if config.SCHEDULER_ENABLED and mode == "words":
+            return await image_service.process_image_scheduled(contents, image_format, image_quality, decoding)
+        return await run_blocking(image_service.process_image, contents, image_format, image_quality, decoding, mode)
+
+    settings = ("crnn", endpoint, image_format, image_quality, config.DECODER_TYPE, decoding, mode)
+    return await with_timeout(cached(contents, settings, compute))
+
+
 @crnnRouter.post("/chunks")
-async def chunks(image: UploadFile = File(...)):
+async def chunks(
+    request: Request,
+    image: UploadFile = File(...),
+    include_images: bool = False,
+    image_format: str = Query("png", regex="^(png|webp|jpeg)$"),
+    image_quality: Optional[int] = Query(None, ge=0, le=100),
+    decoder: Optional[str] = Query(None, regex="^(best|beam|word)$"),
+    beam_width: Optional[int] = Query(None, ge=1, le=config.MAX_BEAM_WIDTH),
+    mode: str = Query("words", regex="^(words|lines)$"),
+):
     """
     Endpoint to process an image and return recognized words as chunks.
+    Every chunk holds the label, bounding box (x, y, w, h), row index and reading order;
+    word images are only encoded and returned with include_images=true.
+    decoder=best|beam|word (and beam_width) picks the CTC decoder of this request: best path is the fastest,
+    the beam searches trade latency for accuracy.
+    With mode=lines every chunk is a whole text line, recognized in one inference instead of one per word.
+    The response is JSON, MessagePack or CBOR depending on the Accept header.
     """
+    image_quality = requested_image_quality(image_format, image_quality)
+    decoding = requested_decoding(decoder, beam_width)
     try:
         contents = await image.read()
-        results = image_service.process_image(contents)
-        return JSONResponse(content=results)
+        results = await recognize(
+            contents, "chunks", image_format if include_images else None, image_quality, decoding, mode
+        )
+        return await run_blocking(negotiated_response, request, results)
+    except asyncio.TimeoutError:
+        return JSONResponse(
+            status_code=504,
+            content={"error": "Request timed out"},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)},
+        )
+
+@crnnRouter.post("/chunks/stream")
+async def chunks_stream(
+    request: Request,
+    image: UploadFile = File(...),
+    format: str = Query("ndjson", regex="^(ndjson|sse)$"),
+    include_images: bool = False,
+    image_format: str = Query("png", regex="^(png|webp|jpeg)$"),
+    image_quality: Optional[int] = Query(None, ge=0, le=100),
+    decoder: Optional[str] = Query(None, regex="^(best|beam|word)$"),
+    beam_width: Optional[int] = Query(None, ge=1, le=config.MAX_BEAM_WIDTH),
+):
+    """
+    Streaming variant of /chunks: every word is sent as soon as its row is recognized,
+    as NDJSON lines or Server-Sent Events (format=sse).
+    """
+    image_quality = requested_image_quality(image_format, image_quality)
+    contents = await image.read()
+    image_service = await load_service('crnn')
+    rows = image_service.stream_image(
+        contents, image_format if include_images else None, image_quality, requested_decoding(decoder, beam_width)
+    )
+    return streaming_response(request, rows, format)
+
+@crnnRouter.post("/document")
+async def document(
+    request: Request,
+    image: UploadFile = File(...),
+    format: Optional[str] = Query(None, regex="^(ndjson|sse)$"),
+    include_images: bool = False,
+    image_format: str = Query("png", regex="^(png|webp|jpeg)$"),
+    image_quality: Optional[int] = Query(None, ge=0, le=100),
+    decoder: Optional[str] = Query(None, regex="^(best|beam|word)$"),
+    beam_width: Optional[int] = Query(None, ge=1, le=config.MAX_BEAM_WIDTH),
+):
+    """
+    Endpoint to recognize a multi-page PDF or TIFF document (or a single image) and return the words of every page.
+    With format=ndjson or format=sse every page is streamed as soon as it is recognized.
+    """
+    image_quality = requested_image_quality(image_format, image_quality)
+    contents = await image.read()
+    image_service = await load_service('crnn')
+    pages = image_service.process_document(
+        contents, image_format if include_images else None, image_quality, requested_decoding(decoder, beam_width)
+    )
+    if format is not None:
+        return streaming_response(request, pages_as_rows(pages), format, config.DOCUMENT_TIMEOUT_SECONDS)
+
+    try:
+        results = await with_timeout(collect_pages(pages), config.DOCUMENT_TIMEOUT_SECONDS)
+        return await run_blocking(negotiated_response, request, {"pages": results})
+    except asyncio.TimeoutError:
+        return JSONResponse(
+            status_code=504,
+            content={"error": "Request timed out"},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)},
+        )
+
+@crnnRouter.post("/batch")
+async def batch(
+    request: Request,
+    files: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    include_images: bool = False,
+    image_format: str = Query("png", regex="^(png|webp|jpeg)$"),
+    image_quality: Optional[int] = Query(None, ge=0, le=100),
+    decoder: Optional[str] = Query(None, regex="^(best|beam|word)$"),
+    beam_width: Optional[int] = Query(None, ge=1, le=config.MAX_BEAM_WIDTH),
+):
+    """
+    Endpoint to recognize many images in one call, uploaded as files and/or a zip archive.
+    The words of all images are recognized together in shared batches; returns the results per image.
+    """
+    image_quality = requested_image_quality(image_format, image_quality)
+    uploads = await run_blocking(read_upload_contents, files, archive)
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No images provided")
+
+    names = [name for name, _ in uploads]
+    decoding = requested_decoding(decoder, beam_width)
+    try:
+        image_service = await load_service('crnn')
+        results = await with_timeout(run_blocking(
+            image_service.process_images, [contents for _, contents in uploads],
+            image_format if include_images else None, image_quality, decoding
+        ))
+        return await run_blocking(negotiated_response, request, {"results": [
+            {"name": name, "words": words} for name, words in zip(names, results)
+        ]})
+    except asyncio.TimeoutError:
+        return JSONResponse(
+            status_code=504,
+            content={"error": "Request timed out"},
+        )
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -27,17 +188,45 @@ async def chunks(image: UploadFile = File(...)):
         )
 
 @crnnRouter.post("/merged")
-async def merged(image: UploadFile = File(...)):
+async def merged(
+    request: Request,
+    image: UploadFile = File(...),
+    decoder: Optional[str] = Query(None, regex="^(best|beam|word)$"),
+    beam_width: Optional[int] = Query(None, ge=1, le=config.MAX_BEAM_WIDTH),
+    mode: str = Query("words", regex="^(words|lines)$"),
+):
     """
     Endpoint to process an image and return all recognized words as a single string.
     """
+    decoding = requested_decoding(decoder, beam_width)
     try:
         contents = await image.read()
-        results = image_service.process_image(contents)
+        results = await recognize(contents, "merged", decoding=decoding, mode=mode)
         merged_text = " ".join([result["label"] for result in results if "label" in result])
-        return {"text": merged_text}
+        return negotiated_response(request, {"text": merged_text})
+    except asyncio.TimeoutError:
+        return JSONResponse(
+            status_code=504,
+            content={"error": "Request timed out"},
+        )
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"error": str(e)},
         )
+
+
+@crnnRouter.get("/stats")
+async def stats():
+    """
+    Endpoint to report queue depth and batch fill statistics of the batch scheduler,
+    the load of the model replicas and the hit rate of the word cache.
+    """
+    image_service = loaded_service('crnn')
+    if image_service is None:
+        return {"scheduler": None, "replicas": None, "word_cache": None}
+    return {
+        "scheduler": image_service.scheduler.stats(),
+        "replicas": image_service.model.stats(),
+        "word_cache": image_service.word_cache.stats() if image_service.word_cache is not None else None,
+    }
@@ -0,0 +1,53 @@
+from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from app.services.engines import get_image_service, get_tesseract_service
+from app.services.inferenceExecutor import run_blocking
+from app.services.jobService import JobManager
+from app.utils.uploads import read_uploads
+
+jobsRouter = APIRouter()
+
+# Workers reuse the recognition services (and the loaded model) of the other routers,
+# loading an engine only when a job needs it
+job_manager = JobManager(get_image_service, get_tesseract_service)
+
+
+@jobsRouter.post("")
+async def submit_job(
+    files: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    engine: str = Query("crnn", regex="^(crnn|tesseract)$"),
+):
+    """
+    Endpoint to submit a bulk OCR job: any number of images and/or a zip archive of images.
+    Returns the job id to poll for status and results.
+    """
+    uploads = read_uploads(files, archive)
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No images provided")
+
+    job_id = await run_blocking(job_manager.store.create_job, engine, uploads)
+    return {"job_id": job_id, "total": len(uploads)}
+
+
+@jobsRouter.get("/{job_id}")
+async def job_status(job_id: str):
+    """
+    Endpoint to report the status and progress of a job.
+    """
+    job = await run_blocking(job_manager.store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@jobsRouter.get("/{job_id}/results")
+async def job_results(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """
+    Endpoint to fetch the per-image results of a job, a page at a time.
+    """
+    job = await run_blocking(job_manager.store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    results = await run_blocking(job_manager.store.get_results, job_id, offset, limit)
+    return {"job": job, "results": results}
@@ -1,39 +1,162 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from starlette.responses import JSONResponse
-from app.services.tesseractService import ArabicTextRecognitionService
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request
+from app.services.engines import load_service, loaded_service
+from app.services.inferenceExecutor import run_blocking, with_timeout
+from app.services.pagePipeline import collect_pages, pages_as_rows
+from app.services.resultCache import cached
+from app.utils.uploads import read_upload_contents
+from app.utils.responses import negotiated_response, requested_image_quality, streaming_response
+from config import config
 
 tesseractRouter = APIRouter()
 
-service = ArabicTextRecognitionService()
-
 @tesseractRouter.post("/chunks")
-async def recognize_arabic_text(image: UploadFile = File(...)):
+async def recognize_arabic_text(
+    request: Request,
+    image: UploadFile = File(...),
+    mode: str = Query('segment', regex='^(segment|page)$'),
+    include_images: bool = False,
+    image_format: str = Query('png', regex='^(png|webp|jpeg)$'),
+    image_quality: Optional[int] = Query(None, ge=0, le=100),
+):
     """
     Endpoint to process an uploaded image and recognize Arabic text.
+    mode=segment runs Tesseract on each word found by our segmentation, mode=page runs it once on the whole page.
+    Word images are only encoded and returned with include_images=true.
+    The response is JSON, MessagePack or CBOR depending on the Accept header.
     """
+    image_quality = requested_image_quality(image_format, image_quality)
     try:
         # Check file type
         # Read file contents
         image_contents = await image.read()
+        service = await load_service('tesseract')
         # Recognize Arabic text from the image
-        response = service.recognize_text(image_contents)
-        return JSONResponse(content=response)
+        image_format = image_format if include_images else None
+        response = await with_timeout(cached(
+            image_contents, ("tesseract", "chunks", mode, image_format, image_quality),
+            lambda: run_blocking(
+                service.recognize_text, image_contents, mode=mode, image_format=image_format, image_quality=image_quality
+            )
+        ))
+        return await run_blocking(negotiated_response, request, response)
+
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Request timed out")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@tesseractRouter.post("/chunks/stream")
+async def recognize_arabic_text_stream(
+    request: Request,
+    image: UploadFile = File(...),
+    mode: str = Query('segment', regex='^(segment|page)$'),
+    format: str = Query('ndjson', regex='^(ndjson|sse)$'),
+    include_images: bool = False,
+    image_format: str = Query('png', regex='^(png|webp|jpeg)$'),
+    image_quality: Optional[int] = Query(None, ge=0, le=100),
+):
+    """
+    Streaming variant of /chunks: every word is sent as soon as its row is recognized,
+    as NDJSON lines or Server-Sent Events (format=sse).
+    """
+    image_quality = requested_image_quality(image_format, image_quality)
+    image_contents = await image.read()
+    service = await load_service('tesseract')
+    rows = service.stream_text(image_contents, mode, image_format if include_images else None, image_quality)
+    return streaming_response(request, rows, format)
+
+@tesseractRouter.post("/document")
+async def recognize_arabic_document(
+    request: Request,
+    image: UploadFile = File(...),
+    mode: str = Query('segment', regex='^(segment|page)$'),
+    format: Optional[str] = Query(None, regex='^(ndjson|sse)$'),
+    include_images: bool = False,
+    image_format: str = Query('png', regex='^(png|webp|jpeg)$'),
+    image_quality: Optional[int] = Query(None, ge=0, le=100),
+):
+    """
+    Endpoint to recognize a multi-page PDF or TIFF document (or a single image) and return the words of every page.
+    With format=ndjson or format=sse every page is streamed as soon as it is recognized.
+    """
+    image_quality = requested_image_quality(image_format, image_quality)
+    image_contents = await image.read()
+    service = await load_service('tesseract')
+    pages = service.recognize_document(image_contents, mode, image_format if include_images else None, image_quality)
+    if format is not None:
+        return streaming_response(request, pages_as_rows(pages), format, config.DOCUMENT_TIMEOUT_SECONDS)
+
+    try:
+        results = await with_timeout(collect_pages(pages), config.DOCUMENT_TIMEOUT_SECONDS)
+        return await run_blocking(negotiated_response, request, {"pages": results})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Request timed out")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@tesseractRouter.post("/batch")
+async def recognize_arabic_batch(
+    request: Request,
+    files: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    include_images: bool = False,
+    image_format: str = Query('png', regex='^(png|webp|jpeg)$'),
+    image_quality: Optional[int] = Query(None, ge=0, le=100),
+):
+    """
+    Endpoint to recognize many images in one call, uploaded as files and/or a zip archive.
+    The words of all images are recognized together in shared batches; returns the results per image.
+    """
+    image_quality = requested_image_quality(image_format, image_quality)
+    uploads = await run_blocking(read_upload_contents, files, archive)
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No images provided")
 
+    names = [name for name, _ in uploads]
+    try:
+        service = await load_service('tesseract')
+        results = await with_timeout(run_blocking(
+            service.recognize_images, [contents for _, contents in uploads],
+            image_format if include_images else None, image_quality
+        ))
+        return await run_blocking(negotiated_response, request, {"results": [
+            {"name": name, "words": words} for name, words in zip(names, results)
+        ]})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Request timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @tesseractRouter.post("/merged")
-async def recognize_arabic_text(image: UploadFile = File(...)):
+async def recognize_arabic_text(request: Request, image: UploadFile = File(...), mode: str = Query('segment', regex='^(segment|page)$')):
     """
     Endpoint to process an uploaded image and recognize Arabic text.
     """
     try:
         # Read file contents
         image_contents = await image.read()
+        service = await load_service('tesseract')
         # Recognize Arabic text from the image
-        results = service.recognize_text(image_contents, type='merged')
+        results = await with_timeout(cached(
+            image_contents, ("tesseract", "merged", mode),
+            lambda: run_blocking(service.recognize_text, image_contents, type='merged', mode=mode)
+        ))
         merged_text = " ".join([result["label"] for result in results if "label" in result])
-        return {"text": merged_text}
+        return negotiated_response(request, {"text": merged_text})
 
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Request timed out")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@tesseractRouter.get("/stats")
+async def stats():
+    """
+    Endpoint to report the hit rate of the word cache.
+    """
+    service = loaded_service('tesseract')
+    if service is None or service.word_cache is None:
+        return {"word_cache": None}
+    return {"word_cache": service.word_cache.stats()}
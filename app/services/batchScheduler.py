@@ -0,0 +1,136 @@
+import asyncio
+from app.models.crnn_ctc_model.Main import inferImages
+from app.services.inferenceExecutor import run_blocking
+from config import config
+
+
+class BatchScheduler:
+    """
+    Collects word images from concurrent requests into shared batches and runs
+    one forward pass per batch, handing every caller back its own results.
+    Up to max_concurrent_batches batches run at the same time (one per model replica).
+    """
+
+    def __init__(self, model, max_batch_size=config.SCHEDULER_MAX_BATCH_SIZE,
+                 max_wait_ms=config.SCHEDULER_MAX_WAIT_MS, word_cache=None, max_concurrent_batches=1):
+        self.model = model
+        self.word_cache = word_cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_concurrent_batches = max_concurrent_batches
+        self.queue = None
+        self.worker = None
+
+        # statistics
+        self.batches_run = 0
+        self.words_processed = 0
+        self.max_queue_depth = 0
+
+    def _ensure_started(self):
+        """
+        Start the batching loop on the running event loop the first time it is needed.
+        """
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.ensure_future(self._run())
+
+    async def infer(self, word_images, decoding=None):
+        """
+        Recognize a list of word images, returning (text, probability, character probabilities)
+        for every word in the same order. decoding is an optional (decoderType, beamWidth): words of
+        callers asking for different decoders still share the forward pass, only the decoding differs.
+        """
+        self._ensure_started()
+        loop = asyncio.get_event_loop()
+
+        futures = []
+        for word_img in word_images:
+            future = loop.create_future()
+            self.queue.put_nowait((word_img, decoding, future))
+            futures.append(future)
+
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self):
+        """
+        Wait for the first word, then keep collecting until the batch is full or the wait time is over.
+        """
+        loop = asyncio.get_event_loop()
+        items = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(items) < self.max_batch_size:
+            # take whatever is already queued without yielding to the loop
+            if not self.queue.empty():
+                items.append(self.queue.get_nowait())
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return items
+
+    async def _run(self):
+        """
+        Batching loop: a batch is collected as soon as a forward pass slot is free,
+        so words keep queuing up for the next batch while all slots are busy.
+        """
+        slots = asyncio.Semaphore(self.max_concurrent_batches)
+        while True:
+            await slots.acquire()
+            items = await self._collect()
+
+            # callers that gave up (e.g. cancelled requests) do not need inference
+            items = [(img, decoding, future) for img, decoding, future in items if not future.done()]
+            if not items:
+                slots.release()
+                continue
+
+            asyncio.ensure_future(self._run_batch(items, slots))
+
+    async def _run_batch(self, items, slots):
+        """
+        One forward pass over the model, then free the slot.
+        """
+        try:
+            recognized_words = await run_blocking(
+                inferImages, self.model, [img for img, _, _ in items], self.max_batch_size, self.word_cache, True,
+                [decoding for _, decoding, _ in items]
+            )
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            slots.release()
+
+        self.batches_run += 1
+        self.words_processed += len(items)
+
+        for (_, _, future), recognized in zip(items, recognized_words):
+            if not future.done():
+                future.set_result(recognized)
+
+    def stats(self):
+        """
+        Queue depth and batch fill statistics.
+        """
+        average_batch_size = self.words_processed / self.batches_run if self.batches_run else 0.0
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "batches_run": self.batches_run,
+            "words_processed": self.words_processed,
+            "average_batch_size": average_batch_size,
+            "average_batch_fill": average_batch_size / self.max_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_concurrent_batches": self.max_concurrent_batches,
+        }
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+import numpy as np
+from app.services.inferenceExecutor import run_blocking
+from app.utils.processMemory import memory_usage
+from config import config
+
+# Recognition services are created on first use (or at startup for config.PRELOAD_ENGINES),
+# so a worker serving a single engine never builds the other one.
+_lock = threading.Lock()
+_services = {}
+_warmed_up = set()
+
+# startup time of every phase in seconds, e.g. {"import": ..., "crnn.graph_build": ...}
+timings = {}
+
+
+def _create(engine):
+    if engine == 'crnn':
+        from app.services.imageService import ImageService
+
+        service = ImageService()
+        for phase, seconds in service.model.timings.items():
+            timings['crnn.' + phase] = seconds
+        return service
+
+    from app.services.tesseractService import ArabicTextRecognitionService
+
+    start = time.time()
+    service = ArabicTextRecognitionService()
+    timings['tesseract.setup'] = time.time() - start
+    return service
+
+
+def get_service(engine):
+    """
+    Return the recognition service of an engine ('crnn' or 'tesseract'), loading it on first use.
+    """
+    service = _services.get(engine)
+    if service is None:
+        with _lock:
+            service = _services.get(engine)
+            if service is None:
+                service = _create(engine)
+                _services[engine] = service
+    return service
+
+
+def loaded_service(engine):
+    """
+    Return the recognition service of an engine if it is already loaded, None otherwise.
+    """
+    return _services.get(engine)
+
+
+def get_image_service():
+    return get_service('crnn')
+
+
+def get_tesseract_service():
+    return get_service('tesseract')
+
+
+async def load_service(engine):
+    """
+    Same as get_service, but a first-time load runs on the inference executor instead of the event loop.
+    """
+    service = _services.get(engine)
+    if service is None:
+        service = await run_blocking(get_service, engine)
+    return service
+
+
+def synthetic_word(width=96, height=40):
+    """
+    A white image with a dark stroke, shaped like a segmented word.
+    """
+    img = np.full((height, width), 255, dtype=np.uint8)
+    img[height // 3:2 * height // 3, width // 8:7 * width // 8] = 0
+    return img
+
+
+def warm_up(engine):
+    """
+    Run synthetic work through an engine so that the first real request does not pay for
+    TF kernel selection, allocator growth or loading the Tesseract language data.
+    """
+    service = get_service(engine)
+
+    start = time.time()
+    if engine == 'crnn':
+        from app.models.crnn_ctc_model.Main import inferImages
+
+        # every replica has its own session, so each one is warmed up on its own
+        for replica in service.model.replicas:
+            for batch_size in config.WARMUP_BATCH_SIZES:
+                inferImages(replica, [synthetic_word()] * batch_size, batch_size)
+    else:
+        service.recognize_group([synthetic_word()])
+    timings[engine + '.warm_up'] = time.time() - start
+
+    _warmed_up.add(engine)
+
+
+def preload():
+    """
+    Load and warm up every engine listed in config.PRELOAD_ENGINES.
+    """
+    for engine in config.PRELOAD_ENGINES:
+        try:
+            warm_up(engine)
+        except Exception as e:
+            print(f"Error while loading engine {engine}: {e}")
+
+    usage = memory_usage()
+    if usage is not None:
+        print(f"Worker {os.getpid()}: engines loaded, RSS {usage['rss_mb']:.1f} MB, PSS {usage['pss_mb']:.1f} MB")
+
+
+def readiness():
+    """
+    Whether every preloaded engine is loaded and warmed up, with the loading state of each engine.
+    """
+    engines = {
+        engine: "ready" if engine in _warmed_up else ("loaded" if engine in _services else "not loaded")
+        for engine in ('crnn', 'tesseract')
+    }
+    ready = all(engine in _warmed_up for engine in config.PRELOAD_ENGINES)
+    return ready, engines
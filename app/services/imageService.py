@@ -1,17 +1,27 @@
+import asyncio
+import sys
+import time
 import cv2
 import numpy as np
-import base64
-from app.models.crnn_ctc_model.Main import inferSingleImage
-from app.models.crnn_ctc_model.Model import Model
-from app.utils.segmentImage import segment_image
-from app.utils.sample_preprocessing import preprocess  # Import the preprocess function
-from pathlib import Path
-import uuid
+from app.models.crnn_ctc_model.Main import inferImages
+from app.models.crnn_ctc_model.InferenceEngine import createInferenceModel
+from app.services.batchScheduler import BatchScheduler
+from app.services.inferenceExecutor import run_blocking
+from app.services.pagePipeline import process_pages
+from app.services.replicaPool import ReplicaPool
+from app.utils.imageEncoding import word_result
+from app.utils.pageReader import iter_pages
+from app.utils.segmentImage import segment_words, segment_lines, group_rows
+from app.utils.wordCache import WordCache
 from config import config
 
 class ImageService:
     def __init__(self):
-        self.model = Model(config.DECODER_TYPE, mustRestore=True, dump=False)
+        self.model = ReplicaPool(createInferenceModel(config.INFERENCE_BACKEND, config.DECODER_TYPE),
+                                 config.MODEL_REPLICAS)
+        self.word_cache = WordCache() if config.WORD_CACHE_ENABLED else None
+        self.scheduler = BatchScheduler(self.model, word_cache=self.word_cache,
+                                        max_concurrent_batches=len(self.model))
 
     def clean_text(self ,text):
         """
@@ -23,47 +33,196 @@ class ImageService:
         cleaned = ' '.join(cleaned.split())  # Normalize multiple spaces to a single space
         return cleaned
 
-    def process_image(self, file_contents):
+    def segment_contents(self, file_contents, mode="words"):
+        """
+        Decode the uploaded image and segment it into individual words (image, box and row),
+        or into text lines with mode="lines".
+        """
+        # Decode the image from file contents
+        nparr = np.frombuffer(file_contents, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)  # Use grayscale directly
+
+        # Debugging: Check pixel value range
+        print(f"Original image pixel range: {img.min()} - {img.max()}")
+
+        # Segment the image into individual words (or lines)
+        if mode == "lines":
+            return segment_lines(img)
+        return segment_words(img)
+
+    def build_results(self, words, recognized_words, image_format=None, image_quality=None):
+        """
+        Pair every word with its cleaned recognized text, confidence, bounding box and reading order.
+        recognized_words holds (text, probability, character probabilities) entries as returned by inferImages.
+        Word images are only encoded when an image format is requested.
+        """
+        results = []
+        for order, (word, (text, probability, char_probabilities)) in enumerate(zip(words, recognized_words)):
+            cleaned_text = self.clean_text(text)
+
+            # clean_text drops everything but alphanumerics and spaces, so these are the non-space characters of the label
+            char_confidences = None
+            if char_probabilities is not None:
+                char_confidences = [p for c, p in zip(text, char_probabilities) if c.isalnum()]
+
+            results.append(word_result(
+                cleaned_text, word["box"], word["row"], order, word["image"], image_format, image_quality,
+                probability, char_confidences
+            ))
+
+        return results
+
+    def process_image(self, file_contents, image_format=None, image_quality=None, decoding=None, mode="words"):
         """
         Process an image containing handwritten text and segment it into individual words.
-        Each word is recognized and returned along with its corresponding image in base64 format.
+        Each word is recognized and returned along with its bounding box and reading order,
+        and its image encoded in image_format when one is requested.
+        decoding is an optional (decoderType, beamWidth) overriding the model decoder for this request.
+        With mode="lines" every text line is recognized in one piece and returned as one chunk.
         """
         try:
-            # Decode the image from file contents
-            nparr = np.frombuffer(file_contents, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)  # Use grayscale directly
+            words = self.segment_contents(file_contents, mode)
 
-            # Debugging: Check pixel value range
-            print(f"Original image pixel range: {img.min()} - {img.max()}")
+            # Recognize all words of the page in batched session runs
+            # (lines are batched per width bucket and are not worth caching)
+            lines = mode == "lines"
+            recognized_words = inferImages(
+                self.model, [word["image"] for word in words], config.INFER_BATCH_SIZE,
+                None if lines else self.word_cache, True, [decoding] * len(words), lines
+            )
 
-            # Segment the image into individual words
-            word_images = segment_image(img)
+            return self.build_results(words, recognized_words, image_format, image_quality)
+
+        except Exception as e:
+            print(f"Error during image processing: {e}")
+            return [{"label": "", "error": str(e)}]
 
-            results = []
-            for i, word_img in enumerate(word_images):
-                # Save preprocessed image temporarily
-                unique_name = f"word_{uuid.uuid4().hex}.png"
-                unique_path = Path(config.TEMP_PATH, unique_name)
-                cv2.imwrite(str(unique_path), word_img)
+    def process_images(self, files_contents, image_format=None, image_quality=None, decoding=None):
+        """
+        Process several images at once: every image is segmented, then the words of all images are
+        recognized together in shared batches. Returns one result list per image, in input order.
+        """
+        pages = []
+        for file_contents in files_contents:
+            try:
+                pages.append(self.segment_contents(file_contents))
+            except Exception as e:
+                print(f"Error during image processing: {e}")
+                pages.append(e)
 
-                # Recognize text
-                recognized_text = inferSingleImage(self.model, str(unique_path))
+        word_images = [word["image"] for words in pages if not isinstance(words, Exception) for word in words]
+        recognized_words = inferImages(
+            self.model, word_images, config.INFER_BATCH_SIZE, self.word_cache, True, [decoding] * len(word_images)
+        )
 
-                cleaned_text = self.clean_text(recognized_text)
+        results = []
+        start = 0
+        for words in pages:
+            if isinstance(words, Exception):
+                results.append([{"label": "", "error": str(words)}])
+                continue
+            results.append(self.build_results(
+                words, recognized_words[start:start + len(words)], image_format, image_quality
+            ))
+            start += len(words)
 
-                # Encode the original word image to base64
-                _, buffer = cv2.imencode('.png', word_img)
-                img_str = base64.b64encode(buffer).decode('utf-8')
+        return results
 
-                # Append the result with recognized text and word image
-                results.append({"label": cleaned_text, "image": img_str})
+    async def process_image_scheduled(self, file_contents, image_format=None, image_quality=None, decoding=None):
+        """
+        Same as process_image, but the words are recognized through the shared batch scheduler
+        so that they can be batched together with words from concurrent requests.
+        """
+        try:
+            words = await run_blocking(self.segment_contents, file_contents)
 
-                # Cleanup temporary file
-                unique_path.unlink()
+            recognized_words = await self.scheduler.infer([word["image"] for word in words], decoding)
 
-            return results
+            return await run_blocking(self.build_results, words, recognized_words, image_format, image_quality)
 
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             print(f"Error during image processing: {e}")
-            return [{"label": "", "image": "", "error": str(e)}]
+            return [{"label": "", "error": str(e)}]
+
+    async def stream_image(self, file_contents, image_format=None, image_quality=None, decoding=None):
+        """
+        Async generator yielding the recognized words of an image one row at a time, as soon as each row is recognized,
+        so the full result list never has to be held in memory.
+        """
+        words = await run_blocking(self.segment_contents, file_contents)
+
+        order = 0
+        for row in group_rows(words):
+            row_images = [word["image"] for word in row]
+            if config.SCHEDULER_ENABLED:
+                recognized_words = await self.scheduler.infer(row_images, decoding)
+            else:
+                recognized_words = await run_blocking(
+                    inferImages, self.model, row_images, config.INFER_BATCH_SIZE, self.word_cache, True,
+                    [decoding] * len(row_images)
+                )
+
+            results = await run_blocking(self.build_results, row, recognized_words, image_format, image_quality)
+            for result in results:
+                # reading order across the whole page, not within the row
+                result["order"] = order
+                order += 1
+            yield results
+
+    async def process_document(self, file_contents, image_format=None, image_quality=None, decoding=None):
+        """
+        Async generator recognizing a multi-page document (PDF, TIFF or a single image) page by page.
+        Pages are decoded lazily and flow through the pipelined page processor; yields one
+        {"page": n, "words": [...]} entry per page, in page order.
+        """
+        async def recognize(words):
+            word_images = [word["image"] for word in words]
+            if config.SCHEDULER_ENABLED:
+                recognized_words = await self.scheduler.infer(word_images, decoding)
+            else:
+                recognized_words = await run_blocking(
+                    inferImages, self.model, word_images, config.INFER_BATCH_SIZE, self.word_cache, True,
+                    [decoding] * len(word_images)
+                )
+            return await run_blocking(self.build_results, words, recognized_words, image_format, image_quality)
+
+        async for page_number, results in process_pages(iter_pages(file_contents), segment_words, recognize):
+            yield {"page": page_number, "words": results}
+
+
+def benchmark_batch(files_contents, repeats=3):
+    """
+    Seconds for recognizing N images with one process_images call against N process_image calls.
+    The word cache is off so that every repeat recognizes every word again.
+    """
+    service = ImageService()
+    service.word_cache = None
+
+    def single():
+        return [service.process_image(file_contents) for file_contents in files_contents]
+
+    def batched():
+        return service.process_images(files_contents)
+
+    timings = {}
+    for name, run in (("process_image x N", single), ("process_images(N)", batched)):
+        run()  # warm-up
+        start = time.time()
+        for _ in range(repeats):
+            results = run()
+        timings[name] = (time.time() - start) / repeats
+        words = sum(len(result) for result in results)
+        print(f"{name}: {timings[name]:.3f} s for {len(files_contents)} images ({words} words), "
+              f"{words / timings[name]:.1f} words/sec")
+    return timings
+
 
+if __name__ == "__main__":
+    # python -m app.services.imageService <image>...: one batch against one call per image
+    contents = []
+    for fn in sys.argv[1:]:
+        with open(fn, "rb") as f:
+            contents.append(f.read())
+    benchmark_batch(contents)
@@ -0,0 +1,24 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from config import config
+
+# Dedicated pool for blocking OCR work. TF, OpenCV and the Tesseract subprocess calls
+# release the GIL, so threads keep the event loop free for other clients and health probes.
+executor = ThreadPoolExecutor(max_workers=config.INFERENCE_WORKERS, thread_name_prefix="inference")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function on the inference executor without waiting for it on the event loop.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+async def with_timeout(awaitable, timeout=config.REQUEST_TIMEOUT_SECONDS):
+    """
+    Await the OCR work of a request, raising asyncio.TimeoutError once the request timeout is over.
+    Work already running on the executor finishes in the background, its result is discarded.
+    """
+    return await asyncio.wait_for(awaitable, timeout)
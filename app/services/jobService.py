@@ -0,0 +1,300 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from config import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    claimed_at REAL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS items_status ON items (status, job_id, idx);
+"""
+
+
+class JobStore:
+    """
+    Durable job queue in a local SQLite database; the uploaded images are kept as files next to it.
+    Several processes (e.g. uvicorn or pre-fork workers) share the queue: a claimed item is leased to the
+    store that claimed it, and only goes back to the queue once its owner stopped renewing the lease.
+    """
+
+    def __init__(self, db_file=config.JOBS_DB_FILE, jobs_path=config.JOBS_PATH,
+                 lease_seconds=config.JOBS_LEASE_SECONDS):
+        self.db_file = db_file
+        self.jobs_path = jobs_path
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        os.makedirs(self.jobs_path, exist_ok=True)
+
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+            # databases created before the leases
+            columns = [column["name"] for column in conn.execute("PRAGMA table_info(items)")]
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE items ADD COLUMN owner TEXT")
+                conn.execute("ALTER TABLE items ADD COLUMN claimed_at REAL")
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return _Transaction(conn)
+
+    def create_job(self, engine, uploads):
+        """
+        Store the uploaded images and queue them as a new job. uploads is a list of (name, file object).
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.jobs_path, job_id)
+        os.makedirs(job_dir)
+
+        items = []
+        for idx, (name, fileobj) in enumerate(uploads):
+            path = os.path.join(job_dir, str(idx))
+            with open(path, "wb") as f:
+                shutil.copyfileobj(fileobj, f)
+            items.append((job_id, idx, name, path, "pending"))
+
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN")
+            conn.execute(
+                "INSERT INTO jobs (id, engine, status, total, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, engine, "pending" if items else "done", len(items), now, now),
+            )
+            conn.executemany("INSERT INTO items (job_id, idx, name, path, status) VALUES (?, ?, ?, ?, ?)", items)
+
+        return job_id
+
+    def claim_batch(self, batch_size):
+        """
+        Atomically mark up to batch_size pending images of the oldest pending job as running and return them.
+        Items whose lease expired (their worker died or the server stopped) are queued again first.
+        """
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE items SET status = 'pending', owner = NULL, claimed_at = NULL "
+                "WHERE status = 'running' AND (claimed_at IS NULL OR claimed_at < ?)",
+                (now - self.lease_seconds,),
+            )
+            job = conn.execute(
+                "SELECT jobs.id, jobs.engine FROM jobs WHERE jobs.status IN ('pending', 'running') "
+                "AND EXISTS (SELECT 1 FROM items WHERE items.job_id = jobs.id AND items.status = 'pending') "
+                "ORDER BY jobs.created LIMIT 1"
+            ).fetchone()
+            if job is None:
+                return None, None, []
+
+            items = conn.execute(
+                "SELECT idx, name, path FROM items WHERE job_id = ? AND status = 'pending' ORDER BY idx LIMIT ?",
+                (job["id"], batch_size),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE items SET status = 'running', owner = ?, claimed_at = ? WHERE job_id = ? AND idx = ?",
+                [(self.owner, now, job["id"], item["idx"]) for item in items],
+            )
+            conn.execute("UPDATE jobs SET status = 'running', updated = ? WHERE id = ?", (now, job["id"]))
+
+        return job["id"], job["engine"], [dict(item) for item in items]
+
+    def renew_claims(self):
+        """
+        Extend the lease of every item this store is still processing.
+        """
+        with self.connect() as conn:
+            conn.execute(
+                "UPDATE items SET claimed_at = ? WHERE status = 'running' AND owner = ?", (time.time(), self.owner)
+            )
+
+    def complete_batch(self, job_id, outcomes):
+        """
+        Record the outcome of a batch: outcomes is a list of (idx, result, error). Items this store no longer
+        owns (their lease expired and another worker claimed them) are not counted; returns the recorded indices.
+        """
+        recorded = []
+        done = 0
+        failed = 0
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for idx, result, error in outcomes:
+                updated = conn.execute(
+                    "UPDATE items SET status = ?, result = ?, error = ?, owner = NULL, claimed_at = NULL "
+                    "WHERE job_id = ? AND idx = ? AND status = 'running' AND owner = ?",
+                    ("failed" if error is not None else "done",
+                     json.dumps(result, ensure_ascii=False) if result is not None else None, error, job_id, idx,
+                     self.owner),
+                ).rowcount
+                if not updated:
+                    continue
+                recorded.append(idx)
+                if error is None:
+                    done += 1
+                else:
+                    failed += 1
+            conn.execute(
+                "UPDATE jobs SET done = done + ?, failed = failed + ?, updated = ?, "
+                "status = CASE WHEN done + failed + ? >= total THEN 'done' ELSE status END WHERE id = ?",
+                (done, failed, time.time(), done + failed, job_id),
+            )
+        return recorded
+
+    def get_job(self, job_id):
+        with self.connect() as conn:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        job = dict(job)
+        job["progress"] = (job["done"] + job["failed"]) / job["total"] if job["total"] else 1.0
+        return job
+
+    def get_results(self, job_id, offset=0, limit=100):
+        with self.connect() as conn:
+            items = conn.execute(
+                "SELECT idx, name, status, result, error FROM items WHERE job_id = ? ORDER BY idx LIMIT ? OFFSET ?",
+                (job_id, limit, offset),
+            ).fetchall()
+        return [
+            {
+                "index": item["idx"],
+                "name": item["name"],
+                "status": item["status"],
+                "result": json.loads(item["result"]) if item["result"] is not None else None,
+                "error": item["error"],
+            }
+            for item in items
+        ]
+
+
+class _Transaction:
+    """
+    Context manager committing (or rolling back) an explicit transaction and closing the connection.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.conn.close()
+
+
+class JobManager:
+    """
+    Pool of worker threads draining the job queue in batches, reusing the already loaded recognition services.
+    The services are passed as getters so that an engine is only loaded once a job needs it.
+    """
+
+    def __init__(self, get_image_service, get_tesseract_service, store=None, workers=config.JOBS_WORKERS):
+        self.get_image_service = get_image_service
+        self.get_tesseract_service = get_tesseract_service
+        self.store = store
+        self.workers = workers
+        self.threads = []
+        self.stopping = threading.Event()
+
+    def start(self):
+        if self.store is None:
+            self.store = JobStore()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"jobs-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="jobs-heartbeat", daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def stop(self):
+        self.stopping.set()
+
+    def _work(self):
+        while not self.stopping.is_set():
+            try:
+                job_id, engine, items = self.store.claim_batch(config.JOBS_BATCH_SIZE)
+                if not items:
+                    self.stopping.wait(config.JOBS_POLL_INTERVAL_SECONDS)
+                    continue
+                try:
+                    outcomes = self._process(engine, items)
+                except Exception as e:
+                    print(f"Error in job worker: {e}")
+                    outcomes = [(item["idx"], None, str(e)) for item in items]
+
+                # the images of items another worker took over are still needed
+                recorded = set(self.store.complete_batch(job_id, outcomes))
+                for item in items:
+                    if item["idx"] in recorded and os.path.exists(item["path"]):
+                        os.remove(item["path"])
+            except Exception as e:
+                print(f"Error in job worker: {e}")
+                self.stopping.wait(config.JOBS_POLL_INTERVAL_SECONDS)
+
+    def _heartbeat(self):
+        """
+        Keep the leases of the batches being processed alive, however long a batch takes.
+        """
+        while not self.stopping.wait(self.store.lease_seconds / 3):
+            try:
+                self.store.renew_claims()
+            except Exception as e:
+                print(f"Error in job heartbeat: {e}")
+
+    def _process(self, engine, items):
+        """
+        Recognize a batch of images, returning (idx, result, error) for every item.
+        """
+        contents = []
+        for item in items:
+            with open(item["path"], "rb") as f:
+                contents.append(f.read())
+
+        # the words of all images in the batch are recognized together (shared CRNN batches, Tesseract pool runs)
+        if engine == "crnn":
+            results = self.get_image_service().process_images(contents)
+        else:
+            results = self.get_tesseract_service().recognize_images(contents)
+
+        outcomes = []
+        for item, result in zip(items, results):
+            error = self._error_of(result)
+            outcomes.append((item["idx"], None if error else result, error))
+        return outcomes
+
+    @staticmethod
+    def _error_of(result):
+        if isinstance(result, dict):
+            return result.get("message") or result.get("error") or "Unknown error"
+        for entry in result:
+            if isinstance(entry, dict) and "error" in entry:
+                return entry["error"]
+        return None
@@ -0,0 +1,107 @@
+import asyncio
+from app.services.inferenceExecutor import run_blocking
+from config import config
+
+# Marks the end of the pages flowing through a stage queue
+END_OF_PAGES = object()
+
+
+async def process_pages(pages, segment, recognize, max_inflight_pages=config.MAX_INFLIGHT_PAGES):
+    """
+    Run a multi-page document through a decode -> segment -> recognize pipeline whose stages work
+    concurrently: page N+1 is decoded and page N segmented while page N-1 is being recognized.
+
+    pages is a (lazy) iterator of page images, segment a blocking function turning a page into words
+    and recognize a coroutine function turning those words into results. Yields (page_number, results)
+    in page order; at most max_inflight_pages pages are held in memory at any time.
+    """
+    slots = asyncio.Semaphore(max_inflight_pages)
+    decoded = asyncio.Queue()
+    segmented = asyncio.Queue()
+    recognized = asyncio.Queue()
+
+    async def decode_stage():
+        try:
+            page_number = 0
+            while True:
+                await slots.acquire()
+                page = await run_blocking(next, pages, END_OF_PAGES)
+                if page is END_OF_PAGES:
+                    break
+                page_number += 1
+                await decoded.put((page_number, page))
+        except asyncio.CancelledError:
+            # CancelledError is an Exception before Python 3.8, the stage must stop when the pipeline is closed
+            raise
+        except Exception as e:
+            await decoded.put(e)
+        await decoded.put(END_OF_PAGES)
+
+    async def segment_stage():
+        while True:
+            item = await decoded.get()
+            if item is END_OF_PAGES or isinstance(item, Exception):
+                await segmented.put(item)
+                if item is END_OF_PAGES:
+                    return
+                continue
+            page_number, page = item
+            try:
+                await segmented.put((page_number, await run_blocking(segment, page)))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await segmented.put(e)
+
+    async def recognize_stage():
+        while True:
+            item = await segmented.get()
+            if item is END_OF_PAGES or isinstance(item, Exception):
+                await recognized.put(item)
+                if item is END_OF_PAGES:
+                    return
+                continue
+            page_number, words = item
+            try:
+                await recognized.put((page_number, await recognize(words)))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await recognized.put(e)
+
+    tasks = [asyncio.ensure_future(stage()) for stage in (decode_stage, segment_stage, recognize_stage)]
+    try:
+        while True:
+            item = await recognized.get()
+            if item is END_OF_PAGES:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            # the page has left the pipeline, let the next one in
+            slots.release()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def collect_pages(pages):
+    """
+    Gather every page of a document into a list.
+    """
+    try:
+        return [page async for page in pages]
+    finally:
+        # stops the pipeline stages when the collection is cancelled (e.g. on timeout)
+        await pages.aclose()
+
+
+async def pages_as_rows(pages):
+    """
+    Adapt a generator of pages to the row generators expected by streaming responses (one page per row).
+    """
+    try:
+        async for page in pages:
+            yield [page]
+    finally:
+        await pages.aclose()
@@ -0,0 +1,112 @@
+import os
+import threading
+import cv2
+from config import config
+
+
+class ReplicaPool:
+    """
+    Replicas of an inference model sharing one graph, each with its own session and thread pools.
+    Every batch goes to the replica with the fewest batches in flight; everything else
+    (charList, decoderType, timings, ...) is read from the first replica.
+    """
+
+    def __init__(self, model, replicas=config.MODEL_REPLICAS):
+        self.replicas = [model] + [model.replicate() for _ in range(replicas - 1)]
+        self.in_flight = [0] * len(self.replicas)
+        self.batches_run = [0] * len(self.replicas)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name == 'replicas':
+            raise AttributeError(name)
+        return getattr(self.replicas[0], name)
+
+    def _dispatch(self, method, *args):
+        """
+        Run a model method on the least loaded replica.
+        """
+        with self._lock:
+            index = min(range(len(self.replicas)), key=self.in_flight.__getitem__)
+            self.in_flight[index] += 1
+        try:
+            return getattr(self.replicas[index], method)(*args)
+        finally:
+            with self._lock:
+                self.in_flight[index] -= 1
+                self.batches_run[index] += 1
+
+    def inferBatch(self, batch, calcProbability=False, probabilityOfGT=False):
+        return self._dispatch('inferBatch', batch, calcProbability, probabilityOfGT)
+
+    def inferBatchWithConfidence(self, batch, calcProbability=True, probabilityOfGT=False):
+        return self._dispatch('inferBatchWithConfidence', batch, calcProbability, probabilityOfGT)
+
+    def inferBatchWithDecoders(self, batch, decodings):
+        return self._dispatch('inferBatchWithDecoders', batch, decodings)
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def stats(self):
+        """
+        Batches in flight and batches run by every replica.
+        """
+        return {
+            "replicas": len(self.replicas),
+            "in_flight": list(self.in_flight),
+            "batches_run": list(self.batches_run),
+        }
+
+
+def available_cores():
+    """
+    Cores this process may run on (the CPU affinity, e.g. of a cpuset, when the platform reports it).
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def thread_budget():
+    """
+    Compute threads of every worker process and of all uvicorn workers together. The tesseract processes of a
+    preloaded Tesseract engine count as well, every one of them runs TESSERACT_OMP_THREAD_LIMIT threads.
+    """
+    if config.INFERENCE_BACKEND == 'remote':
+        # the NN runs in the inference server processes, see INFERENCE_SERVERS
+        model_threads = 0
+    elif config.INFERENCE_BACKEND == 'tflite':
+        model_threads = config.MODEL_REPLICAS * config.TFLITE_THREADS
+    else:
+        model_threads = config.MODEL_REPLICAS * (config.TF_INTRA_OP_THREADS + config.TF_INTER_OP_THREADS)
+    tesseract_threads = 0
+    if 'tesseract' in config.PRELOAD_ENGINES:
+        tesseract_threads = config.TESSERACT_WORKERS * config.TESSERACT_OMP_THREAD_LIMIT
+    per_worker = model_threads + tesseract_threads + config.OPENCV_THREADS
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    return {
+        "workers": workers,
+        "tesseract_threads_per_worker": tesseract_threads,
+        "threads_per_worker": per_worker,
+        "total_threads": per_worker * workers,
+        "cores": available_cores(),
+    }
+
+
+def apply_thread_budget():
+    """
+    Limit the OpenCV thread pool of this process and warn when the configured threads oversubscribe the cores.
+    """
+    cv2.setNumThreads(config.OPENCV_THREADS)
+
+    budget = thread_budget()
+    if budget["total_threads"] > budget["cores"]:
+        print(f"Warning: {budget['workers']} worker(s) x {budget['threads_per_worker']} compute threads "
+              f"= {budget['total_threads']} threads on {budget['cores']} cores "
+              f"({budget['tesseract_threads_per_worker']} of them tesseract per worker), lower MODEL_REPLICAS, "
+              f"TESSERACT_WORKERS, the TF/TFLite/OpenCV threads or the number of workers")
+    if config.INFERENCE_WORKERS < config.MODEL_REPLICAS:
+        print(f"Warning: INFERENCE_WORKERS ({config.INFERENCE_WORKERS}) is lower than MODEL_REPLICAS "
+              f"({config.MODEL_REPLICAS}), some replicas will never run")
+    return budget
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from app.services.inferenceExecutor import run_blocking
+from config import config
+
+
+class ResultCache:
+    """
+    Content-addressed cache of recognition results with an in-memory LRU bounded by a byte budget,
+    an optional on-disk tier, and single-flight coalescing of identical concurrent requests.
+    """
+
+    def __init__(self, max_bytes=config.RESULT_CACHE_MAX_BYTES, disk_path=config.RESULT_CACHE_DISK_PATH):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.entries = OrderedDict()  # key -> (result, size in bytes)
+        self.total_bytes = 0
+        self.inflight = {}  # key -> task computing the result
+
+        if self.disk_path:
+            os.makedirs(self.disk_path, exist_ok=True)
+
+        # statistics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(file_contents, *settings):
+        """
+        Hash the uploaded bytes together with the engine, endpoint and recognition settings.
+        """
+        digest = hashlib.sha256(file_contents)
+        digest.update(repr(settings).encode('utf-8'))
+        return digest.hexdigest()
+
+    async def get_or_compute(self, key, compute):
+        """
+        Return the cached result for key, or run compute() (a coroutine function) once for all
+        concurrent callers of the same key and cache what it returns.
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+        if key in self.inflight:
+            self.coalesced += 1
+            # shield: a caller timing out must not cancel the computation the others wait for
+            return await asyncio.shield(self.inflight[key])
+
+        task = asyncio.ensure_future(self._compute(key, compute))
+        self.inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, compute):
+        try:
+            if self.disk_path:
+                result = await run_blocking(self._read_disk, key)
+                if result is not None:
+                    self.disk_hits += 1
+                    self._store(key, result, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+                    return result
+
+            self.misses += 1
+            result = await compute()
+
+            if not self._is_error(result):
+                data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+                self._store(key, result, data)
+                if self.disk_path:
+                    await run_blocking(self._write_disk, key, data)
+
+            return result
+        finally:
+            self.inflight.pop(key, None)
+
+    @staticmethod
+    def _is_error(result):
+        """
+        Error responses are not cached, the next identical request retries the recognition.
+        """
+        if isinstance(result, dict):
+            return "error" in result or result.get("status") == "error"
+        return any(isinstance(item, dict) and "error" in item for item in result)
+
+    def _store(self, key, result, data):
+        size = len(data)
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = (result, size)
+        self.total_bytes += size
+
+        # evict least recently used entries until the byte budget is respected
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def _disk_file(self, key):
+        return os.path.join(self.disk_path, key + ".pkl")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_file(key), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _write_disk(self, key, data):
+        # write to a temporary file first so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.disk_path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self._disk_file(key))
+
+    def stats(self):
+        """
+        Hit, miss and eviction counters of the cache.
+        """
+        lookups = self.hits + self.disk_hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits + self.coalesced) / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Shared by both engines
+result_cache = ResultCache()
+
+
+async def cached(file_contents, settings, compute):
+    """
+    Run compute() through the shared result cache when it is enabled.
+    """
+    if not config.RESULT_CACHE_ENABLED:
+        return await compute()
+    return await result_cache.get_or_compute(ResultCache.make_key(file_contents, *settings), compute)
@@ -1,22 +1,38 @@
 import os
+import sys
+import time
 import cv2
 import numpy as np
 import pytesseract
-import base64
-from pathlib import Path
-import uuid
-from app.utils.segmentImage import segment_image
+from concurrent.futures import ThreadPoolExecutor
+from app.services.inferenceExecutor import run_blocking
+from app.services.pagePipeline import process_pages
+from app.utils.imageEncoding import word_result
+from app.utils.pageReader import iter_pages
+from app.utils.sample_preprocessing import preprocess
+from app.utils.segmentImage import segment_words, group_rows
+from app.utils.tesseractRunner import run_tesseract, run_tesseract_words, run_tesseract_strip
+from app.utils.wordCache import WordCache
+from config import config
+
+# Bounded pool of threads, each driving one tesseract process at a time
+tesseract_pool = ThreadPoolExecutor(max_workers=config.TESSERACT_WORKERS, thread_name_prefix="tesseract")
 
 class ArabicTextRecognitionService:
     def __init__(self):
         # Set the environment variable for Tesseract
         os.environ['TESSDATA_PREFIX'] = '/usr/share/tesseract/tessdata'
 
+        # Limit the OpenMP threads of every tesseract process so the parallel pool does not oversubscribe the CPU
+        os.environ['OMP_THREAD_LIMIT'] = str(config.TESSERACT_OMP_THREAD_LIMIT)
+
         # Set the path to Tesseract executable if not in PATH
         pytesseract.pytesseract.tesseract_cmd = '/usr/bin/tesseract'
 
         self.lang = 'ara'
 
+        self.word_cache = WordCache() if config.WORD_CACHE_ENABLED else None
+
     def clean_text(self, text):
         """
         Cleans the recognized Arabic text by removing unwanted characters and normalizing the text.
@@ -27,48 +43,261 @@ class ArabicTextRecognitionService:
         return cleaned
 
 
-    def recognize_text(self, file_contents, type='chunks'):
+    def recognize_text(self, file_contents, type='chunks', mode='segment', image_format=None, image_quality=None):
         """
-        Recognizes Arabic text from an image and returns a list of words with their corresponding images in base64 format.
+        Recognizes Arabic text from an image and returns a list of words with their bounding boxes and reading order,
+        and their images encoded in image_format when one is requested.
+        With mode='segment' the image is split by our own segmentation and the crops are recognized by the Tesseract pool,
+        with mode='page' Tesseract runs once on the whole page and the words come from its word boxes.
         """
         try:
             # Decode the image from file contents
             nparr = np.frombuffer(file_contents, np.uint8)
             img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)  # Use grayscale directly
 
+            if mode == 'page':
+                return self.recognize_page(img, image_format, image_quality)
+
             # Segment the image into individual words
             if(type == 'chunks'):
-                word_images = segment_image(img)
+                words = segment_words(img)
             else:
-                word_images = [img]
+                words = [{"image": img, "box": (0, 0, img.shape[1], img.shape[0]), "row": 0}]
+
+            # Recognize text using Tesseract, spreading the crops over the worker pool
+            # (the word cache only applies to word crops, not to whole images)
+            recognized_texts = self.recognize_crops([word["image"] for word in words], use_cache=(type == 'chunks'))
+
+            return self.build_results(words, recognized_texts, image_format, image_quality)
+
+        except Exception as e:
+            print(f"Error during text recognition: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def recognize_images(self, files_contents, image_format=None, image_quality=None):
+        """
+        Recognizes several images at once: every image is segmented, then the crops of all images are
+        recognized together by the Tesseract pool. Returns one result list per image, in input order.
+        """
+        pages = []
+        for file_contents in files_contents:
+            try:
+                nparr = np.frombuffer(file_contents, np.uint8)
+                pages.append(segment_words(cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)))
+            except Exception as e:
+                print(f"Error during text recognition: {e}")
+                pages.append(e)
+
+        word_images = [word["image"] for words in pages if not isinstance(words, Exception) for word in words]
+        recognized_texts = self.recognize_crops(word_images)
+
+        results = []
+        start = 0
+        for words in pages:
+            if isinstance(words, Exception):
+                results.append({"status": "error", "message": str(words)})
+                continue
+            results.append(self.build_results(
+                words, recognized_texts[start:start + len(words)], image_format, image_quality
+            ))
+            start += len(words)
+
+        return results
+
+    def build_results(self, words, recognized_texts, image_format=None, image_quality=None):
+        """
+        Pair every word with its cleaned recognized text, bounding box and reading order.
+        Word images are only encoded when an image format is requested.
+        """
+        results = []
+        for order, (word, recognized_text) in enumerate(zip(words, recognized_texts)):
+            cleaned_text = self.clean_text(recognized_text)
+            results.append(word_result(
+                cleaned_text, word["box"], word["row"], order, word["image"], image_format, image_quality
+            ))
+
+        return results
+
+    async def stream_text(self, file_contents, mode='segment', image_format=None, image_quality=None):
+        """
+        Async generator yielding the recognized words of an image one row at a time, as soon as each row is recognized.
+        """
+        nparr = np.frombuffer(file_contents, np.uint8)
+        img = await run_blocking(cv2.imdecode, nparr, cv2.IMREAD_GRAYSCALE)
+
+        if mode == 'page':
+            # Tesseract reports the whole page at once
+            yield await run_blocking(self.recognize_page, img, image_format, image_quality)
+            return
+
+        words = await run_blocking(segment_words, img)
+
+        order = 0
+        for row in group_rows(words):
+            recognized_texts = await run_blocking(self.recognize_crops, [word["image"] for word in row])
+
+            results = await run_blocking(self.build_results, row, recognized_texts, image_format, image_quality)
+            for result in results:
+                # reading order across the whole page, not within the row
+                result["order"] = order
+                order += 1
+            yield results
 
-            results = []
+    async def recognize_document(self, file_contents, mode='segment', image_format=None, image_quality=None):
+        """
+        Async generator recognizing a multi-page document (PDF, TIFF or a single image) page by page
+        through the pipelined page processor; yields one {"page": n, "words": [...]} entry per page, in page order.
+        """
+        if mode == 'page':
+            # Tesseract does its own segmentation of the whole page
+            def segment(page):
+                return page
+
+            async def recognize(page):
+                return await run_blocking(self.recognize_page, page, image_format, image_quality)
+        else:
+            segment = segment_words
+
+            async def recognize(words):
+                recognized_texts = await run_blocking(self.recognize_crops, [word["image"] for word in words])
+                return await run_blocking(self.build_results, words, recognized_texts, image_format, image_quality)
+
+        async for page_number, results in process_pages(iter_pages(file_contents), segment, recognize):
+            yield {"page": page_number, "words": results}
+
+    def recognize_crops(self, word_images, use_cache=True):
+        """
+        Recognizes a list of word images in parallel, stitching up to TESSERACT_CROPS_PER_CALL crops into each tesseract run.
+        The texts are returned in the same order as the images; words found in the word cache are not sent to Tesseract.
+        """
+        recognized_texts = [None] * len(word_images)
+        keys = [None] * len(word_images)
+        pending = list(range(len(word_images)))
+        cache = self.word_cache if use_cache else None
+        if cache is not None:
+            pending = []
             for i, word_img in enumerate(word_images):
-                # Save preprocessed image temporarily
-                unique_name = f"word_{uuid.uuid4().hex}.png"
-                unique_path = Path('/tmp', unique_name)
-                cv2.imwrite(str(unique_path), word_img)
+                keys[i] = cache.fingerprint(preprocess(word_img))
+                recognized_texts[i] = cache.get(keys[i])
+                if recognized_texts[i] is None:
+                    pending.append(i)
 
-                # Recognize text using Tesseract
-                custom_config = f'--oem 3 --psm 6 -l {self.lang}'
-                recognized_text = pytesseract.image_to_string(word_img, config=custom_config)
+        group_size = max(1, config.TESSERACT_CROPS_PER_CALL)
+        groups = [pending[i:i + group_size] for i in range(0, len(pending), group_size)]
 
-                cleaned_text = self.clean_text(recognized_text)
+        group_images = [[word_images[i] for i in group] for group in groups]
+        for group, texts in zip(groups, tesseract_pool.map(self.recognize_group, group_images)):
+            for i, text in zip(group, texts):
+                recognized_texts[i] = text
+                if cache is not None:
+                    cache.put(keys[i], text)
 
-                # Encode the original word image to base64
-                _, buffer = cv2.imencode('.png', word_img)
-                img_str = base64.b64encode(buffer).decode('utf-8')
+        return recognized_texts
 
-                # Append the result with recognized text and word image
-                results.append({"label": cleaned_text, "image": img_str})
+    def recognize_group(self, word_images):
+        """
+        Recognizes a group of word images with a single tesseract run.
+        """
+        custom_config = f'--oem 3 --psm 6 -l {self.lang}'
+        if len(word_images) == 1:
+            return [run_tesseract(word_images[0], custom_config)]
+        return run_tesseract_strip(word_images, custom_config)
 
-                # Cleanup temporary file
-                unique_path.unlink()
+    def recognize_page(self, img, image_format=None, image_quality=None):
+        """
+        Runs Tesseract a single time on the whole page and builds the word chunks from the word boxes it returns.
+        """
+        custom_config = f'--oem 3 --psm {config.TESSERACT_PAGE_PSM} -l {self.lang}'
+        words = run_tesseract_words(img, custom_config)
 
-            return results
+        results = []
+        row = -1
+        current_line = None
+        for word in words:
+            cleaned_text = self.clean_text(word['text'])
+            if not cleaned_text:
+                continue
 
-        except Exception as e:
-            print(f"Error during text recognition: {e}")
-            return {"status": "error", "message": str(e)}
+            # Every new Tesseract line (within its block and paragraph) starts a new row
+            line = (word['block_num'], word['par_num'], word['line_num'])
+            if line != current_line:
+                current_line = line
+                row += 1
+
+            box = (word['left'], word['top'], word['width'], word['height'])
+            word_img = None
+            if image_format is not None:
+                # Crop and pad the word the same way segment_words does
+                x, y, w, h = box
+                padding = 8
+                word_img = cv2.copyMakeBorder(
+                    img[y:y + h, x:x + w], padding, padding, padding, padding, cv2.BORDER_CONSTANT, value=255
+                )
+
+            results.append(word_result(cleaned_text, box, row, len(results), word_img, image_format, image_quality))
+
+        return results
+
+
+def benchmark_modes(file_contents, repeats=3):
+    """
+    Seconds per page of mode='page' (one tesseract run on the whole page) against mode='segment'
+    (our segmentation, crops spread over the Tesseract pool), and the number of words each mode finds.
+    The word cache is off so that every repeat recognizes every crop again.
+    """
+    service = ArabicTextRecognitionService()
+    service.word_cache = None
+
+    timings = {}
+    for mode in ('page', 'segment'):
+        service.recognize_text(file_contents, mode=mode)  # warm-up: tesseract loads its language data
+        start = time.time()
+        for _ in range(repeats):
+            results = service.recognize_text(file_contents, mode=mode)
+        if isinstance(results, dict):
+            raise Exception(results["message"])
+        timings[mode] = {"seconds_per_page": (time.time() - start) / repeats, "words": len(results)}
+        print(f"mode={mode}: {timings[mode]['seconds_per_page']:.3f} s/page, {timings[mode]['words']} words "
+              f"({config.TESSERACT_WORKERS} workers, {config.TESSERACT_CROPS_PER_CALL} crops per call)")
+    return timings
+
+
+def benchmark_batch(files_contents, repeats=3):
+    """
+    Seconds for recognizing N images with one recognize_images call against N recognize_text calls.
+    The word cache is off so that every repeat recognizes every crop again.
+    """
+    service = ArabicTextRecognitionService()
+    service.word_cache = None
+
+    def single():
+        return [service.recognize_text(file_contents) for file_contents in files_contents]
+
+    def batched():
+        return service.recognize_images(files_contents)
+
+    timings = {}
+    for name, run in (("recognize_text x N", single), ("recognize_images(N)", batched)):
+        run()  # warm-up: tesseract loads its language data
+        start = time.time()
+        for _ in range(repeats):
+            results = run()
+        timings[name] = (time.time() - start) / repeats
+        words = sum(len(result) for result in results if not isinstance(result, dict))
+        print(f"{name}: {timings[name]:.3f} s for {len(files_contents)} images ({words} words), "
+              f"{words / timings[name]:.1f} words/sec")
+    return timings
 
 
+if __name__ == "__main__":
+    # python -m app.services.tesseractService <page image> [repeats]: page against segment mode
+    # python -m app.services.tesseractService --batch <image>...: one batch against one call per image
+    if sys.argv[1] == "--batch":
+        contents = []
+        for fn in sys.argv[2:]:
+            with open(fn, "rb") as f:
+                contents.append(f.read())
+        benchmark_batch(contents)
+    else:
+        with open(sys.argv[1], "rb") as f:
+            benchmark_modes(f.read(), int(sys.argv[2]) if len(sys.argv) > 2 else 3)
@@ -87,8 +87,9 @@ class DataGenerator:
             localCharList = sorted(list(charsSet))
             open(config.fnCharList, 'w',
                  encoding="utf-8").write(str().join(localCharList))
+            # one word per line (the last label of the file has no trailing newline to separate it)
             open(config.fnCorpus, 'w',
-                 encoding="utf-8").write(str().join(sorted(list(wordsSet))))
+                 encoding="utf-8").write('\n'.join(sorted(set(word.strip() for word in wordsSet))))
 
         # first of all, make sure to randomly shuffle the main lables file
         # random.shuffle(self.samples)
@@ -201,6 +202,13 @@ class DataGenerator:
         "iterator"
         return self.currIdx + config.BATCH_SIZE <= len(self.samples)
 
+    def getRawImage(self, sample):
+        "the unprocessed grayscale image of a sample, read from the binary images file"
+        self.binaryImageFile.seek(sample.imageStartPosition)
+        img = np.frombuffer(self.binaryImageFile.read(
+            sample.imageSize), np.dtype('B'))
+        return img.reshape(sample.imageHeight, sample.imageWidth)
+
     def getNext(self):
         "iterator"
         batchRange = range(self.currIdx, self.currIdx + config.BATCH_SIZE)
@@ -0,0 +1,55 @@
+import cv2
+
+# OpenCV extension and quality flag for every supported output format
+IMAGE_FORMATS = {
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+}
+
+# Valid values of the quality flag: the PNG compression level, the WebP and JPEG quality
+IMAGE_QUALITY_RANGES = {"png": (0, 9), "webp": (0, 100), "jpeg": (0, 100)}
+
+
+def check_image_quality(image_format, quality):
+    """
+    Raise a ValueError when the quality is out of range for the format, OpenCV would silently clamp it.
+    """
+    if quality is None:
+        return
+    low, high = IMAGE_QUALITY_RANGES[image_format]
+    if not low <= quality <= high:
+        raise ValueError(f"image_quality must be between {low} and {high} for {image_format}")
+
+
+def encode_image(image, image_format="png", quality=None):
+    """
+    Encode a word image in the requested format and return the raw encoded bytes.
+    The response layer turns them into base64 for JSON and sends them as-is in binary formats.
+    For PNG the quality is the compression level (0-9), for WebP and JPEG it is the quality (0-100).
+    """
+    extension, quality_flag = IMAGE_FORMATS[image_format]
+    check_image_quality(image_format, quality)
+    params = [quality_flag, int(quality)] if quality is not None else []
+    success, buffer = cv2.imencode(extension, image, params)
+    if not success:
+        raise ValueError(f"Could not encode image as {image_format}")
+    return buffer.tobytes()
+
+
+def word_result(label, box, row, order, image=None, image_format=None, quality=None,
+                confidence=None, char_confidences=None):
+    """
+    Build the response entry of a recognized word: its label, geometry and reading order.
+    The confidence of the label and of each of its non-space characters is included when the engine provides it.
+    The word image is only encoded when an image format is requested.
+    """
+    x, y, w, h = box
+    result = {"label": label, "x": x, "y": y, "w": w, "h": h, "row": row, "order": order}
+    if confidence is not None:
+        result["confidence"] = round(float(confidence), 4)
+    if char_confidences is not None:
+        result["char_confidences"] = [round(float(p), 4) for p in char_confidences]
+    if image_format is not None and image is not None:
+        result["image"] = encode_image(image, image_format, quality)
+    return result
@@ -0,0 +1,67 @@
+import io
+import threading
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence
+from config import config
+
+# Optional dependency, only needed to rasterize PDF documents
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+# PDFium is not thread-safe, pages of concurrent documents are rendered one at a time
+pdfium_lock = threading.Lock()
+
+
+def is_pdf(file_contents):
+    return file_contents[:5] == b'%PDF-'
+
+
+def is_tiff(file_contents):
+    return file_contents[:4] in (b'II*\x00', b'MM\x00*')
+
+
+def iter_pages(file_contents):
+    """
+    Lazily yield the pages of an uploaded document as grayscale images.
+    PDF pages are rasterized and TIFF frames decoded one at a time, any other image is a single page.
+    """
+    if is_pdf(file_contents):
+        yield from _iter_pdf_pages(file_contents)
+    elif is_tiff(file_contents):
+        yield from _iter_tiff_pages(file_contents)
+    else:
+        nparr = np.frombuffer(file_contents, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError("Unsupported document format")
+        yield img
+
+
+def _iter_tiff_pages(file_contents):
+    with Image.open(io.BytesIO(file_contents)) as tiff:
+        for frame in ImageSequence.Iterator(tiff):
+            yield np.array(frame.convert('L'))
+
+
+def _iter_pdf_pages(file_contents):
+    if pypdfium2 is None:
+        raise RuntimeError("PDF support requires the pypdfium2 package")
+
+    with pdfium_lock:
+        pdf = pypdfium2.PdfDocument(file_contents)
+        page_count = len(pdf)
+
+    try:
+        for index in range(page_count):
+            with pdfium_lock:
+                page = pdf[index]
+                bitmap = page.render(scale=config.PDF_RENDER_DPI / 72.0, grayscale=True)
+                img = np.array(bitmap.to_pil().convert('L'))
+                page.close()
+            yield img
+    finally:
+        with pdfium_lock:
+            pdf.close()
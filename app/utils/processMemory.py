@@ -0,0 +1,64 @@
+import sys
+
+
+def memory_usage(pid="self"):
+    """
+    Resident (RSS) and proportional (PSS) set size of a process in MB. PSS divides every shared page
+    by the number of processes mapping it, so the PSS of all workers adds up to their real footprint.
+    None on platforms without /proc, and for processes that are gone or not readable.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        # kernels before 4.14 only report the mappings one by one
+        try:
+            with open(f"/proc/{pid}/smaps") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+
+    totals = {"Rss:": 0, "Pss:": 0}
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 2 and fields[0] in totals:
+            totals[fields[0]] += int(fields[1])  # kB
+    return {"rss_mb": totals["Rss:"] / 1024, "pss_mb": totals["Pss:"] / 1024}
+
+
+def report(pids):
+    """
+    Print the memory of every process and the total, e.g. of the workers of `uvicorn --workers N`.
+    """
+    total_pss = 0.0
+    reported = 0
+    for pid in pids:
+        usage = memory_usage(pid)
+        if usage is None:
+            # the process is gone (or there is no /proc)
+            print(f"pid {pid}: no memory information")
+            continue
+        total_pss += usage["pss_mb"]
+        reported += 1
+        print(f"pid {pid}: RSS {usage['rss_mb']:.1f} MB, PSS {usage['pss_mb']:.1f} MB")
+    print(f"total PSS of {reported} process(es): {total_pss:.1f} MB")
+    return total_pss
+
+
+def children(pid):
+    """
+    Process ids of the children of a process, e.g. the workers of a uvicorn or pre-fork master.
+    """
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return f.read().split()
+    except OSError:
+        return []
+
+
+if __name__ == "__main__":
+    # `--children <pid>` reports a master together with all of its workers
+    if sys.argv[1:2] == ["--children"]:
+        report([pid for master in sys.argv[2:] for pid in [master] + children(master)])
+    else:
+        report(sys.argv[1:] or ["self"])
@@ -0,0 +1,207 @@
+import asyncio
+import base64
+import glob
+import gzip
+import json
+import os
+import time
+import cv2
+import numpy as np
+from starlette.exceptions import HTTPException
+from starlette.responses import Response, StreamingResponse
+from app.utils.imageEncoding import check_image_quality
+from config import config
+
+# Optional fast/binary serializers, each format is only offered when its package is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+CBOR_MEDIA_TYPE = "application/cbor"
+
+# Alternative media type names clients send for the same format
+MEDIA_TYPE_ALIASES = {
+    "application/x-msgpack": MSGPACK_MEDIA_TYPE,
+    "application/vnd.msgpack": MSGPACK_MEDIA_TYPE,
+}
+
+
+def _json_default(obj):
+    """
+    JSON has no binary type: raw image bytes are sent as base64 strings, NumPy scalars as plain numbers.
+    """
+    if isinstance(obj, (bytes, bytearray)):
+        return base64.b64encode(obj).decode('ascii')
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def _binary_default(obj):
+    """
+    Binary formats carry image bytes natively, only NumPy scalars need converting.
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def render_json(content):
+    if orjson is not None:
+        return orjson.dumps(content, default=_json_default)
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def render_msgpack(content):
+    return msgpack.packb(content, use_bin_type=True, default=_binary_default)
+
+
+def render_cbor(content):
+    return cbor2.dumps(content, default=lambda encoder, obj: encoder.encode(_binary_default(obj)))
+
+
+def available_renderers():
+    """
+    Map every media type we can produce in this environment to its renderer.
+    """
+    renderers = {JSON_MEDIA_TYPE: render_json}
+    if msgpack is not None:
+        renderers[MSGPACK_MEDIA_TYPE] = render_msgpack
+    if cbor2 is not None:
+        renderers[CBOR_MEDIA_TYPE] = render_cbor
+    return renderers
+
+
+RENDERERS = available_renderers()
+
+
+def select_media_type(accept_header):
+    """
+    Pick the response format from the Accept header, honouring q-values; JSON is the fallback.
+    """
+    candidates = []
+    for position, part in enumerate((accept_header or "").split(",")):
+        fields = part.strip().split(";")
+        media_type = MEDIA_TYPE_ALIASES.get(fields[0].strip().lower(), fields[0].strip().lower())
+        quality = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type in RENDERERS and quality > 0:
+            candidates.append((-quality, position, media_type))
+
+    if not candidates:
+        return JSON_MEDIA_TYPE
+    return min(candidates)[2]
+
+
+def requested_image_quality(image_format, image_quality):
+    """
+    The image_quality of a request, answered with 422 when it is out of range for the image_format
+    (the PNG compression level only goes up to 9).
+    """
+    try:
+        check_image_quality(image_format, image_quality)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return image_quality
+
+
+def negotiated_response(request, content, status_code=200):
+    """
+    Serialize the content in the format requested by the client's Accept header.
+    """
+    media_type = select_media_type(request.headers.get("accept"))
+    body = RENDERERS[media_type](content)
+    return Response(content=body, status_code=status_code, media_type=media_type, headers={"Vary": "Accept"})
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+def streaming_response(request, rows, stream_format="ndjson", timeout=config.REQUEST_TIMEOUT_SECONDS):
+    """
+    Stream the words produced by an async generator of rows, one JSON document per word,
+    as NDJSON lines or Server-Sent Events. Recognition stops as soon as the client disconnects.
+    """
+    def frame(content, event=None):
+        data = render_json(content)
+        if stream_format == "sse":
+            prefix = b"event: " + event.encode('ascii') + b"\n" if event else b""
+            return prefix + b"data: " + data + b"\n\n"
+        return data + b"\n"
+
+    async def body():
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        try:
+            async for row in rows:
+                if await request.is_disconnected():
+                    break
+                for word in row:
+                    yield frame(word)
+                if loop.time() > deadline:
+                    yield frame({"error": "Request timed out"}, "error")
+                    break
+            else:
+                if stream_format == "sse":
+                    yield frame({"done": True}, "end")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            yield frame({"error": str(e)}, "error")
+        finally:
+            # stop the pending recognition work of a disconnected or timed out client
+            await rows.aclose()
+
+    # an explicit Content-Encoding keeps the GZipMiddleware out of the stream: its GzipFile is never flushed,
+    # so the frames would only reach the client once enough of them were compressed or the stream ended
+    media_type = SSE_MEDIA_TYPE if stream_format == "sse" else NDJSON_MEDIA_TYPE
+    return StreamingResponse(body(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "Content-Encoding": "identity"})
+
+
+def benchmark_serialization():
+    """
+    Compare payload size and serialization time of every available format on the pages in samples/.
+    """
+    from app.utils.imageEncoding import word_result
+    from app.utils.segmentImage import segment_words
+
+    for fn in sorted(glob.glob(os.path.join(config.SAMPLES_PATH, "*.png"))):
+        img = cv2.imread(fn, cv2.IMREAD_GRAYSCALE)
+        words = segment_words(img)
+        content = [
+            word_result("", word["box"], word["row"], order, word["image"], "png")
+            for order, word in enumerate(words)
+        ]
+
+        print(os.path.basename(fn), "-", len(words), "words")
+        for media_type, render in RENDERERS.items():
+            start = time.time()
+            body = render(content)
+            elapsed = (time.time() - start) * 1000.0
+            compressed = len(gzip.compress(body))
+            print(f"  {media_type}: {len(body)} bytes, {compressed} bytes gzipped, {elapsed:.3f} ms")
+
+
+if __name__ == "__main__":
+    benchmark_serialization()
@@ -35,8 +35,40 @@ def preprocess(img):
     target = np.ones([config.IMAGE_HEIGHT, config.IMAGE_WIDTH]) * 255  # Initialize with white
     target[0:new_size[1], 0:new_size[0]] = img
 
+    return transpose_and_normalize(target)
+
+
+def preprocess_line(img):
+    """
+    Scale a text line to the model height keeping its aspect ratio and pad it to the smallest
+    width bucket it fits in (lines wider than the widest bucket are shrunk to fit it),
+    then transpose it for TensorFlow and normalize the grayscale values.
+    """
+    (h, w) = img.shape
+    scaled_width = max(int(w * config.IMAGE_HEIGHT / h), 1)
+    bucket = next((width for width in config.LINE_WIDTH_BUCKETS if width >= scaled_width),
+                  config.LINE_WIDTH_BUCKETS[-1])
+
+    # Same fitting as preprocess, with the bucket as target width
+    f = max(w / bucket, h / config.IMAGE_HEIGHT)
+    new_size = (
+        max(min(bucket, int(w / f)), 1),
+        max(min(config.IMAGE_HEIGHT, int(h / f)), 1)
+    )
+    img = cv2.resize(img, new_size)
+
+    target = np.ones([config.IMAGE_HEIGHT, bucket]) * 255  # Initialize with white
+    target[0:new_size[1], 0:new_size[0]] = img
+
+    return transpose_and_normalize(target)
+
+
+def transpose_and_normalize(img):
+    """
+    Transpose a padded image for TensorFlow and normalize it to zero mean and unit variance.
+    """
     # Transpose the image for TensorFlow compatibility
-    img = cv2.transpose(target)
+    img = cv2.transpose(img)
 
     # Normalize the image to zero mean and unit variance
     (mean, std_dev) = cv2.meanStdDev(img)
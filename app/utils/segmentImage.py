@@ -1,61 +1,119 @@
 import cv2
 
-def segment_image(image):
-     word_images = []
+def segment_image(image, mode="words"):
+     segments = segment_lines(image) if mode == "lines" else segment_words(image)
+     return [segment["image"] for segment in segments]
 
-     try:
-         # Apply adaptive thresholding (invert to make text white on black background)
-         binary = cv2.adaptiveThreshold(
-             image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2
-         )
-
-         # Apply morphological operations to merge close components
-         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 3))
-         binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-
-         # Perform connected components analysis
-         num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(binary)
-
-         # Extract bounding boxes, filtering out small components
-         bounding_boxes = [
-             (x, y, w, h) for x, y, w, h, area in stats[1:] if area >= 50
-         ]  # Skip label 0 (background)
-
-         # Group bounding boxes into rows
-         rows = []
-         for box in bounding_boxes:
-             x, y, w, h = box
-             mid_y = y + h // 2
-             added_to_row = False
-
-             # Check if the box belongs to an existing row
-             for row in rows:
-                 if abs(row[0][1] + row[0][3] // 2 - mid_y) <= h // 2:  # Adjust threshold as needed
-                     row.append(box)
-                     added_to_row = True
-                     break
-
-             # If not added to any row, create a new row
-             if not added_to_row:
-                 rows.append([box])
-
-         # Sort rows by their vertical position
-         rows.sort(key=lambda r: r[0][1])
-
-         # Sort bounding boxes within each row by their **right-to-left** horizontal position
-         for row in rows:
-             row.sort(key=lambda b: -b[0])  # Sort by x-coordinate in descending order (right-to-left)
 
+def segment_words(image):
+     """
+     Segment an image into words in reading order (rows top to bottom, words right to left).
+     Each word is a dict with the padded word "image", its bounding "box" (x, y, w, h) in the
+     original image and the index of the "row" it belongs to.
+     """
+     words = []
+
+     try:
+         for row_index, row in enumerate(find_rows(image)):
              # Extract and pad word images
              for x, y, w, h in row:
-                 cropped_image = image[y:y + h, x:x + w]
-                 padding = 8  # Adjust padding size as needed
-                 padded_image = cv2.copyMakeBorder(
-                     cropped_image, padding, padding, padding, padding, cv2.BORDER_CONSTANT, value=255
-                 )
-                 word_images.append(padded_image)
+                 words.append({"image": pad_crop(image, x, y, w, h), "box": (int(x), int(y), int(w), int(h)), "row": row_index})
+
+     except Exception as e:
+         print(f"Error during segmentation: {e}")
+
+     return words
+
+
+def segment_lines(image):
+     """
+     Segment an image into text lines, top to bottom. Each line is a dict with the padded line "image",
+     its bounding "box" (x, y, w, h) covering all of its words and its "row" index, like segment_words.
+     """
+     lines = []
+
+     try:
+         for row_index, row in enumerate(find_rows(image)):
+             x = min(box[0] for box in row)
+             y = min(box[1] for box in row)
+             w = max(box[0] + box[2] for box in row) - x
+             h = max(box[1] + box[3] for box in row) - y
+             lines.append({"image": pad_crop(image, x, y, w, h), "box": (int(x), int(y), int(w), int(h)), "row": row_index})
 
      except Exception as e:
          print(f"Error during segmentation: {e}")
 
-     return word_images
\ No newline at end of file
+     return lines
+
+
+def find_rows(image):
+     """
+     Find the word bounding boxes (x, y, w, h) of an image, grouped into rows sorted top to bottom,
+     the boxes of every row sorted right to left.
+     """
+     # Apply adaptive thresholding (invert to make text white on black background)
+     binary = cv2.adaptiveThreshold(
+         image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2
+     )
+
+     # Apply morphological operations to merge close components
+     kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 3))
+     binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+
+     # Perform connected components analysis
+     num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(binary)
+
+     # Extract bounding boxes, filtering out small components
+     bounding_boxes = [
+         (x, y, w, h) for x, y, w, h, area in stats[1:] if area >= 50
+     ]  # Skip label 0 (background)
+
+     # Group bounding boxes into rows
+     rows = []
+     for box in bounding_boxes:
+         x, y, w, h = box
+         mid_y = y + h // 2
+         added_to_row = False
+
+         # Check if the box belongs to an existing row
+         for row in rows:
+             if abs(row[0][1] + row[0][3] // 2 - mid_y) <= h // 2:  # Adjust threshold as needed
+                 row.append(box)
+                 added_to_row = True
+                 break
+
+         # If not added to any row, create a new row
+         if not added_to_row:
+             rows.append([box])
+
+     # Sort rows by their vertical position
+     rows.sort(key=lambda r: r[0][1])
+
+     # Sort bounding boxes within each row by their **right-to-left** horizontal position
+     for row in rows:
+         row.sort(key=lambda b: -b[0])  # Sort by x-coordinate in descending order (right-to-left)
+
+     return rows
+
+
+def pad_crop(image, x, y, w, h):
+     """
+     Crop a box out of the image with a white border around it.
+     """
+     cropped_image = image[y:y + h, x:x + w]
+     padding = 8  # Adjust padding size as needed
+     return cv2.copyMakeBorder(
+         cropped_image, padding, padding, padding, padding, cv2.BORDER_CONSTANT, value=255
+     )
+
+
+def group_rows(words):
+     """
+     Split words returned by segment_words into consecutive lists, one per row.
+     """
+     rows = []
+     for word in words:
+         if not rows or rows[-1][-1]["row"] != word["row"]:
+             rows.append([])
+         rows[-1].append(word)
+     return rows
@@ -0,0 +1,94 @@
+import subprocess
+import cv2
+import numpy as np
+import pytesseract
+
+
+def run_tesseract(image, args, timeout=None):
+    """
+    Run Tesseract on an in-memory grayscale image and return its standard output as text.
+    The image is piped through stdin and the result read from stdout, so no temporary files are written.
+    """
+    # BMP is uncompressed, which keeps the encoding cost negligible compared to PNG
+    success, buffer = cv2.imencode('.bmp', image)
+    if not success:
+        raise ValueError("Could not encode image for Tesseract")
+
+    command = [pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout'] + args.split()
+    completed = subprocess.run(
+        command, input=buffer.tobytes(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.decode('utf-8', errors='replace').strip())
+
+    return completed.stdout.decode('utf-8')
+
+
+def run_tesseract_words(image, args, timeout=None):
+    """
+    Run Tesseract once on a whole image and return the recognized words with their bounding boxes.
+    Each word is a dict with 'text', 'conf', 'left', 'top', 'width', 'height' and the
+    block/paragraph/line numbers, in the order Tesseract reports them.
+    """
+    tsv = run_tesseract(image, args + ' tsv', timeout=timeout)
+
+    words = []
+    lines = tsv.splitlines()
+    if not lines:
+        return words
+
+    header = lines[0].split('\t')
+    for line in lines[1:]:
+        fields = line.split('\t')
+        if len(fields) < len(header):
+            continue
+        row = dict(zip(header, fields))
+
+        # level 5 rows are words; other levels describe pages, blocks, paragraphs and lines
+        text = row['text'].strip()
+        if row['level'] != '5' or not text:
+            continue
+
+        words.append({
+            'text': text,
+            'conf': float(row['conf']),
+            'left': int(row['left']),
+            'top': int(row['top']),
+            'width': int(row['width']),
+            'height': int(row['height']),
+            'block_num': int(row['block_num']),
+            'par_num': int(row['par_num']),
+            'line_num': int(row['line_num']),
+        })
+
+    return words
+
+
+def run_tesseract_strip(images, args, gap=24, timeout=None):
+    """
+    Recognize several word images with a single Tesseract run by stacking them into one vertical strip.
+    Returns one text per input image; every recognized word is given back to the image its box falls into.
+    """
+    strip_width = max(image.shape[1] for image in images)
+
+    rows = []
+    ranges = []
+    top = 0
+    for image in images:
+        h, w = image.shape
+        rows.append(cv2.copyMakeBorder(image, 0, gap, 0, strip_width - w, cv2.BORDER_CONSTANT, value=255))
+        ranges.append((top, top + h))
+        top += h + gap
+
+    strip = np.vstack(rows)
+    words = run_tesseract_words(strip, args, timeout=timeout)
+
+    texts = [[] for _ in images]
+    for word in words:
+        center = word['top'] + word['height'] // 2
+        for i, (start, end) in enumerate(ranges):
+            if start <= center < end + gap:
+                texts[i].append(word['text'])
+                break
+
+    return [' '.join(text) for text in texts]
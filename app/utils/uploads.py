@@ -0,0 +1,21 @@
+import zipfile
+
+
+def read_uploads(files, archive):
+    """
+    List the (name, file object) pairs of a multi-image upload: the uploaded files plus every file of an optional zip archive.
+    """
+    uploads = [(f.filename, f.file) for f in files or []]
+    if archive is not None:
+        zip_file = zipfile.ZipFile(archive.file)
+        for info in zip_file.infolist():
+            if not info.is_dir():
+                uploads.append((info.filename, zip_file.open(info)))
+    return uploads
+
+
+def read_upload_contents(files, archive):
+    """
+    Same as read_uploads, with the contents of every image read into memory.
+    """
+    return [(name, fileobj.read()) for name, fileobj in read_uploads(files, archive)]
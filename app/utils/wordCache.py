@@ -0,0 +1,67 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from config import config
+
+
+class WordCache:
+    """
+    Bounded LRU of recognized texts keyed by a fingerprint of the preprocessed word image,
+    so repeated words (و, في, من, letterheads...) skip recognition entirely.
+    """
+
+    def __init__(self, max_entries=config.WORD_CACHE_MAX_ENTRIES, mode=config.WORD_CACHE_MODE):
+        self.max_entries = max_entries
+        self.mode = mode
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()  # used from several executor threads
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, img):
+        """
+        Fingerprint of a preprocessed (normalized, transposed) word image.
+        """
+        if self.mode == 'near':
+            # downsample and binarize around the mean: small rendering differences map to the same key
+            # (preprocessed images are transposed, rows follow the word width)
+            (width, height) = config.WORD_CACHE_NEAR_SIZE
+            small = cv2.resize(np.asarray(img, dtype=np.float32), (height, width), interpolation=cv2.INTER_AREA)
+            bits = np.packbits(small > small.mean())
+            return hashlib.blake2b(bits.tobytes(), digest_size=16).digest()
+
+        # quantize the normalized values so float noise does not change the key
+        quantized = np.clip(np.round(np.asarray(img) * 16), -128, 127).astype(np.int8)
+        return hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+
+    def get(self, key):
+        with self.lock:
+            text = self.entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        with self.lock:
+            self.entries[key] = text
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+        }
@@ -10,6 +10,10 @@ class OperationType(Enum):
     Validation = 2
     Testing = 3
     Infer = 4
+    Benchmark = 5
+    WordCacheEvaluation = 6
+    DecoderEvaluation = 7
+    LineEvaluation = 8
 
 
 class DecoderType:
@@ -29,6 +33,19 @@ OPERATION_TYPE = OperationType.Infer
 
 DECODER_TYPE = DecoderType.BestPath
 
+# With DecoderType.BestPath, decode the RNN output with the vectorized NumPy decoder instead of
+# running tf.nn.ctc_greedy_decoder and walking its sparse output in Python (the texts are the same).
+NUMPY_BEST_PATH_DECODER = True
+
+# Beam search decoding (word beam search over the corpus): number of beams kept per frame, and the
+# probability below which a character is not even tried as an extension of a beam.
+BEAM_WIDTH = 50
+BEAM_PRUNE_PROBABILITY = 0.001
+
+# Decoders a request can choose with ?decoder=...&beam_width=... (the default is DECODER_TYPE).
+DECODERS = {'best': DecoderType.BestPath, 'beam': DecoderType.BeamSearch, 'word': DecoderType.WordBeamSearch}
+MAX_BEAM_WIDTH = 100
+
 # Use this value to regenerate the training/validation/test datasets, as well as
 # the other support files. Usually this is needed when we start the training process
 # It is not needed during the Testing process we set it to true
@@ -57,6 +74,9 @@ fnInfer_2 = os.path.join(INDIVIDUAL_TEST_IMAGE_PATH, "23.png")
 
 fnCorpus = os.path.join(OUTPUT_PATH, 'corpus.txt')
 fnWordCharList = os.path.join(OUTPUT_PATH, 'wordCharList.txt')
+fnCorpusTrie = os.path.join(OUTPUT_PATH, 'corpusTrie')
+fnFrozenGraph = os.path.join(MODEL_PATH, 'frozen_crnn.pb')
+fnTFLiteModel = os.path.join(MODEL_PATH, 'crnn_{}.tflite')  # one model per input width
 
 # Number of batches for each epoch = SAMPLES_PER_EPOCH / BATCH_SIZE
 TRAINING_SAMPLES_PER_EPOCH = 5000
@@ -79,6 +99,123 @@ CONVERT_IMAGE_TO_MONOCHROME = False
 MONOCHROME_BINARY_THRESHOLD = 127
 AUGMENT_IMAGE = False
 
+# Line-level recognition: text lines are scaled to IMAGE_HEIGHT and padded to the smallest of these
+# widths (wider lines are shrunk to the widest one); lines of the same width are batched together.
+LINE_WIDTH_BUCKETS = [128, 256, 512, 1024]
+
+# Number of word images fed to the model in a single session run when recognizing a page.
+INFER_BATCH_SIZE = 64
+
+# Cross-request micro-batching of word images in front of the model (used by the API).
+# A batch is run as soon as it holds SCHEDULER_MAX_BATCH_SIZE words or its oldest word
+# has waited SCHEDULER_MAX_WAIT_MS milliseconds.
+SCHEDULER_ENABLED = True
+SCHEDULER_MAX_BATCH_SIZE = 128
+SCHEDULER_MAX_WAIT_MS = 10
+
+# Size of the thread pool running blocking OCR work (decoding, segmentation, TF and Tesseract)
+# outside of the event loop, and the time after which a request is answered with a timeout.
+INFERENCE_WORKERS = 4
+REQUEST_TIMEOUT_SECONDS = 60
+
+# Page segmentation mode used when Tesseract recognizes a whole page in a single run
+# (3 = fully automatic page segmentation).
+TESSERACT_PAGE_PSM = 3
+
+# Per-crop Tesseract recognition: number of tesseract processes running in parallel, number of
+# word crops stitched into a single tesseract run, and OpenMP threads allowed per process.
+# Keep TESSERACT_WORKERS * TESSERACT_OMP_THREAD_LIMIT at or below the number of cores.
+TESSERACT_WORKERS = max(1, os.cpu_count() or 1)
+TESSERACT_CROPS_PER_CALL = 16
+TESSERACT_OMP_THREAD_LIMIT = 1
+
+# Responses larger than this number of bytes are gzip compressed for clients that accept it.
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+
+# Result cache of whole recognition responses, keyed on the uploaded bytes and request settings.
+# The in-memory tier is an LRU bounded by RESULT_CACHE_MAX_BYTES, the on-disk tier is only
+# used when RESULT_CACHE_DISK_PATH is set (e.g. os.path.join(BASE_PATH, 'cache')).
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+RESULT_CACHE_DISK_PATH = None
+
+# Word level recognition cache in front of the recognizers, keyed by a fingerprint of the
+# preprocessed word image. 'exact' matches identical preprocessed images, 'near' matches images
+# whose downsampled (WORD_CACHE_NEAR_SIZE) binarized fingerprint is identical.
+WORD_CACHE_ENABLED = True
+WORD_CACHE_MODE = 'exact'
+WORD_CACHE_MAX_ENTRIES = 50000
+WORD_CACHE_NEAR_SIZE = (32, 8)
+
+# Multi-page documents (PDF/TIFF): resolution used to rasterize PDF pages, and the maximum number
+# of pages held in the decode -> segment -> recognize pipeline at any time.
+PDF_RENDER_DPI = 300
+MAX_INFLIGHT_PAGES = 3
+DOCUMENT_TIMEOUT_SECONDS = 600
+
+# Bulk OCR jobs: uploads and the SQLite queue are kept under JOBS_PATH so jobs survive restarts.
+# Every worker claims up to JOBS_BATCH_SIZE images at a time and recognizes them together.
+JOBS_PATH = os.path.join(BASE_PATH, 'jobs')
+JOBS_DB_FILE = os.path.join(JOBS_PATH, 'jobs.db')
+JOBS_WORKERS = 1
+JOBS_BATCH_SIZE = 32
+JOBS_POLL_INTERVAL_SECONDS = 1.0
+# A claimed batch belongs to its worker process for JOBS_LEASE_SECONDS after the last heartbeat (renewed
+# every third of it); only then is it queued again for the other workers, e.g. after the process died.
+JOBS_LEASE_SECONDS = 60.0
+
+# Engines loaded (and warmed up) in the background when the API starts; the other engines are
+# loaded on their first request. The CRNN warm-up runs one synthetic batch of each size.
+PRELOAD_ENGINES = ['crnn', 'tesseract']
+WARMUP_BATCH_SIZES = [1, 32, 128]
+
+# Backend running the CRNN: 'session' restores the training checkpoint, 'frozen' loads the frozen,
+# batch-norm folded graph written by `python -m app.models.crnn_ctc_model.Export` and 'tflite' runs
+# the models written by `Export --tflite` on a TFLite CPU interpreter with TFLITE_THREADS threads
+# and 'remote' hands the images to the inference server processes (see INFERENCE_SERVERS).
+# TFLite needs a fixed input width, so one model is converted for each of TFLITE_WIDTHS.
+INFERENCE_BACKEND = 'session'
+TFLITE_THREADS = 4
+TFLITE_WIDTHS = sorted(set([IMAGE_WIDTH] + LINE_WIDTH_BUCKETS))
+
+# Thread budget of every API worker process: MODEL_REPLICAS copies of the CRNN sharing one graph,
+# each with its own session running TF_INTRA_OP_THREADS threads inside an op and TF_INTER_OP_THREADS
+# ops in parallel (TFLITE_THREADS per replica with the tflite backend), plus OPENCV_THREADS for
+# OpenCV (1 = single threaded). A warning is logged at startup when the threads of all uvicorn
+# workers ($WEB_CONCURRENCY) exceed the available cores.
+MODEL_REPLICAS = 1
+TF_INTRA_OP_THREADS = 4
+TF_INTER_OP_THREADS = 2
+OPENCV_THREADS = 1
+
+# Pre-fork serving (`python -m app.prefork`): workers forked by the master process after it imported
+# the application, and the seconds after which the master logs the memory (PSS) of every worker
+# (0 = never). The workers share the imported code only: every worker of the session and frozen
+# backends holds its own copy of the weights, and TFLite shares its mapped model files anyway.
+PREFORK_WORKERS = 2
+PREFORK_MEMORY_REPORT_SECONDS = 120
+
+# Out-of-process inference (INFERENCE_BACKEND = 'remote'): INFERENCE_SERVERS processes started with
+# `python -m app.models.crnn_ctc_model.InferenceServer` run INFERENCE_SERVER_BACKEND. Every server
+# shares a ring of INFERENCE_RING_SLOTS slots (INFERENCE_SLOT_WORDS word images and their NN output
+# each) with the API workers in INFERENCE_SERVER_PATH-<server>.ring, only slot sizes go over its unix
+# socket INFERENCE_SERVER_PATH-<server>.sock. Requests of all workers arriving within
+# INFERENCE_SERVER_MAX_WAIT_MS of each other run as one batch. A slot takes about 1.4 MB, so a ring of
+# the default size (46 MB) fits into the 64 MB /dev/shm of a Docker container. More servers or larger
+# rings need `docker run --shm-size`, the servers refuse to start if /dev/shm is too small for them.
+INFERENCE_SERVERS = 1
+INFERENCE_SERVER_BACKEND = 'session'
+INFERENCE_SERVER_PATH = '/dev/shm/mandoc-ocr-inference'
+INFERENCE_RING_SLOTS = 32
+INFERENCE_SLOT_WORDS = 64
+INFERENCE_SERVER_MAX_WAIT_MS = 2
+
+# Number of test set words joined into one synthetic text line by the line mode evaluation.
+LINE_EVALUATION_WORDS_PER_LINE = 8
+
+# Number of word images used by the inference benchmark (roughly a dense scanned page).
+BENCHMARK_WORDS_PER_PAGE = 300
+
 
 def audit_log(log_str):
     open(fnResult, 'a').write(log_str)
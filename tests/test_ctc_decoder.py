@@ -0,0 +1,101 @@
+import itertools
+import numpy as np
+import pytest
+from app.models.crnn_ctc_model.CTCDecoder import bestPathConfidence, bestPathDecode, charCodeTable, labelsToText, \
+    prefixBeamSearch, prefixBeamSearchSingle, randomLogits
+
+CHAR_LIST = 'abc '
+BLANK = len(CHAR_LIST)
+
+
+def one_hot_logits(label_sequences):
+    """
+    (T, B, C) logits whose best path is the given label sequence of every batch element.
+    """
+    logits = np.zeros((len(label_sequences[0]), len(label_sequences), len(CHAR_LIST) + 1), dtype=np.float32)
+    for b, labels in enumerate(label_sequences):
+        for t, label in enumerate(labels):
+            logits[t, b, label] = 10.0
+    return logits
+
+
+def test_labels_to_text():
+    char_codes = charCodeTable('أب c')
+
+    assert labelsToText(np.array([1, 0, 3], dtype=np.int64), char_codes) == 'بأc'
+    assert labelsToText(np.array([], dtype=np.int64), char_codes) == ''
+
+
+def test_best_path_collapses_repeats_and_removes_blanks():
+    logits = one_hot_logits([
+        [0, 0, 1, 1, 1, 2],  # repeats collapse
+        [0, BLANK, 0, 1, BLANK, BLANK],  # a blank separates a repeated character
+        [BLANK] * 6,  # nothing but blanks
+        [3, 3, BLANK, 3, 0, 0],  # spaces are characters like any other
+    ])
+
+    assert bestPathDecode(logits, charCodeTable(CHAR_LIST)) == ['abc', 'aab', '', '  a']
+
+
+def test_best_path_of_an_empty_batch():
+    logits = np.zeros((6, 0, len(CHAR_LIST) + 1), dtype=np.float32)
+    assert bestPathDecode(logits, charCodeTable(CHAR_LIST)) == []
+
+
+def test_best_path_confidence():
+    logits = one_hot_logits([[0, 0, BLANK, 1], [BLANK] * 4])
+    logits[1, 0, 0] = 5.0  # the second frame of the run is less certain
+
+    (path_probs, labels, char_probs) = bestPathConfidence(logits, BLANK)
+
+    assert [label.tolist() for label in labels] == [[0, 1], []]
+    assert len(char_probs[1]) == 0
+    # a character gets the probability of the best frame of its run
+    frame_prob = np.exp(10.0) / (np.exp(10.0) + len(CHAR_LIST))
+    np.testing.assert_allclose(char_probs[0], [frame_prob, frame_prob], rtol=1e-5)
+    assert path_probs[0] < path_probs[1]
+    np.testing.assert_allclose(path_probs[1], frame_prob ** 4, rtol=1e-5)
+
+
+def test_best_path_matches_tf_greedy_decoder():
+    pytest.importorskip('tensorflow')
+    from app.models.crnn_ctc_model.CTCDecoder import tfGreedyDecoder
+
+    logits = randomLogits(256, len(CHAR_LIST) + 1)
+    texts = bestPathDecode(logits, charCodeTable(CHAR_LIST))
+
+    assert texts == tfGreedyDecoder(CHAR_LIST)(logits)
+
+
+def exhaustive_labeling_probs(probs):
+    """
+    Probability of every labeling of (T, C) probabilities, summed over all of its CTC paths.
+    """
+    blank = probs.shape[1] - 1
+    labelings = {}
+    for path in itertools.product(range(probs.shape[1]), repeat=len(probs)):
+        labeling = tuple(label for (t, label) in enumerate(path)
+                         if label != blank and (t == 0 or label != path[t - 1]))
+        labelings[labeling] = labelings.get(labeling, 0.0) + np.prod(probs[np.arange(len(path)), path])
+    return labelings
+
+
+def test_prefix_beam_search_finds_the_most_probable_labeling():
+    random_state = np.random.RandomState(3)
+    for _ in range(150):
+        (time_steps, num_labels) = (random_state.randint(1, 6), random_state.randint(2, 4))
+        logits = random_state.randn(time_steps, num_labels) * 2
+        probs = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+
+        labelings = exhaustive_labeling_probs(probs)
+        best = max(labelings, key=labelings.get)
+
+        # a beam wide enough for every prefix and no pruning make the search exact
+        assert prefixBeamSearchSingle(probs, len(labelings) + 1, 0.0) == best
+
+
+def test_prefix_beam_search_of_width_one_is_best_path_on_peaked_logits():
+    logits = randomLogits(32, len(CHAR_LIST) + 1) * 4
+    char_codes = charCodeTable(CHAR_LIST)
+
+    assert prefixBeamSearch(logits, char_codes, 1) == bestPathDecode(logits, char_codes)
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from app.models.crnn_ctc_model.FoldedCNN import BATCH_NORM_EPSILON, CNN_KERNELS, CNN_NORMS, CNN_POOLS, \
+    foldBatchNorm, foldedCNNLayers
+from config import config
+
+
+def random_batch_norm(random_state, channels):
+    return {
+        'gamma': random_state.uniform(0.5, 2.0, channels),
+        'beta': random_state.randn(channels),
+        'moving_mean': random_state.randn(channels),
+        'moving_variance': random_state.uniform(0.1, 3.0, channels),
+    }
+
+
+def test_fold_batch_norm_matches_conv_then_batch_norm():
+    random_state = np.random.RandomState(0)
+    kernel = random_state.randn(5, 5, 3, 8)
+    norm = random_batch_norm(random_state, 8)
+    patches = random_state.randn(10, 5, 5, 3)  # receptive fields of 10 output pixels
+
+    # convolution of every patch, then the inference batch normalization
+    conv = np.einsum('nhwi,hwio->no', patches, kernel)
+    expected = norm['gamma'] * (conv - norm['moving_mean']) / np.sqrt(norm['moving_variance'] + BATCH_NORM_EPSILON) \
+        + norm['beta']
+
+    (folded_kernel, bias) = foldBatchNorm(kernel, norm['gamma'], norm['beta'], norm['moving_mean'],
+                                          norm['moving_variance'])
+    folded = np.einsum('nhwi,hwio->no', patches, folded_kernel) + bias
+
+    assert folded_kernel.dtype == np.float32 and bias.dtype == np.float32
+    np.testing.assert_allclose(folded, expected, rtol=1e-4, atol=1e-4)
+
+
+def test_folded_cnn_layers_pairs_every_kernel_with_its_batch_norm():
+    random_state = np.random.RandomState(1)
+    weights = {}
+    for (i, (kernel_name, norm_name)) in enumerate(zip(CNN_KERNELS, CNN_NORMS)):
+        weights[kernel_name] = random_state.randn(3, 3, 2, i + 1)
+        for (field, value) in random_batch_norm(random_state, i + 1).items():
+            weights[norm_name + '/' + field + ':0'] = value
+
+    layers = foldedCNNLayers(weights)
+
+    assert [pool for (_, _, pool) in layers] == CNN_POOLS
+    for ((kernel, bias, _), kernel_name, norm_name) in zip(layers, CNN_KERNELS, CNN_NORMS):
+        (expected_kernel, expected_bias) = foldBatchNorm(
+            weights[kernel_name], *[weights[norm_name + '/' + field + ':0']
+                                    for field in ('gamma', 'beta', 'moving_mean', 'moving_variance')])
+        np.testing.assert_array_equal(kernel, expected_kernel)
+        np.testing.assert_array_equal(bias, expected_bias)
+
+
+def test_frozen_graph_matches_model_logits(tmp_path, monkeypatch):
+    tf = pytest.importorskip('tensorflow')
+    from app.models.crnn_ctc_model.Export import buildFrozenGraph, readWeights
+    from app.models.crnn_ctc_model.Model import Model
+
+    # no checkpoint: a freshly initialized model, with non-trivial batch norm statistics
+    monkeypatch.setattr(config, 'MODEL_PATH', str(tmp_path))
+    random_state = np.random.RandomState(2)
+    with tf.Graph().as_default():
+        model = Model(config.DecoderType.BestPath, inferenceOnly=True)
+        for variable in tf.global_variables():
+            if 'moving_variance' in variable.name or 'gamma' in variable.name:
+                variable.load(random_state.uniform(0.5, 2.0, variable.shape), model.sess)
+            elif 'moving_mean' in variable.name or 'beta' in variable.name:
+                variable.load(random_state.randn(*variable.shape) * 0.1, model.sess)
+        weights = readWeights(model)
+
+        imgs = random_state.uniform(-1, 1, (4, config.IMAGE_WIDTH, config.IMAGE_HEIGHT)).astype(np.float32)
+        logits = model.sess.run(model.ctcIn3dTBC, {model.inputImgs: imgs})
+
+    graph_def = buildFrozenGraph(weights, model.charList)
+    with tf.Graph().as_default() as graph:
+        (input_imgs, rnn_out) = tf.import_graph_def(graph_def, return_elements=['inputImgs:0', 'rnnOut3d:0'], name='')
+        with tf.Session(graph=graph) as sess:
+            frozen_logits = sess.run(rnn_out, {input_imgs: imgs})
+
+    # the frozen graph keeps the BxTxC layout of rnnOut3d
+    np.testing.assert_allclose(np.transpose(frozen_logits, (1, 0, 2)), logits, rtol=1e-3, atol=1e-3)
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from app.utils.imageEncoding import check_image_quality, encode_image
+
+
+def test_png_quality_is_a_compression_level():
+    check_image_quality("png", 9)
+    check_image_quality("jpeg", 80)
+    check_image_quality("webp", None)
+    with pytest.raises(ValueError, match="between 0 and 9"):
+        check_image_quality("png", 80)
+    with pytest.raises(ValueError):
+        encode_image(np.full((8, 8), 255, dtype=np.uint8), "png", 10)
+
+
+@pytest.mark.parametrize('endpoint', ['/api/v1/crnn/chunks', '/api/v1/tesseract/chunks'])
+def test_out_of_range_png_quality_is_rejected(endpoint):
+    pytest.importorskip('fastapi')
+    pytest.importorskip('httpx')
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    # rejected before the image is read or an engine is loaded
+    response = TestClient(app).post(endpoint + '?include_images=true&image_format=png&image_quality=80',
+                                    files={'image': ('page.png', b'not an image', 'image/png')})
+
+    assert response.status_code == 422
+    assert "between 0 and 9" in response.json()["detail"]
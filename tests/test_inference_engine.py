@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from config import config
+
+tf = pytest.importorskip('tensorflow')
+
+
+def rnn_variable_names(unrolled):
+    from app.models.crnn_ctc_model.Model import Model
+
+    with tf.Graph().as_default():
+        cnn_out = tf.placeholder(tf.float32, (None, config.MAX_TEXT_LENGTH, 1, 256))
+        layers = SimpleNamespace(cnnOut4d=cnn_out, charList='abc', unrolledRNN=unrolled)
+        Model.setupRNN(layers)
+        return [(variable.name, variable.shape.as_list()) for variable in tf.global_variables()]
+
+
+def test_unrolled_rnn_keeps_the_checkpoint_variable_names():
+    assert rnn_variable_names(unrolled=True) == rnn_variable_names(unrolled=False)
+
+
+def test_tflite_engine_matches_session_engine(tmp_path, monkeypatch):
+    from app.models.crnn_ctc_model.Export import buildTFLiteModel, readWeights
+    from app.models.crnn_ctc_model.InferenceEngine import SessionEngine, TFLiteEngine, randomBatch
+    from app.models.crnn_ctc_model.Model import Model
+
+    # no checkpoint: a freshly initialized model
+    monkeypatch.setattr(config, 'MODEL_PATH', str(tmp_path))
+    with tf.Graph().as_default():
+        model = Model(config.DecoderType.BestPath, inferenceOnly=True)
+        weights = readWeights(model)
+
+    # the word width and one line width bucket
+    widths = [config.IMAGE_WIDTH, config.LINE_WIDTH_BUCKETS[1]]
+    fn_model = str(tmp_path / 'crnn_{}.tflite')
+    for width in widths:
+        with open(fn_model.format(width), 'wb') as f:
+            f.write(buildTFLiteModel(weights, model.charList, width))
+
+    session_engine = SessionEngine(model)
+    tflite_engine = TFLiteEngine(widths, fn_model, numThreads=2)
+    for width in widths:
+        for batch_size in (1, 5):
+            imgs = randomBatch(batch_size, width)
+            np.testing.assert_allclose(tflite_engine.computeLogits(imgs), session_engine.computeLogits(imgs),
+                                       rtol=1e-3, atol=1e-3)
@@ -0,0 +1,95 @@
+import os
+import socket
+import threading
+import numpy as np
+import pytest
+from app.models.crnn_ctc_model.InferenceServer import RingBuffer, checkSharedMemory, ringBytes
+from config import config
+
+NUM_CHARS = 47
+
+
+def test_ring_file_is_allocated_up_front(tmp_path):
+    fn_ring = str(tmp_path / 'test.ring')
+    ring = RingBuffer(fn_ring, NUM_CHARS, numSlots=2, create=True)
+
+    assert os.path.getsize(fn_ring) == 2 * ring.slotBytes == ringBytes(NUM_CHARS, 2)
+    # the pages exist, writing the last slot cannot fail later
+    assert os.stat(fn_ring).st_blocks * 512 >= 2 * ring.slotBytes
+
+
+def test_default_ring_fits_into_the_docker_shared_memory():
+    assert ringBytes(NUM_CHARS) <= 64 * 2 ** 20
+
+
+def test_check_shared_memory_refuses_rings_that_do_not_fit(tmp_path):
+    path = str(tmp_path / 'inference')
+    checkSharedMemory(NUM_CHARS, 1, path)
+    with pytest.raises(Exception, match='--shm-size'):
+        checkSharedMemory(NUM_CHARS, 10 ** 4, path)
+
+
+def test_a_slot_holds_a_line_of_every_width(tmp_path):
+    ring = RingBuffer(str(tmp_path / 'test.ring'), NUM_CHARS, numSlots=1, create=True)
+
+    assert all(ring.maxBatchSize(width) >= 1 for width in config.LINE_WIDTH_BUCKETS)
+
+
+@pytest.fixture
+def server_paths(tmp_path, monkeypatch):
+    from app.models.crnn_ctc_model import InferenceServer
+
+    paths = lambda server: (str(tmp_path / '{}.ring'.format(server)), str(tmp_path / '{}.sock'.format(server)))
+    monkeypatch.setattr(InferenceServer, 'serverPaths', paths)
+    return paths
+
+
+def test_ring_buffer_engine_round_trip(server_paths):
+    from app.models.crnn_ctc_model.InferenceServer import InferenceServer, RingBufferEngine
+
+    engine = RingBufferEngine(numServers=1)
+
+    class TimeStepsEngine:
+        "NN output of width // 4 time steps whose logits are the mean of each image"
+
+        def computeLogits(self, imgs):
+            return np.broadcast_to(imgs.mean(axis=(1, 2))[None, :, None],
+                                   (imgs.shape[1] // 4, len(imgs), engine.numChars)).astype(np.float32)
+
+    server = InferenceServer(TimeStepsEngine(), engine.numChars, maxWaitMs=0)
+    threading.Thread(target=server.run, daemon=True).start()
+
+    imgs = np.random.RandomState(0).rand(3, config.LINE_WIDTH_BUCKETS[1], config.IMAGE_HEIGHT).astype(np.float32)
+    logits = engine.computeLogits(imgs)
+
+    assert logits.shape == (config.LINE_WIDTH_BUCKETS[1] // 4, 3, engine.numChars)
+    np.testing.assert_allclose(logits[0, :, 0], imgs.mean(axis=(1, 2)), rtol=1e-6)
+
+
+def test_ring_buffer_engine_times_out_and_reconnects(server_paths, monkeypatch):
+    from app.models.crnn_ctc_model.InferenceServer import SLOT_MESSAGE, RingBuffer, RingBufferEngine
+
+    # a server that hands out a slot but never answers a request
+    engine = RingBufferEngine(numServers=1)
+    (fn_ring, fn_socket) = server_paths(0)
+    RingBuffer(fn_ring, engine.numChars, create=True)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(fn_socket)
+    listener.listen(1)
+    accepted = []
+
+    def accept():
+        (conn, _) = listener.accept()
+        accepted.append(conn)
+        conn.sendall(SLOT_MESSAGE.pack(0))
+
+    threading.Thread(target=accept, daemon=True).start()
+    monkeypatch.setattr(config, 'REQUEST_TIMEOUT_SECONDS', 0.2)
+
+    imgs = np.zeros((1, config.IMAGE_WIDTH, config.IMAGE_HEIGHT), dtype=np.float32)
+    with pytest.raises(socket.timeout):
+        engine.computeLogits(imgs)
+
+    # the next call connects again
+    assert engine.local.conn is None
+    listener.close()
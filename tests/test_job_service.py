@@ -0,0 +1,83 @@
+import io
+import time
+from app.services.jobService import JobStore
+
+
+def stores(tmp_path, lease_seconds=60.0):
+    """
+    Two stores on the same database, like the job workers of two server processes.
+    """
+    return [JobStore(str(tmp_path / 'jobs.db'), str(tmp_path), lease_seconds) for _ in range(2)]
+
+
+def uploads(count):
+    return [(f"{idx}.png", io.BytesIO(b"image")) for idx in range(count)]
+
+
+def test_starting_worker_leaves_running_items_alone(tmp_path):
+    (first, _) = stores(tmp_path)
+    job_id = first.create_job("crnn", uploads(3))
+    (_, _, items) = first.claim_batch(2)
+
+    # a worker process starting (or being respawned) later
+    starting = JobStore(str(tmp_path / 'jobs.db'), str(tmp_path))
+    (_, _, others) = starting.claim_batch(10)
+
+    assert [item["idx"] for item in others] == [2]
+    assert first.complete_batch(job_id, [(item["idx"], [], None) for item in items]) == [0, 1]
+    starting.complete_batch(job_id, [(2, [], None)])
+    job = first.get_job(job_id)
+    assert (job["status"], job["done"], job["progress"]) == ("done", 3, 1.0)
+
+
+def test_expired_lease_is_requeued_and_not_counted_twice(tmp_path):
+    (first, second) = stores(tmp_path, lease_seconds=0.05)
+    job_id = first.create_job("crnn", uploads(2))
+    (_, _, items) = first.claim_batch(2)
+
+    time.sleep(0.1)
+    (_, _, taken_over) = second.claim_batch(2)
+    assert [item["idx"] for item in taken_over] == [0, 1]
+
+    # the first worker finishes late, its outcomes no longer count
+    assert first.complete_batch(job_id, [(item["idx"], [], None) for item in items]) == []
+    assert second.complete_batch(job_id, [(0, [], None), (1, None, "unreadable")]) == [0, 1]
+
+    job = first.get_job(job_id)
+    assert (job["done"], job["failed"], job["progress"]) == (1, 1, 1.0)
+    assert [item["status"] for item in first.get_results(job_id)] == ["done", "failed"]
+
+
+def test_renewed_claims_are_not_requeued(tmp_path):
+    (first, second) = stores(tmp_path, lease_seconds=0.5)
+    first.create_job("crnn", uploads(1))
+    first.claim_batch(1)
+
+    time.sleep(0.35)
+    first.renew_claims()
+    time.sleep(0.3)
+
+    assert second.claim_batch(1)[2] == []
+
+
+def test_tesseract_jobs_are_recognized_as_one_batch(tmp_path):
+    from app.services.jobService import JobManager
+
+    class BatchOnlyService:
+        def __init__(self):
+            self.batches = []
+
+        def recognize_images(self, files_contents):
+            self.batches.append(len(files_contents))
+            return [[{"text": "word"}] for _ in files_contents]
+
+    service = BatchOnlyService()
+    (store, _) = stores(tmp_path)
+    store.create_job("tesseract", uploads(3))
+    (_, engine, items) = store.claim_batch(10)
+
+    manager = JobManager(None, lambda: service, store)
+    outcomes = manager._process(engine, items)
+
+    assert service.batches == [3]
+    assert [(idx, error) for idx, _, error in outcomes] == [(0, None), (1, None), (2, None)]
@@ -0,0 +1,62 @@
+import numpy as np
+from app.models.crnn_ctc_model.CTCDecoder import reverseWordOrder
+from app.utils.sample_preprocessing import preprocess_line
+from app.utils.segmentImage import segment_lines, segment_words
+from config import config
+
+
+def synthetic_page():
+    """
+    White page with two text lines of three dark "words" each.
+    """
+    img = np.full((200, 600), 255, dtype=np.uint8)
+    for top in (30, 120):
+        for left in (40, 230, 420):
+            img[top:top + 30, left:left + 140] = 0
+    return img
+
+
+def test_segment_lines_finds_rows_top_to_bottom():
+    lines = segment_lines(synthetic_page())
+
+    assert [line["row"] for line in lines] == [0, 1]
+    assert lines[0]["box"][1] < lines[1]["box"][1]
+    for line in lines:
+        x, y, w, h = line["box"]
+        # one box covers all three words of the row
+        assert x <= 40 and x + w >= 560
+        assert line["image"].shape == (h + 16, w + 16)
+
+
+def test_segment_words_orders_each_row_right_to_left():
+    words = segment_words(synthetic_page())
+
+    assert len(words) == 6
+    first_row = [word["box"][0] for word in words if word["row"] == 0]
+    assert first_row == sorted(first_row, reverse=True)
+
+
+def test_preprocess_line_pads_to_width_bucket():
+    line = segment_lines(synthetic_page())[0]["image"]
+    img = preprocess_line(line)
+
+    # the line is scaled to the model height and padded to the next width bucket
+    scaled_width = line.shape[1] * config.IMAGE_HEIGHT / line.shape[0]
+    bucket = next(width for width in config.LINE_WIDTH_BUCKETS if width >= scaled_width)
+    assert img.shape == (bucket, config.IMAGE_HEIGHT)
+    assert abs(float(img.mean())) < 1e-6
+    assert abs(float(img.std()) - 1.0) < 1e-3
+
+
+def test_preprocess_line_shrinks_lines_wider_than_the_widest_bucket():
+    img = preprocess_line(np.full((32, 4000), 255, dtype=np.uint8))
+    assert img.shape == (config.LINE_WIDTH_BUCKETS[-1], config.IMAGE_HEIGHT)
+
+
+def test_line_text_is_put_into_reading_order():
+    # the NN reads the leftmost, i.e. last, word of a line first
+    (text, char_probs) = reverseWordOrder("ccc bb a", np.arange(8.0))
+
+    assert text == "a bb ccc"
+    assert char_probs.tolist() == [7.0, 6.0, 4.0, 5.0, 3.0, 0.0, 1.0, 2.0]
+    assert reverseWordOrder("", None) == ("", None)
@@ -0,0 +1,46 @@
+import asyncio
+from app.services.pagePipeline import collect_pages, process_pages
+
+
+def test_cancelling_collect_pages_stops_the_stages():
+    recognized_pages = []
+
+    async def recognize(words):
+        recognized_pages.append(words)
+        await asyncio.sleep(0.05)
+        return words
+
+    async def main():
+        pages = iter(range(100))
+        collection = asyncio.ensure_future(collect_pages(process_pages(pages, lambda page: [page], recognize)))
+
+        # cancel mid-document, like a request timeout or a client disconnect
+        while len(recognized_pages) < 2:
+            await asyncio.sleep(0.01)
+        collection.cancel()
+        try:
+            await collection
+        except asyncio.CancelledError:
+            pass
+
+        # give the stages the chance to finish their cancellation (or to keep on working)
+        await asyncio.sleep(0.2)
+        current = asyncio.current_task() if hasattr(asyncio, 'current_task') else asyncio.Task.current_task()
+        all_tasks = asyncio.all_tasks() if hasattr(asyncio, 'all_tasks') else asyncio.Task.all_tasks()
+        return [task for task in all_tasks if task is not current and not task.done()]
+
+    pending = asyncio.run(main())
+
+    assert pending == []
+    # the pipeline holds at most MAX_INFLIGHT_PAGES pages, nothing was recognized after the cancellation
+    assert len(recognized_pages) <= 3
+
+
+def test_collect_pages_returns_pages_in_order():
+    async def recognize(words):
+        await asyncio.sleep(0)
+        return [word * 10 for word in words]
+
+    pages = asyncio.run(collect_pages(process_pages(iter(range(5)), lambda page: [page], recognize)))
+
+    assert pages == [(1, [0]), (2, [10]), (3, [20]), (4, [30]), (5, [40])]
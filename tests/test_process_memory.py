@@ -0,0 +1,26 @@
+import os
+from app.utils.processMemory import children, memory_usage, report
+
+
+def test_memory_usage_of_this_process():
+    usage = memory_usage()
+
+    assert usage is not None
+    assert 0 < usage["pss_mb"] <= usage["rss_mb"]
+
+
+def test_report_skips_processes_that_are_gone(capsys):
+    # pid_max never exceeds 2^22, so this process cannot exist
+    missing = 2 ** 22 + 1
+
+    assert memory_usage(missing) is None
+    total = report([os.getpid(), missing])
+
+    output = capsys.readouterr().out
+    assert f"pid {missing}: no memory information" in output
+    assert "total PSS of 1 process(es)" in output
+    assert total > 0
+
+
+def test_children_of_a_process_that_is_gone():
+    assert children(2 ** 22 + 1) == []
@@ -0,0 +1,31 @@
+from app.services import replicaPool
+from config import config
+
+
+def test_thread_budget_counts_the_tesseract_processes(monkeypatch):
+    monkeypatch.setattr(config, 'INFERENCE_BACKEND', 'session')
+    monkeypatch.setattr(config, 'MODEL_REPLICAS', 1)
+    monkeypatch.setattr(config, 'TF_INTRA_OP_THREADS', 2)
+    monkeypatch.setattr(config, 'TF_INTER_OP_THREADS', 1)
+    monkeypatch.setattr(config, 'OPENCV_THREADS', 1)
+    monkeypatch.setattr(config, 'TESSERACT_WORKERS', 4)
+    monkeypatch.setattr(config, 'TESSERACT_OMP_THREAD_LIMIT', 2)
+    monkeypatch.setenv('WEB_CONCURRENCY', '2')
+
+    monkeypatch.setattr(config, 'PRELOAD_ENGINES', ['crnn', 'tesseract'])
+    budget = replicaPool.thread_budget()
+    assert (budget["threads_per_worker"], budget["total_threads"]) == (2 + 1 + 1 + 4 * 2, 24)
+
+    monkeypatch.setattr(config, 'PRELOAD_ENGINES', ['crnn'])
+    assert replicaPool.thread_budget()["threads_per_worker"] == 4
+
+
+def test_oversubscribed_cores_are_reported(monkeypatch, capsys):
+    monkeypatch.setattr(config, 'PRELOAD_ENGINES', ['crnn', 'tesseract'])
+    monkeypatch.setattr(config, 'TESSERACT_WORKERS', 8)
+    monkeypatch.setattr(replicaPool, 'available_cores', lambda: 8)
+    monkeypatch.setenv('WEB_CONCURRENCY', '2')
+
+    replicaPool.apply_thread_budget()
+
+    assert "TESSERACT_WORKERS" in capsys.readouterr().out
@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+
+pytest.importorskip('fastapi')
+
+
+def multipart_upload(field, filename, contents, boundary='mandoc-test-boundary'):
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: image/png\r\n\r\n').encode() + contents + f'\r\n--{boundary}--\r\n'.encode()
+    return (body, f'multipart/form-data; boundary={boundary}')
+
+
+class SlowService:
+    """
+    Stands in for the CRNN service: the last row is only recognized once the client got the first frame.
+    """
+
+    def __init__(self, first_frame, events):
+        self.first_frame = first_frame
+        self.events = events
+
+    async def stream_image(self, contents, image_format=None, image_quality=None, decoding=None):
+        yield [{"text": "first", "order": 0}]
+        try:
+            await asyncio.wait_for(self.first_frame.wait(), 2)
+        except asyncio.TimeoutError:
+            pass
+        self.events.append("last word recognized")
+        yield [{"text": "last", "order": 1}]
+
+
+@pytest.mark.parametrize('stream_format', ['ndjson', 'sse'])
+def test_first_frame_arrives_before_the_last_word_with_gzip(monkeypatch, stream_format):
+    from app.main import app
+    from app.services import engines
+
+    (body, content_type) = multipart_upload('image', 'page.png', b'not decoded by the stand-in service')
+    events = []
+    response_headers = {}
+
+    async def run():
+        first_frame = asyncio.Event()
+        monkeypatch.setitem(engines._services, 'crnn', SlowService(first_frame, events))
+        requests = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            if requests:
+                return requests.pop(0)
+            # the client stays connected
+            await asyncio.sleep(10)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response_headers.update((k.decode(), v.decode()) for (k, v) in message["headers"])
+            elif message["type"] == "http.response.body" and message.get("body") and not first_frame.is_set():
+                events.append("first frame sent")
+                first_frame.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+            "path": "/api/v1/crnn/chunks/stream", "raw_path": b"/api/v1/crnn/chunks/stream", "root_path": "",
+            "query_string": f"format={stream_format}".encode(), "server": ("testserver", 80),
+            "client": ("testclient", 50000),
+            "headers": [(b"host", b"testserver"), (b"accept-encoding", b"gzip, deflate"),
+                        (b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())],
+        }
+        await asyncio.wait_for(app(scope, receive, send), 5)
+
+    asyncio.run(run())
+
+    assert response_headers.get("content-encoding") != "gzip"
+    assert events == ["first frame sent", "last word recognized"]